@@ -1,5 +1,7 @@
 
 class Block:
+    __slots__ = ('pc', 'start', 'end', 'pre', 'next', 'opcodes')
+
     def __init__(self):
         # pc in int
         self.pc = None
@@ -1,3 +1,5 @@
+import bisect
+
 from web3 import Web3
 from solc import compile_standard
 from slither.core.declarations.contract import Contract as Slither_Contract
@@ -25,6 +27,11 @@ def increase_indentation(s: str):
     return '\t' + '\t'.join(s.splitlines(True))
 
 
+# slither's dummy functions holding state variable declarations, which have no
+# source of their own.
+DUMMY_FUNCTIONS = ['slitherConstructorVariables', 'slitherConstructorConstantVariables']
+
+
 def set_function_edges(left, right):
     if left.original_function == right.original_function \
             and left.original_function:
@@ -115,6 +122,19 @@ class Contract:
         self.has_callcode = False
         self.has_suicide = False
 
+        # whether functions, modifiers and state variables have been built.
+        self._model_loaded = False
+
+        # whether the dependencies between functions have been built.
+        self._dependencies_loaded = False
+
+        # list of functions, built on first use and dropped when functions change.
+        self._functions_list = None
+
+        # functions keyed by name, full name, sig hash and source offset,
+        # built on first lookup and dropped when functions change.
+        self._function_index = None
+
         self._setter(contract)
 
     @property
@@ -123,14 +143,22 @@ class Contract:
 
     @property
     def functions(self):
-        return list(self._functions.values())
+        """
+        The list is shared between calls, and should not be modified.
+        """
+        self._load_model()
+        if self._functions_list is None:
+            self._functions_list = list(self._functions.values())
+        return self._functions_list
 
     @property
     def total_functions(self):
+        self._load_model()
         return len(self._functions)
 
     @property
     def functions_dic(self):
+        self._load_model()
         return self._functions
 
     @property
@@ -143,6 +171,7 @@ class Contract:
 
     @property
     def constructor(self):
+        self._load_model()
         return self._constructor
 
     @property
@@ -153,22 +182,27 @@ class Contract:
 
     @property
     def state_variables(self):
+        self._load_model()
         return list(self._state_variables.values())
 
     @property
     def state_variables_dic(self):
+        self._load_model()
         return self._state_variables
 
     @property
     def modifiers(self):
+        self._load_model()
         return list(self._modifiers.values())
 
     @property
     def modifiers_dic(self):
+        self._load_model()
         return self._modifiers
 
     @property
     def default_satisfied_functions(self):
+        self._load_model()
         return list(self._default_satisfied_functions)
 
     @property
@@ -511,9 +545,41 @@ class Contract:
         self._default_satisfied_functions.add(function)
 
     def _setter(self, contract: Slither_Contract):
+        """
+        Only the name and the slither contract are set here. The functions,
+        modifiers and state variables are built the first time any of them is
+        needed, by _load_model, and the dependencies between functions the
+        first time any function's dependencies are needed.
+        """
         self._name = contract.name
         self._slither_contract = contract
 
+    def _load_model(self):
+        """
+        Builds the modifier, constructor and function objects of the contract,
+        and with them its state variables, if they have not been built yet.
+        """
+        if self._model_loaded:
+            return
+        # set first, since building functions reads back through the properties.
+        self._model_loaded = True
+        try:
+            self._build_model(self._slither_contract)
+        except BaseException:
+            # leave nothing half built behind, so the next read fails again.
+            self._functions = {}
+            self._constructor = None
+            self._state_variables = {}
+            self._modifiers = {}
+            self._default_satisfied_functions = set()
+            self.invalidate_function_index()
+            self._model_loaded = False
+            raise
+
+    def _build_model(self, contract: Slither_Contract):
+        """
+        Builds the model of the given slither contract, for _load_model.
+        """
         # create modifier objects.
         for modifier in contract.modifiers:
             self._create_modifier(modifier)
@@ -542,10 +608,25 @@ class Contract:
         for function_tuple in contract.all_library_calls:
             self._create_function(function_tuple[1])
 
-        self._construct_dependency()
+    def load_dependencies(self):
+        """
+        Builds the dependencies between the functions of the contract,
+        if they have not been built yet.
+        """
+        if self._dependencies_loaded:
+            return
+        self._load_model()
+        self._dependencies_loaded = True
+        try:
+            self._construct_dependency()
+        except BaseException:
+            for f in self.functions:
+                f._depends_on.clear()
+            self._dependencies_loaded = False
+            raise
 
     def _construct_dependency(self):
-        ignored_functions = ['slitherConstructorVariables', 'slitherConstructorConstantVariables']
+        ignored_functions = DUMMY_FUNCTIONS
         for f in self.functions:  # don't need constructor here, because constructors don't depend on anything.
             if f.name in ignored_functions or not f.is_public_or_external:
                 continue
@@ -556,6 +637,51 @@ class Contract:
                     if f.name != written_f.name and written_f.name not in ignored_functions and written_f.is_public_or_external:
                         f.add_depends_on((written_f, sr))
 
+    def invalidate_function_index(self):
+        """
+        Drops the function list and lookup indexes, to be rebuilt on next use.
+        Must be called whenever a function is added, or its name or sig hash changes.
+        """
+        self._functions_list = None
+        self._function_index = None
+
+    def _index_functions(self):
+        """
+        Builds the function lookup indexes. Where several functions share a
+        key, the first in order of the functions list is kept, as a scan
+        over the list would find.
+        """
+        if self._function_index is not None:
+            return self._function_index
+
+        by_name, by_full_name, by_sig_hash = {}, {}, {}
+        spans = []
+        for i, f in enumerate(self.functions):
+            by_name.setdefault(f.name, f)
+            by_full_name.setdefault(f.full_name, f)
+            by_sig_hash.setdefault(f.sig_hash, f)
+            if f.name not in DUMMY_FUNCTIONS:
+                start = f.slither_function.source_mapping['start']
+                end = start + f.slither_function.source_mapping['length']
+                spans.append((start, end, i, f))
+
+        # source spans in order of start, with the greatest end of any span
+        # up to each one, so a lookup can stop once no earlier span reaches far enough.
+        spans.sort(key=lambda span: span[:3])
+        max_ends = []
+        for _, end, _, _ in spans:
+            max_ends.append(max(end, max_ends[-1]) if max_ends else end)
+
+        self._function_index = {
+            'name': by_name,
+            'full_name': by_full_name,
+            'sig_hash': by_sig_hash,
+            'starts': [span[0] for span in spans],
+            'spans': spans,
+            'max_ends': max_ends,
+        }
+        return self._function_index
+
     def get_function_by_name(self, name):
         """
         ****Deprecated
@@ -565,31 +691,31 @@ class Contract:
 
         Finished.
         """
-        for f in self.functions:
-            if f.name == name:
-                return f
+        return self._index_functions()['name'].get(name)
 
     def get_function_by_full_name(self, name):
-        for f in self.functions:
-            if f.full_name == name:
-                return f
+        return self._index_functions()['full_name'].get(name)
 
     def get_function_by_source_map(self, offset, length):
-        for function in self.functions:
-            if function.name in ['slitherConstructorVariables', 'slitherConstructorConstantVariables']:
-                continue
-            f_start = function.slither_function.source_mapping['start']
-            f_length = function.slither_function.source_mapping['length']
-            f_end = f_start + f_length
-            end = offset + length
-            if f_start <= offset \
-                    and f_end >= end:
-                return function
+        """
+        Returns the first function whose source contains the given range,
+        or None if there is none.
+        """
+        index = self._index_functions()
+        spans, max_ends = index['spans'], index['max_ends']
+        end = offset + length
+
+        res = None
+        i = bisect.bisect_right(index['starts'], offset) - 1
+        while i >= 0 and max_ends[i] >= end:
+            _, f_end, order, function = spans[i]
+            if f_end >= end and (res is None or order < res[0]):
+                res = (order, function)
+            i -= 1
+        return res[1] if res else None
 
     def get_function_by_sig_hash(self, sig_hash: str) -> Function:
-        for f in self.functions:
-            if f.sig_hash == sig_hash:
-                return f
+        return self._index_functions()['sig_hash'].get(sig_hash)
 
     def get_modifier_by_name(self, name: str) -> Modifier:
         """
@@ -599,6 +725,7 @@ class Contract:
 
         Finished.
         """
+        self._load_model()
         return self._modifiers.get(name)
 
     def get_state_variable_by_name(self, name: str) -> StateVariable:
@@ -609,6 +736,7 @@ class Contract:
 
         Finished.
         """
+        self._load_model()
         return self._state_variables.get(name)
 
     def _create_constructor(self, contract: Slither_Contract):
@@ -645,6 +773,7 @@ class Contract:
         if function.is_shadowed or function.is_constructor:
             return
         self._functions[function.canonical_name] = Function(function, self)
+        self.invalidate_function_index()
 
         # create function objects for library functions.
         # if function.library_calls:
@@ -685,6 +814,7 @@ class Contract:
         Finished.
         """
 
+        self._load_model()
         res = list()
         res.append(f'Contract Name: {self._name}')
 
@@ -156,10 +156,12 @@ class Function(FunctionCall):
 
     @property
     def depends_on(self):
+        # dependencies are only built once some function's are needed.
+        self._parent_contract.load_dependencies()
         return self._depends_on
 
     def add_depends_on(self, function):
-        self._depends_on.add(function)
+        self.depends_on.add(function)
 
     def remove_depends_on(self, function):
         dependencies = []
@@ -218,6 +220,7 @@ class Function(FunctionCall):
 
     def load_sig_hash(self, sig_hash):
         self._sig_hash = sig_hash
+        self._parent_contract.invalidate_function_index()
 
     @property
     def state_test_cases(self):
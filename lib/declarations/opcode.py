@@ -1,4 +1,7 @@
 class Opcode:
+    __slots__ = ('pc', 'opcode', 'size', 'value', 'original_function', 'source_map',
+                 'source_code', 'pre', 'next', 'block')
+
     def __init__(self):
         self.pc = None
         self.opcode = None
@@ -4,25 +4,38 @@ from os.path import abspath, dirname, join
 src_path = join(dirname(abspath(__file__)), "..")
 sys.path.insert(0, src_path)
 
+import src.cache as cache
 import src.exporter as exporter
-import src.dataflow as dataflow
-import src.tac_cfg as tac_cfg
 import src.settings as settings
 
 
 # import logging
 
+_caches = {}
+"""GraphCaches already opened by vandal_cfg, by directory."""
 
-def vandal_cfg(input):
+
+def vandal_cfg(input, cache_dir: str = None):
+    """
+    Decompile and analyse the given bytecode, returning its string export.
+
+    Args:
+      input: EVM bytecode, as a hex string, bytes, or lines of hex.
+      cache_dir: if given, look up and store analysed graphs in a
+        persistent cache in this directory.
+    """
     # logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
     # logging.getLogger().setLevel(logging.INFO)
     # logging.info("asd")
     settings.import_config(settings._CONFIG_LOC_)
-    cfg = tac_cfg.TACGraph.from_bytecode(input)
 
-    settings.import_config(settings._CONFIG_LOC_)
+    graph_cache = None
+    if cache_dir is not None:
+        if cache_dir not in _caches:
+            _caches[cache_dir] = cache.GraphCache(cache_dir)
+        graph_cache = _caches[cache_dir]
 
-    dataflow.analyse_graph(cfg)
+    cfg, _ = cache.analyse_bytecode(input, graph_cache)
 
     res = exporter.CFGStringExporter(cfg).export()
     return res
@@ -30,11 +30,13 @@
 """blockparse.py: Parse operation sequences and construct basic blocks"""
 
 import abc
+import array
 import logging
 import typing as t
 
 import src.cfg as cfg
 import src.evm_cfg as evm_cfg
+import src.normalise as normalise
 import src.opcodes as opcodes
 import src.settings as settings
 
@@ -157,6 +159,8 @@ class EVMBytecodeParser(BlockParser):
         Args:
           bytecode: EVM bytecode, either as a hexadecimal string or a bytes
             object. If given as a hex string, it may optionally start with 0x.
+            If the strip_metadata setting is enabled, any compiler metadata
+            trailer is removed.
         """
         super().__init__(bytecode)
 
@@ -165,18 +169,71 @@ class EVMBytecodeParser(BlockParser):
         else:
             bytecode = bytes(bytecode)
 
+        if settings.strip_metadata:
+            bytecode = normalise.strip_metadata(bytecode)
+
         self._raw = bytecode
 
-        # Track the program counter as we traverse the bytecode
-        self.__pc = 0
+        self.pcs = None
+        """Array of the program counter of each operation, indexed by op."""
+
+        self.jumpdests = None
+        """Array of the indices of all JUMPDEST operations."""
 
-    def __consume(self, n):
-        bytes_ = self._raw[self.__pc: self.__pc + n]
-        self.__pc += n
-        return bytes_
+        self.block_starts = None
+        """Array of the op indices at which each basic block begins."""
 
-    def __has_more_bytes(self):
-        return self.__pc < len(self._raw)
+    def scan(self) -> None:
+        """
+        Finds instruction and basic block boundaries in the bytecode in a
+        single pass, without constructing any EVMOps. The results are stored
+        in pcs, jumpdests and block_starts, and the parsed ops become
+        available lazily through a LazyEVMOps sequence.
+        """
+        code = memoryview(self._raw)
+        push_len = opcodes.PUSH_LEN
+        ends_block = opcodes.ENDS_BLOCK
+        jumpdest = opcodes.JUMPDEST.code
+        strict = settings.strict
+
+        pcs = array.array("L")
+        jumpdests = array.array("L")
+        block_starts = array.array("L")
+
+        pc, i, size = 0, 0, len(code)
+        new_block = True
+
+        while pc < size:
+            byte = code[pc]
+            pcs.append(pc)
+
+            if byte == jumpdest:
+                jumpdests.append(i)
+                if not new_block:
+                    block_starts.append(i)
+            if new_block:
+                block_starts.append(i)
+
+            if strict and byte not in opcodes.BYTECODES:
+                try:
+                    opcodes.opcode_by_value(byte)
+                except LookupError as e:
+                    logging.warning("(strict) Invalid opcode at PC = %#02x: %s", pc, str(e))
+                    raise e
+
+            new_block = ends_block[byte]
+            pc += 1 + push_len[byte]
+            i += 1
+
+        self.pcs = pcs
+        self.jumpdests = jumpdests
+        self.block_starts = block_starts
+        self._ops = LazyEVMOps(code, pcs)
+
+    @property
+    def ops(self) -> t.Sequence[evm_cfg.EVMOp]:
+        """The operations found by scan(), each constructed on first access."""
+        return self._ops
 
     def parse(self) -> t.Iterable[evm_cfg.EVMBasicBlock]:
         """
@@ -185,35 +242,59 @@ class EVMBytecodeParser(BlockParser):
         """
 
         super().parse()
+        self.scan()
 
-        while self.__has_more_bytes():
-            pc = self.__pc
-            byte = int.from_bytes(self.__consume(1), ENDIANNESS)
-            const, const_size = None, 0
-
-            try:
-                # try to resolve the byte to an opcode
-                op = opcodes.opcode_by_value(byte)
-
-            except LookupError as e:
-                # oops, unknown opcode
-                if settings.strict:
-                    logging.warning("(strict) Invalid opcode at PC = %#02x: %s", pc, str(e))
-                    raise e
-                # not strict, so just log:
-                logging.debug("Invalid opcode at PC = %#02x: %s", pc, str(e))
-                op = opcodes.missing_opcode(byte)
-                const = byte
+        # build basic blocks from the precomputed block boundaries
+        return evm_cfg.blocks_from_boundaries(self._ops, self.block_starts)
 
-            # push codes have an argument
-            if op.is_push():
-                const_size = op.push_len()
 
-            # for opcodes with an argument, consume the argument
-            if const_size > 0:
-                const = int.from_bytes(self.__consume(const_size), ENDIANNESS)
-
-            self._ops.append(evm_cfg.EVMOp(pc, op, const))
+class LazyEVMOps(t.Sequence[evm_cfg.EVMOp]):
+    def __init__(self, code: memoryview, pcs: t.Sequence[int]):
+        """
+        A read-only sequence of the EVMOps in scanned bytecode. Each EVMOp is
+        only constructed the first time it is accessed, after which the same
+        object is always returned.
 
-        # build basic blocks from the sequence of opcodes
-        return evm_cfg.blocks_from_ops(self._ops)
+        Args:
+          code: the raw bytecode.
+          pcs: the program counter at which each operation begins.
+        """
+        self.__code = code
+        self.__pcs = pcs
+        self.__ops = [None] * len(pcs)
+
+    def __len__(self) -> int:
+        return len(self.__pcs)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        op = self.__ops[i]
+        if op is None:
+            op = self.__ops[i] = self.__make_op(self.__pcs[i])
+        return op
+
+    def __iter__(self) -> t.Iterator[evm_cfg.EVMOp]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __make_op(self, pc: int) -> evm_cfg.EVMOp:
+        byte = self.__code[pc]
+        op = opcodes.BYTECODES.get(byte)
+        const = None
+
+        if op is None:
+            # unknown opcode; strict mode would already have failed in scan()
+            logging.debug("Invalid opcode at PC = %#02x: "
+                          "No opcode with value '0x%02X'.", pc, byte)
+            op = opcodes.missing_opcode(byte)
+            const = byte
+
+        # push codes have an argument, possibly truncated by the end of code
+        const_size = opcodes.PUSH_LEN[byte]
+        if const_size > 0:
+            const = int.from_bytes(self.__code[pc + 1: pc + 1 + const_size],
+                                   ENDIANNESS)
+
+        return evm_cfg.EVMOp(pc, op, const)
@@ -29,6 +29,7 @@
 
 """dataflow.py: fixed-point, dataflow, static analyses for CFGs"""
 
+import contextlib
 import logging
 import time
 from typing import Dict, Any
@@ -42,11 +43,95 @@ import src.tac_cfg as tac_cfg
 from src.memtypes import VariableStack
 
 
+class PhaseProfile:
+    """
+    Accumulates the wall-clock time, number of invocations, number of
+    iterations, and number of bailouts for each named phase of the analysis.
+    Timings are taken with the monotonic performance counter.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        """A mapping from phase names to their accumulated statistics."""
+
+    def record(self, name: str, seconds: float, iterations: int = 0,
+               bailed_out: bool = False, **counts: int) -> None:
+        """
+        Record one invocation of the named phase.
+
+        Args:
+          name: the phase that was run.
+          seconds: how long the invocation took.
+          iterations: how many iterations the invocation performed.
+          bailed_out: whether the invocation ran out of time.
+          counts: any further phase-specific quantities to accumulate.
+        """
+        if name not in self.phases:
+            self.phases[name] = {"time": 0.0, "calls": 0,
+                                 "iterations": 0, "bailouts": 0}
+        stats = self.phases[name]
+        stats["time"] += seconds
+        stats["calls"] += 1
+        stats["iterations"] += iterations
+        stats["bailouts"] += int(bailed_out)
+        for key, n in counts.items():
+            stats[key] = stats.get(key, 0) + n
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Context manager recording the duration of one invocation of a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        """Return a copy of the accumulated statistics."""
+        return {name: dict(stats) for name, stats in self.phases.items()}
+
+
+class Budget:
+    """
+    A time budget measured with the monotonic performance counter.
+    A negative limit means the budget never expires.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        """The number of seconds this budget allows."""
+        self.start = time.perf_counter()
+        """The performance counter value at which this budget began."""
+
+    @property
+    def elapsed(self) -> float:
+        """The number of seconds spent since the budget began."""
+        return time.perf_counter() - self.start
+
+    @property
+    def remaining(self) -> float:
+        """The number of seconds left in this budget; infinite if uncapped."""
+        if self.seconds < 0:
+            return float("inf")
+        return self.seconds - self.elapsed
+
+    @property
+    def expired(self) -> bool:
+        """True iff this budget is capped and has been used up."""
+        return self.seconds >= 0 and self.elapsed > self.seconds
+
+
 def analyse_graph(cfg: tac_cfg.TACGraph) -> Dict[str, Any]:
     """
     Infer a CFG's structure by performing dataflow analyses to resolve new edges,
     until a fixed-point, the max time or max iteration count is reached.
 
+    If analytics are enabled, the returned dict includes, under "phases",
+    the time, invocation, iteration and bailout counts of each analysis phase:
+    stack_analysis, clone, merge, unreachable, and functions. The
+    stack_analysis phase also counts the constant folds performed (folds),
+    and those skipped because their inputs were unchanged (folds_skipped).
+
     Args:
         cfg: the graph to analyse; will be modified in-place.
     """
@@ -56,31 +141,32 @@ def analyse_graph(cfg: tac_cfg.TACGraph) -> Dict[str, Any]:
     anal_results = {}
     if settings.analytics:
         anal_results["bailout"] = False
-    bail_time = settings.bailout_seconds
-    start_clock = time.clock()
+    profile = PhaseProfile()
+    budget = Budget(settings.bailout_seconds)
     i = 0
 
     # Perform the stack analysis until we reach a fixed-point or a max is
     # exceeded. We alternately infer new edges that can be inferred.
     while i != settings.max_iterations:
-        loop_start_clock = time.clock()
+        loop_start = time.perf_counter()
         i += 1
-        modified = stack_analysis(cfg)
-        modified |= cfg.clone_ambiguous_jump_blocks()
+        modified = stack_analysis(cfg, profile)
+        clone_start = time.perf_counter()
+        cloned, bailed_out = cfg.clone_ambiguous_jump_blocks(settings.clone_bailout_seconds)
+        profile.record("clone", time.perf_counter() - clone_start, bailed_out=bailed_out)
+        modified |= cloned
         if not modified:
             break
 
         # If the next analysis step will require more than the remaining time
         # or we have already exceeded our time budget, break out.
-        loop_time = time.clock() - loop_start_clock
-        elapsed = time.clock() - start_clock
-        if bail_time >= 0:
-            if elapsed > bail_time or 2 * loop_time > bail_time - elapsed:
-                logging.info("Bailed out after %s seconds", elapsed)
-                if settings.analytics:
-                    anal_results["bailout"] = True
-                    anal_results["bail_time"] = elapsed
-                break
+        loop_time = time.perf_counter() - loop_start
+        if budget.expired or 2 * loop_time > budget.remaining:
+            logging.info("Bailed out after %s seconds", budget.elapsed)
+            if settings.analytics:
+                anal_results["bailout"] = True
+                anal_results["bail_time"] = budget.elapsed
+            break
 
     if settings.analytics:
         anal_results["num_clones"] = i
@@ -99,7 +185,7 @@ def analyse_graph(cfg: tac_cfg.TACGraph) -> Dict[str, Any]:
     settings.generate_throws = settings.final_generate_throws
 
     # Perform the final analysis.
-    stack_analysis(cfg)
+    stack_analysis(cfg, profile)
 
     # Collect analytics about how frequently blocks were duplicated during
     # the analysis.
@@ -116,27 +202,30 @@ def analyse_graph(cfg: tac_cfg.TACGraph) -> Dict[str, Any]:
     # Perform final graph manipulations, and merging any blocks that were split.
     # As well as extract jump destinations directly from def-sites if they were
     # not inferable during previous dataflow steps.
-    cfg.merge_duplicate_blocks(ignore_preds=True, ignore_succs=True)
-    cfg.hook_up_def_site_jumps()
-    cfg.prop_vars_between_blocks()
-    cfg.make_stack_names_unique()
+    with profile.phase("merge"):
+        cfg.merge_duplicate_blocks(ignore_preds=True, ignore_succs=True)
+        cfg.hook_up_def_site_jumps()
+        cfg.prop_vars_between_blocks()
+        cfg.make_stack_names_unique()
 
     # Clean up any unreachable blocks in the graph if necessary.
-    if settings.merge_unreachable:
-        merge_groups = cfg.merge_unreachable_blocks()
-        if len(merge_groups) > 0:
-            logging.info("Merged %s unreachable blocks into %s.",
-                         sum([len(g) for g in merge_groups]), len(merge_groups))
-    if settings.remove_unreachable:
-        removed = cfg.remove_unreachable_blocks()
-        if settings.analytics:
-            anal_results["unreachable_blocks"] = [b.ident() for b in removed]
-        logging.info("Removed %s unreachable blocks.", len(removed))
+    with profile.phase("unreachable"):
+        if settings.merge_unreachable:
+            merge_groups = cfg.merge_unreachable_blocks()
+            if len(merge_groups) > 0:
+                logging.info("Merged %s unreachable blocks into %s.",
+                             sum([len(g) for g in merge_groups]), len(merge_groups))
+        if settings.remove_unreachable:
+            removed = cfg.remove_unreachable_blocks()
+            if settings.analytics:
+                anal_results["unreachable_blocks"] = [b.ident() for b in removed]
+            logging.info("Removed %s unreachable blocks.", len(removed))
 
     # Perform function analysis
     if settings.extract_functions or settings.mark_functions:
         logging.info("Extracting functions")
-        cfg.extract_functions()
+        with profile.phase("functions"):
+            cfg.extract_functions()
         logging.info("Detected %s public and %s private function(s).",
                      len(cfg.function_extractor.public_functions),
                      len(cfg.function_extractor.private_functions))
@@ -155,7 +244,13 @@ def analyse_graph(cfg: tac_cfg.TACGraph) -> Dict[str, Any]:
 
     # Compute and log final analytics data.
     logging.info("Produced control flow graph with %s basic blocks.", len(cfg))
+    for name, stats in profile.phases.items():
+        logging.info("Phase %s: %s call(s), %s iteration(s), %.3f seconds.",
+                     name, stats["calls"], stats["iterations"], stats["time"])
     if settings.analytics:
+        anal_results["phases"] = profile.as_dict()
+        anal_results["analysis_time"] = budget.elapsed
+
         # accrue general graph data
         # per-block scheme: (indegree, outdegree, multiplicity)
         anal_results["num_blocks"] = len(cfg)
@@ -176,7 +271,7 @@ def analyse_graph(cfg: tac_cfg.TACGraph) -> Dict[str, Any]:
     return anal_results
 
 
-def stack_analysis(cfg: tac_cfg.TACGraph) -> bool:
+def stack_analysis(cfg: tac_cfg.TACGraph, profile: PhaseProfile = None) -> bool:
     """
     Determine all possible stack states at block exits. The stack size should be
     the maximum possible size, and the variables on the stack should obtain the
@@ -185,6 +280,8 @@ def stack_analysis(cfg: tac_cfg.TACGraph) -> bool:
 
     Args:
       cfg: the graph to analyse.
+      profile: if provided, the time spent and the number of worklist
+               iterations performed are recorded under "stack_analysis".
 
     Returns:
       True iff the graph was modified.
@@ -223,19 +320,25 @@ def stack_analysis(cfg: tac_cfg.TACGraph) -> bool:
     settings.generate_throws = False
 
     # the fixpoint analysis might run for a time > bailout, causing the timeout to be ignored
-    bail_time = settings.bailout_seconds 
-    start_clock = time.clock()
-    counter = 0 
+    bail_time = settings.stack_bailout_seconds
+    if bail_time < 0:
+        bail_time = settings.bailout_seconds
+    budget = Budget(bail_time)
+    bailed_out = False
+    counter = 0
+
+    # The number of constant folds performed, and skipped as unnecessary.
+    folded = skipped = 0
 
     # Churn until we reach a fixed point.
     while queue:
 
         # check if we are running over time budget
-        counter += 1 
-        if counter % 1000 == 0 and bail_time >= 0:
-            elapsed = time.clock() - start_clock
-            if elapsed > bail_time:
-                break
+        counter += 1
+        if budget.expired:
+            logging.info("Stack analysis bailed out after %s iterations.", counter)
+            bailed_out = True
+            break
 
         curr_block = queue.pop(0)
 
@@ -267,6 +370,7 @@ def stack_analysis(cfg: tac_cfg.TACGraph) -> bool:
                                   cume_stack.value[i])
                     cume_stack.value[i] = memtypes.Variable.top()
                     curr_block.entry_stack.value[i].value = cume_stack.value[i].value
+                    curr_block.invalidate_entry_stack()
 
         if settings.clamp_large_stacks and not stacks_clamped:
             # As variables can grow in size, stacks can grow in depth.
@@ -303,7 +407,9 @@ def stack_analysis(cfg: tac_cfg.TACGraph) -> bool:
 
             if settings.hook_up_stack_vars:
                 curr_block.hook_up_stack_vars()
-                curr_block.apply_operations(settings.set_valued_ops)
+                f, s = curr_block.apply_operations(settings.set_valued_ops)
+                folded += f
+                skipped += s
 
             if settings.hook_up_jumps:
                 old_succs = list(sorted(curr_block.succs))
@@ -333,11 +439,17 @@ def stack_analysis(cfg: tac_cfg.TACGraph) -> bool:
     # possible to determine after having performed stack analysis.
     if settings.hook_up_stack_vars:
         cfg.hook_up_stack_vars()
-        cfg.apply_operations()
+        f, s = cfg.apply_operations()
+        folded += f
+        skipped += s
     if settings.hook_up_jumps:
         graph_modified |= cfg.hook_up_jumps()
         graph_modified |= cfg.add_missing_split_edges()
 
+    if profile is not None:
+        profile.record("stack_analysis", budget.elapsed, counter, bailed_out,
+                       folds=folded, folds_skipped=skipped)
+
     return graph_modified
 
 
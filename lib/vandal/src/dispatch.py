@@ -0,0 +1,205 @@
+# BSD 3-Clause License
+#
+# Copyright (c) 2016, 2017, The University of Sydney. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""dispatch.py: Recover the table of public function selectors and their entry
+points directly from EVM bytecode, by recognising the shapes of the function
+dispatchers emitted by solc, without performing any dataflow analysis."""
+
+import bisect
+import logging
+import typing as t
+
+import src.blockparse as blockparse
+import src.dataflow as dataflow
+import src.evm_cfg as evm_cfg
+import src.opcodes as opcodes
+import src.tac_cfg as tac_cfg
+
+SELECTOR_CONSTS = {0xe0, 1 << 0xe0, 0xffffffff}
+"""
+Constants used to cut the selector out of the first word of calldata, either
+by shifting it right 0xe0 bits, or dividing it by 2**0xe0, and masking it.
+"""
+
+SELECTOR_OPS = {opcodes.SHR, opcodes.DIV, opcodes.AND, opcodes.SWAP1}
+"""Operations used to cut the selector out of the first word of calldata."""
+
+MAX_PREAMBLE_OPS = 64
+"""How many ops from the start of the code to search for the selector load."""
+
+MAX_SELECTOR_OPS = 8
+"""How many ops may be spent cutting out the selector after loading it."""
+
+
+def scan_selectors(bytecode: t.Union[str, bytes]) -> t.Optional[t.Dict[str, int]]:
+    """
+    Scan the given bytecode for a selector dispatcher in one of the shapes
+    solc emits: a chain of comparisons of the selector with constants, each
+    followed by a conditional jump to the matching function's entry point,
+    possibly split into several chains by binary search on the selector.
+
+    Args:
+      bytecode: EVM bytecode, as accepted by EVMBytecodeParser.
+
+    Returns:
+      A mapping from each selector, formatted as a Function signature is, to
+      the pc of its function's entry point; or None if no dispatcher could be
+      confidently recognised.
+    """
+    parser = blockparse.EVMBytecodeParser(bytecode)
+    parser.scan()
+    ops, pcs = parser.ops, parser.pcs
+
+    start = _selector_cut(ops)
+    if start is None:
+        return None
+
+    def jumpdest(pc: int) -> t.Optional[int]:
+        i = bisect.bisect_left(pcs, pc)
+        if i < len(pcs) and pcs[i] == pc and ops[i].opcode == opcodes.JUMPDEST:
+            return i
+        return None
+
+    selectors = {}
+    chains = [start]
+    visited = {start}
+    while chains:
+        i = chains.pop()
+        matched = False
+        while i < len(ops):
+            if ops[i].opcode == opcodes.JUMPDEST:
+                i += 1
+                continue
+            match = _dispatch_jump(ops, i)
+            if match is None:
+                break
+            kind, value, dest = match
+            dest_index = jumpdest(dest)
+            if dest_index is None:
+                return None
+            if kind == opcodes.EQ:
+                if selectors.setdefault(hex(value), dest) != dest:
+                    return None
+            elif dest_index not in visited:
+                # The other half of a binary search over the selectors.
+                visited.add(dest_index)
+                chains.append(dest_index)
+            matched = True
+            i += 5
+
+        # Every chain must begin with a recognised comparison.
+        if not matched:
+            return None
+
+    return selectors
+
+
+def _selector_cut(ops: t.Sequence[evm_cfg.EVMOp]) -> t.Optional[int]:
+    """
+    Return the index of the first op after the selector has been loaded from
+    calldata and cut down to size, or None if that could not be found.
+    """
+    for i in range(1, min(len(ops), MAX_PREAMBLE_OPS)):
+        if ops[i].opcode == opcodes.CALLDATALOAD:
+            break
+    else:
+        return None
+    if ops[i - 1].opcode != opcodes.PUSH1 or ops[i - 1].value != 0:
+        return None
+
+    end = min(len(ops), i + 1 + MAX_SELECTOR_OPS)
+    for j in range(i + 1, end):
+        op = ops[j]
+        if op.opcode in SELECTOR_OPS or \
+           (op.opcode.is_push() and op.value in SELECTOR_CONSTS):
+            continue
+        return j
+    return None
+
+
+def _dispatch_jump(ops: t.Sequence[evm_cfg.EVMOp], i: int) \
+    -> t.Optional[t.Tuple[opcodes.OpCode, int, int]]:
+    """
+    Match a comparison of the selector with a constant, followed by a
+    conditional jump, in the five ops beginning at index i. The selector is
+    duplicated either before or after the constant is pushed.
+
+    Returns:
+      The comparison opcode (EQ, or LT or GT in a binary search), the
+      constant compared with, and the jump destination; or None if the ops do
+      not match.
+    """
+    window = ops[i:i + 5]
+    if len(window) < 5:
+        return None
+    first, second, cmp, push_dest, jumpi = window
+
+    if first.opcode == opcodes.DUP1 and second.opcode.is_push():
+        const = second
+    elif first.opcode.is_push() and second.opcode == opcodes.DUP2:
+        const = first
+    else:
+        return None
+
+    if const.opcode.push_len() > 4 or \
+       cmp.opcode not in (opcodes.EQ, opcodes.LT, opcodes.GT) or \
+       not push_dest.opcode.is_push() or jumpi.opcode != opcodes.JUMPI:
+        return None
+
+    return cmp.opcode, const.value, push_dest.value
+
+
+def function_selectors(bytecode: t.Union[str, bytes]) -> t.Dict[str, int]:
+    """
+    Return the public function selectors of the given contract, and the pcs of
+    their entry points. The dispatcher is scanned for directly if possible,
+    otherwise the contract is fully analysed and its functions extracted.
+
+    Args:
+      bytecode: EVM bytecode, as accepted by EVMBytecodeParser.
+
+    Returns:
+      A mapping from each selector, formatted as a Function signature is, to
+      the pc of its function's entry point.
+    """
+    selectors = scan_selectors(bytecode)
+    if selectors is not None:
+        return selectors
+
+    logging.info("Dispatcher not recognised, falling back to full analysis.")
+    cfg = tac_cfg.TACGraph(blockparse.EVMBytecodeParser(bytecode).parse())
+    dataflow.analyse_graph(cfg)
+    if cfg.function_extractor is None:
+        cfg.extract_functions()
+
+    selectors = {}
+    for f in cfg.function_extractor.public_functions:
+        if f.signature:
+            selectors.setdefault(f.signature, f.start_block.entry)
+    return selectors
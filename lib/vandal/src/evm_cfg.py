@@ -105,6 +105,8 @@ class EVMOp:
     Represents a single EVM operation.
     """
 
+    __slots__ = ("pc", "opcode", "value", "block")
+
     def __init__(self, pc: int, opcode: opcodes.OpCode, value: int = None):
         """
         Create a new EVMOp object from the given params which should correspond to
@@ -160,7 +162,7 @@ class EVMOp:
         )
 
 
-def blocks_from_ops(ops: t.Iterable[EVMOp]) -> t.Iterable[EVMBasicBlock]:
+def blocks_from_ops(ops: t.Sequence[EVMOp]) -> t.Iterable[EVMBasicBlock]:
     """
     Process a sequence of EVMOps and create a sequence of EVMBasicBlocks.
 
@@ -170,41 +172,53 @@ def blocks_from_ops(ops: t.Iterable[EVMOp]) -> t.Iterable[EVMBasicBlock]:
     Returns:
       List of BasicBlocks from the input ops, in arbitrary order.
     """
-    blocks = []
-
-    # details for block currently being processed
-    entry, exit = (0, len(ops) - 1) if len(ops) > 0 \
-        else (None, None)
-    current = EVMBasicBlock(entry, exit)
+    starts = []
+    new_block = True
 
-    # Linear scan of all EVMOps to create initial EVMBasicBlocks
+    # Linear scan of all EVMOps to find the index at which each block begins
     for i, op in enumerate(ops):
-        op.block = current
-        current.evm_ops.append(op)
-
-        # Flow-altering opcodes indicate end-of-block
-        if op.opcode.alters_flow():
-            new = current.split(i + 1)
-            blocks.append(current)
-
-            # Mark all JUMPs as unresolved
-            if op.opcode in (opcodes.JUMP, opcodes.JUMPI):
-                current.has_unresolved_jump = True
-
-            # Process the next sequential block in our next iteration
-            current = new
+        if new_block:
+            starts.append(i)
 
         # JUMPDESTs indicate the start of a block.
         # A JUMPDEST should be split on only if it's not already the first
         # operation in a block. In this way we avoid producing empty blocks if
         # JUMPDESTs follow flow-altering operations.
-        elif op.opcode == opcodes.JUMPDEST and len(current.evm_ops) > 1:
-            new = current.split(i)
-            blocks.append(current)
-            current = new
-
-        # Always add last block if its last instruction does not alter flow
-        elif i == len(ops) - 1:
-            blocks.append(current)
+        elif op.opcode == opcodes.JUMPDEST:
+            starts.append(i)
+
+        # Flow-altering opcodes indicate end-of-block
+        new_block = op.opcode.alters_flow()
+
+    return blocks_from_boundaries(ops, starts)
+
+
+def blocks_from_boundaries(ops: t.Sequence[EVMOp],
+                           starts: t.Sequence[int]) -> t.List[EVMBasicBlock]:
+    """
+    Create a sequence of EVMBasicBlocks from a sequence of EVMOps whose block
+    boundaries are already known. Each block spans from its start index up to
+    the op before the next block's start, or the end of the sequence.
+
+    Args:
+      ops: sequence of EVMOps to be put into blocks.
+      starts: ascending indices into ops at which each block begins.
+
+    Returns:
+      List of BasicBlocks from the input ops, ordered by entry.
+    """
+    blocks = []
+    bounds = list(starts) + [len(ops)]
+
+    for entry, end in zip(bounds, bounds[1:]):
+        block = EVMBasicBlock(entry, end - 1, ops[entry:end])
+        for op in block.evm_ops:
+            op.block = block
+
+        # Mark all JUMPs as unresolved
+        if block.evm_ops[-1].opcode in (opcodes.JUMP, opcodes.JUMPI):
+            block.has_unresolved_jump = True
+
+        blocks.append(block)
 
     return blocks
@@ -31,8 +31,12 @@
 
 import abc
 import csv
+import io
+import itertools
 import logging
 import os
+import subprocess
+import typing as t
 
 import src.cfg as cfg
 import src.function as function
@@ -88,14 +92,13 @@ class CFGTsvExporter(Exporter, patterns.DynamicVisitor):
         A list of pairs (op.pc, variable) that specify all write locations.
         """
 
-        self.__output_dir = None
+        self.__facts = {}
 
     def __generate(self, filename, entries):
-        path = os.path.join(self.__output_dir, filename)
-        with open(path, 'w') as f:
-            writer = csv.writer(f, delimiter='\t', lineterminator='\n')
-            for e in entries:
-                writer.writerow(e)
+        buf = io.StringIO()
+        writer = csv.writer(buf, delimiter='\t', lineterminator='\n')
+        writer.writerows(entries)
+        self.__facts[filename] = buf.getvalue()
 
     def __generate_blocks_ops(self, out_opcodes):
         # Write a mapping from operation addresses to corresponding opcode names;
@@ -204,19 +207,15 @@ class CFGTsvExporter(Exporter, patterns.DynamicVisitor):
         self.__generate("public_function_sigs.facts", public_function_sigs)
 
     def __generate_dominators(self):
-        pairs = sorted([(k, i) for k, v
-                        in self.source.dominators(op_edges=True).items()
-                        for i in v])
-        self.__generate("dom.facts", pairs)
+        # Each direction's dominator tree is computed once and cached by the
+        # graph; full dominator relations are streamed from a walk up the tree.
+        self.__generate("dom.facts", self.source.dominator_pairs(op_edges=True))
 
         pairs = sorted(self.source.immediate_dominators(op_edges=True).items())
         self.__generate("imdom.facts", pairs)
 
-        pairs = sorted([(k, i) for k, v
-                        in self.source.dominators(post=True,
-                                                  op_edges=True).items()
-                        for i in v])
-        self.__generate("pdom.facts", pairs)
+        self.__generate("pdom.facts", self.source.dominator_pairs(post=True,
+                                                                  op_edges=True))
 
         pairs = sorted(self.source.immediate_dominators(post=True,
                                                         op_edges=True).items())
@@ -256,17 +255,20 @@ class CFGTsvExporter(Exporter, patterns.DynamicVisitor):
         self.__generate("BasicBlockRange.facts", block_ranges)
         self.__generate("CFGEdge.facts", cfg_edges)
 
-    def export(self, output_dir: str = "", dominators: bool = False, out_opcodes=[]):
+    def facts(self, dominators: bool = False,
+              out_opcodes=[]) -> t.Dict[str, str]:
         """
+        Generate the logical relations in memory, without touching the disk.
+
         Args:
-          output_dir: location to write the output to.
           dominators: output relations specifying dominators
           out_opcodes: a list of opcode names all occurences thereof to output,
                        with the names of all argument variables.
+
+        Returns:
+          A mapping from each .facts file name to its tab-separated contents.
         """
-        if output_dir != "":
-            os.makedirs(output_dir, exist_ok=True)
-        self.__output_dir = output_dir
+        self.__facts = {}
 
         self.__generate_blocks_ops(out_opcodes)
         self.__generate_edges()
@@ -280,6 +282,33 @@ class CFGTsvExporter(Exporter, patterns.DynamicVisitor):
         if dominators:
             self.__generate_dominators()
 
+        return self.__facts
+
+    def export(self, output_dir: str = "", dominators: bool = False, out_opcodes=[]):
+        """
+        Args:
+          output_dir: location to write the output to.
+          dominators: output relations specifying dominators
+          out_opcodes: a list of opcode names all occurences thereof to output,
+                       with the names of all argument variables.
+        """
+        write_facts(self.facts(dominators, out_opcodes), output_dir)
+
+
+def write_facts(facts: t.Dict[str, str], output_dir: str = "") -> None:
+    """
+    Write out facts generated by CFGTsvExporter.facts, one file per relation.
+
+    Args:
+      facts: a mapping from .facts file names to their contents.
+      output_dir: location to write the output to.
+    """
+    if output_dir != "":
+        os.makedirs(output_dir, exist_ok=True)
+    for filename, contents in facts.items():
+        with open(os.path.join(output_dir, filename), 'w') as f:
+            f.write(contents)
+
 
 class CFGStringExporter(Exporter, patterns.DynamicVisitor):
     """
@@ -308,19 +337,37 @@ class CFGStringExporter(Exporter, patterns.DynamicVisitor):
         """
         Visit a BasicBlock in the CFG
         """
-        self.blocks.append((block.entry, str(block)))
+        self.blocks.append(block)
 
-    def export(self):
+    def chunks(self) -> t.Iterator[str]:
         """
-        Print a textual representation of the input CFG to stdout.
+        Generate the textual representation of the input CFG piece by piece,
+        so that only one block's text is held in memory at a time.
         """
+        blocks = self.blocks
         if self.ordered:
-            self.blocks.sort(key=lambda n: n[0])
-        blocks = self.__BLOCK_SEP.join(n[1] for n in self.blocks)
-        functions = ""
+            blocks = sorted(blocks, key=lambda b: b.entry)
+        for i, block in enumerate(blocks):
+            if i > 0:
+                yield self.__BLOCK_SEP
+            yield str(block)
         if self.source.function_extractor is not None:
-            functions = self.__BLOCK_SEP + str(self.source.function_extractor)
-        return blocks + functions
+            yield self.__BLOCK_SEP
+            yield str(self.source.function_extractor)
+
+    def write(self, out: t.TextIO) -> None:
+        """
+        Write a textual representation of the input CFG to the given stream,
+        incrementally.
+        """
+        for chunk in self.chunks():
+            out.write(chunk)
+
+    def export(self):
+        """
+        Print a textual representation of the input CFG to stdout.
+        """
+        return "".join(self.chunks())
 
 
 class CFGDotExporter(Exporter):
@@ -329,10 +376,141 @@ class CFGDotExporter(Exporter):
 
     Args:
       cfg: source CFG to be exported to dot format.
+      max_nodes: if the CFG has more blocks than this, then each chain of
+                 blocks with no branching or merging between them is drawn
+                 as a single node. No limit by default.
     """
 
-    def __init__(self, cfg: cfg.ControlFlowGraph):
+    def __init__(self, cfg: cfg.ControlFlowGraph, max_nodes: int = None):
         super().__init__(cfg)
+        self.max_nodes = max_nodes
+
+    def node_groups(self) -> t.List[t.List[cfg.BasicBlock]]:
+        """
+        Return the groups of blocks which will each be drawn as one node, with
+        the blocks of each group in flow order.
+        """
+        blocks = self.source.blocks
+        if self.max_nodes is None or len(blocks) <= self.max_nodes:
+            return [[b] for b in blocks]
+
+        def continues_chain(b):
+            return b is not self.source.root and len(b.preds) == 1 \
+                and b.preds[0] is not b and len(b.preds[0].succs) == 1
+
+        groups = []
+        grouped = set()
+        # Start chains at their heads first, so that only pure cycles of
+        # chained blocks are started partway through.
+        heads = [b for b in blocks if not continues_chain(b)]
+        for block in itertools.chain(heads, blocks):
+            if block in grouped:
+                continue
+            group = [block]
+            grouped.add(block)
+            while len(block.succs) == 1 and continues_chain(block.succs[0]) \
+                    and block.succs[0] not in grouped:
+                block = block.succs[0]
+                group.append(block)
+                grouped.add(block)
+            groups.append(group)
+
+        logging.info("Collapsed %s blocks into %s nodes.", len(blocks), len(groups))
+        if len(groups) > self.max_nodes:
+            logging.warning("The graph still has %s nodes after collapsing chains.",
+                            len(groups))
+        return groups
+
+    @staticmethod
+    def __quote(s: str) -> str:
+        """Return the given string as a quoted DOT identifier."""
+        return '"' + s.replace("\\", "\\\\").replace('"', '\\"') \
+            .replace("\n", "\\n") + '"'
+
+    @staticmethod
+    def __colour(group: t.List[cfg.BasicBlock]) -> t.Optional[str]:
+        """
+        Return the outline colour of a node drawn for the given blocks:
+          Orange: contains a CALL, CALLCODE, or DELEGATECALL operation;
+          Brown: contains a CREATE operation;
+          Purple: ends in a SELFDESTRUCT operation;
+          Red: ends in a THROW, THROWI, INVALID, or missing operation;
+          Blue: ends in a STOP operation;
+          Green: ends in a RETURN operation.
+        """
+        if any(op.opcode.is_call() for b in group for op in b.tac_ops):
+            return "orange"
+        if any(op.opcode == opcodes.CREATE for b in group for op in b.tac_ops):
+            return "brown"
+        last = group[-1].last_op.opcode
+        if last == opcodes.SELFDESTRUCT:
+            return "purple"
+        if last.is_exception():
+            return "red"
+        if last == opcodes.STOP:
+            return "blue"
+        if last == opcodes.RETURN:
+            return "green"
+        return None
+
+    @staticmethod
+    def __tooltip(block: cfg.BasicBlock) -> str:
+        """Return a block's internal data, for display if rendered in html."""
+        def_site_string = "\n\nDef sites:\n"
+        for v in block.entry_stack.value:
+            def_site_string += str(v) \
+                               + ": {" \
+                               + ", ".join(str(d) for d in v.def_sites) \
+                               + "}\n"
+        return str(block) + def_site_string
+
+    def dot_lines(self, groups: t.List[t.List[cfg.BasicBlock]] = None) \
+        -> t.Iterator[str]:
+        """
+        Generate the lines of a DOT representation of the CFG, one node or
+        edge at a time.
+
+        Args:
+          groups: the groups of blocks to draw as nodes; node_groups() by default.
+        """
+        quote = self.__quote
+        groups = self.node_groups() if groups is None else groups
+        node_of = {b: group[0].ident() for group in groups for b in group}
+
+        yield "digraph {\n"
+        for group in groups:
+            ident = group[0].ident()
+            attrs = []
+            if len(group) > 1:
+                attrs.append(("label", "{} .. {}".format(ident, group[-1].ident())))
+            colour = self.__colour(group)
+            if colour is not None:
+                attrs.append(("color", colour))
+            large = any(len(b.entry_stack) > 20 for b in group)
+            attrs.append(("fillcolor", "red" if large else "white"))
+            attrs.append(("style", "filled"))
+            attrs.append(("id", ident))
+            attrs.append(("tooltip", "\n\n".join(self.__tooltip(b) for b in group)))
+            yield "{} [{}];\n".format(quote(ident), ", ".join(
+                "{}={}".format(k, quote(v)) for k, v in attrs))
+
+        unresolved = False
+        for group in groups:
+            tail = group[-1]
+            heads = list(dict.fromkeys(node_of[s] for s in tail.succs if s in node_of))
+            if tail.has_unresolved_jump:
+                heads.append(tac_cfg.UNRES_DEST)
+                unresolved = True
+            for head in heads:
+                yield "{} -> {};\n".format(quote(group[0].ident()), quote(head))
+        if unresolved:
+            yield "{};\n".format(quote(tac_cfg.UNRES_DEST))
+        yield "}\n"
+
+    def write(self, out: t.TextIO) -> None:
+        """Write a DOT representation of the CFG to the given stream, incrementally."""
+        for line in self.dot_lines():
+            out.write(line)
 
     def export(self, out_filename: str = "cfg.dot"):
         """
@@ -353,81 +531,74 @@ class CFGDotExporter(Exporter):
                         If the file extension is a supported image format,
                         attempt to generate an image using the `dot` program,
                         if it is in the user's `$PATH`.
+
+        Raises:
+          subprocess.CalledProcessError: if `dot` fails, in which case no html
+                                         page is written.
         """
-        import networkx as nx
-
-        cfg = self.source
-
-        G = cfg.nx_graph()
-
-        # Colour-code the graph.
-        returns = {block.ident(): "green" for block in cfg.blocks
-                   if block.last_op.opcode == opcodes.RETURN}
-        stops = {block.ident(): "blue" for block in cfg.blocks
-                 if block.last_op.opcode == opcodes.STOP}
-        throws = {block.ident(): "red" for block in cfg.blocks
-                  if block.last_op.opcode.is_exception()}
-        suicides = {block.ident(): "purple" for block in cfg.blocks
-                    if block.last_op.opcode == opcodes.SELFDESTRUCT}
-        creates = {block.ident(): "brown" for block in cfg.blocks
-                   if any(op.opcode == opcodes.CREATE for op in block.tac_ops)}
-        calls = {block.ident(): "orange" for block in cfg.blocks
-                 if any(op.opcode.is_call() for op in block.tac_ops)}
-        color_dict = {**returns, **stops, **throws, **suicides, **creates, **calls}
-        nx.set_node_attributes(G, "color", color_dict)
-        filldict = {b.ident(): "white" if len(b.entry_stack) <= 20 else "red"
-                    for b in cfg.blocks}
-        nx.set_node_attributes(G, "fillcolor", filldict)
-        nx.set_node_attributes(G, "style", "filled")
-
-        # Annotate each node with its basic block's internal data for later display
-        # if rendered in html.
-        nx.set_node_attributes(G, "id", {block.ident(): block.ident()
-                                         for block in cfg.blocks})
-
-        block_strings = {}
-        for block in cfg.blocks:
-            block_string = str(block)
-            def_site_string = "\n\nDef sites:\n"
-            for v in block.entry_stack.value:
-                def_site_string += str(v) \
-                                   + ": {" \
-                                   + ", ".join(str(d) for d in v.def_sites) \
-                                   + "}\n"
-            block_strings[block.ident()] = block_string + def_site_string
-        nx.set_node_attributes(G, "tooltip", block_strings)
-
-        # Write non-dot files using pydot and Graphviz
-        if "." in out_filename and not out_filename.endswith(".dot"):
-            pdG = nx.nx_pydot.to_pydot(G)
-            extension = out_filename.split(".")[-1]
-
-            # If we're producing an html file, write a temporary svg to build it from
-            # and then delete it.
-            if extension == "html":
-                html = svg_to_html(pdG.create_svg().decode("utf-8"), cfg.function_extractor)
-                if not out_filename.endswith(".html"):
-                    out_filename += ".html"
-                with open(out_filename, 'w') as page:
-                    logging.info("Drawing CFG image to '%s'.", out_filename)
-                    page.write(html)
-            else:
-                pdG.set_margin(0)
-                pdG.write(out_filename, format=extension)
-
-        # Otherwise, write a regular dot file using pydot
-        else:
-            try:
-                if out_filename == "":
-                    out_filename = "cfg.html"
-                nx.nx_pydot.write_dot(G, out_filename)
-                logging.info("Drawing CFG image to '%s'.", out_filename)
-            except:
-                logging.info("Graphviz missing. Falling back to dot.")
-                if out_filename == "":
-                    out_filename = "cfg.dot"
-                nx.nx_pydot.write_dot(G, out_filename)
-                logging.info("Drawing CFG image to '%s'.", out_filename)
+        if out_filename == "":
+            out_filename = "cfg.dot"
+
+        # Write regular dot files directly.
+        if "." not in out_filename or out_filename.endswith(".dot"):
+            with open(out_filename, 'w') as f:
+                self.write(f)
+            logging.info("Drawing CFG image to '%s'.", out_filename)
+            return
+
+        # Render other formats with Graphviz, streaming the graph into it.
+        extension = out_filename.split(".")[-1]
+        groups = self.node_groups()
+        fmt = "svg" if extension == "html" else extension
+        cmd = ["dot", "-T" + fmt]
+        if extension != "html":
+            cmd += ["-Gmargin=0", "-o", out_filename]
+        try:
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, universal_newlines=True,
+                                    stdout=subprocess.PIPE if extension == "html" else None)
+        except FileNotFoundError:
+            out_filename = os.path.splitext(out_filename)[0] + ".dot"
+            logging.info("Graphviz missing. Falling back to dot.")
+            with open(out_filename, 'w') as f:
+                for line in self.dot_lines(groups):
+                    f.write(line)
+            logging.info("Drawing CFG image to '%s'.", out_filename)
+            return
+
+        # An html page is written beside its destination, and only moved there
+        # once Graphviz has succeeded.
+        page_name = None
+        try:
+            with proc:
+                # Graphviz reads its whole input before writing any output.
+                try:
+                    for line in self.dot_lines(groups):
+                        proc.stdin.write(line)
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    # Graphviz gave up early; its exit status says why.
+                    try:
+                        proc.stdin.close()
+                    except BrokenPipeError:
+                        pass
+
+                if extension == "html":
+                    node_ids = {b.ident(): group[0].ident() for group in groups for b in group}
+                    page_name = "{}.{}.tmp".format(out_filename, os.getpid())
+                    with open(page_name, 'w') as page:
+                        write_html((l.rstrip("\n") for l in proc.stdout), page,
+                                   self.source.function_extractor, node_ids)
+
+            if proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode, cmd)
+        except BaseException:
+            if page_name is not None and os.path.exists(page_name):
+                os.remove(page_name)
+            raise
+
+        if page_name is not None:
+            os.replace(page_name, out_filename)
+        logging.info("Drawing CFG image to '%s'.", out_filename)
 
 
 def svg_to_html(svg: str, function_extractor: function.FunctionExtractor = None) -> str:
@@ -442,11 +613,36 @@ def svg_to_html(svg: str, function_extractor: function.FunctionExtractor = None)
     Returns:
         HTML string of interactive web page source for the given CFG.
     """
+    page = io.StringIO()
+    write_html(svg.split("\n"), page, function_extractor)
+    return page.getvalue()
+
+
+def write_html(svg_lines: t.Iterable[str], out: t.TextIO,
+               function_extractor: function.FunctionExtractor = None,
+               node_ids: t.Dict[str, str] = None) -> None:
+    """
+    Writes an interactive html page from the lines of an svg image of a CFG,
+    without holding the whole image in memory.
 
-    lines = svg.split("\n")
-    page = []
+    Args:
+        svg_lines: the lines of the SVG to process, without line endings.
+        out: the stream to write the page to.
+        function_extractor: a FunctionExtractor object containing functions
+                            to annotate the graph with.
+        node_ids: the identifier of the node drawn for each block, if some
+                  blocks were drawn together as one node.
+    """
+    started = False
+
+    def append(piece: str) -> None:
+        nonlocal started
+        if started:
+            out.write("\n")
+        out.write(piece)
+        started = True
 
-    page.append("""
+    append("""
               <html>
               <body>
               <style>
@@ -506,37 +702,38 @@ def svg_to_html(svg: str, function_extractor: function.FunctionExtractor = None)
               </style>
               """)
 
-    for line in lines[3:]:
-        page.append(line)
+    for line in itertools.islice(svg_lines, 3, None):
+        append(line)
 
-    page.append("""<textarea id="infobox" disabled=true rows=40 cols=80></textarea>""")
+    append("""<textarea id="infobox" disabled=true rows=40 cols=80></textarea>""")
 
     # Create a dropdown list of functions if there are any.
     if function_extractor is not None:
-        page.append("""<div class="dropdown">
+        append("""<div class="dropdown">
                <button onclick="showDropdown()" class="dropbutton">Functions</button>
                <div id="func-list" class="dropdown-content">""")
 
         for i, f in enumerate(function_extractor.functions):
             if f.is_private:
-                page.append('<a id=f_{0} href="javascript:highlightFunction({0})">private #{0}</a>'.format(i))
+                append('<a id=f_{0} href="javascript:highlightFunction({0})">private #{0}</a>'.format(i))
             else:
                 if f.signature:
-                    page.append(
+                    append(
                         '<a id=f_{0} href="javascript:highlightFunction({0})">public {1}</a>'.format(i, f.signature))
                 else:
-                    page.append('<a id=f_{0} href="javascript:highlightFunction({0})">fallback</a>'.format(i))
-        page.append("</div></div>")
+                    append('<a id=f_{0} href="javascript:highlightFunction({0})">fallback</a>'.format(i))
+        append("</div></div>")
 
-    page.append("""<script>""")
+    append("""<script>""")
 
     if function_extractor is not None:
-        func_map = {i: [b.ident() for b in f.body]
+        node_ids = node_ids or {}
+        func_map = {i: list(dict.fromkeys(node_ids.get(b.ident(), b.ident()) for b in f.body))
                     for i, f in enumerate(function_extractor.functions)}
-        page.append("var func_map = {};".format(func_map))
-        page.append("var highlight = new Array({}).fill(0);".format(len(func_map)))
+        append("var func_map = {};".format(func_map))
+        append("var highlight = new Array({}).fill(0);".format(len(func_map)))
 
-    page.append("""
+    append("""
                // Set info textbox contents to the title of the given element, with line endings replaced suitably.
                function setInfoContents(element){
                    document.getElementById('infobox').value = element.getAttribute('xlink:title').replace(/\\\\n/g, '\\n');
@@ -646,5 +843,3 @@ def svg_to_html(svg: str, function_extractor: function.FunctionExtractor = None)
               </html>
               </body>
               """)
-
-    return "\n".join(page)
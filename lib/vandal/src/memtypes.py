@@ -46,6 +46,8 @@ VAR_RESULT_NAME = "Res"
 class Location(abc.ABC):
     """A generic storage location: variables, memory, static storage."""
 
+    __slots__ = ()
+
     @property
     def identifier(self) -> str:
         """Return the string identifying this object."""
@@ -78,6 +80,8 @@ class Variable(ssle, Location):
     the result of some TAC operation. Its size is 32 bytes.
     """
 
+    __slots__ = ("name", "def_sites")
+
     SIZE = 32
     """Variables are 32 bytes in size."""
 
@@ -409,6 +413,8 @@ class Variable(ssle, Location):
 class MetaVariable(Variable):
     """A Variable to stand in for Variables."""
 
+    __slots__ = ("payload",)
+
     def __init__(self, name: str, payload=None, def_sites: ssle = ssle.bottom()):
         """
         Args:
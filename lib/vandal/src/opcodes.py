@@ -359,3 +359,20 @@ def missing_opcode(val: int) -> OpCode:
     if val in BYTECODES:
         raise ValueError("Opcode {} exists.")
     return OpCode("MISSING", val, 0, 0)
+
+
+# Byte-indexed tables for scanning raw bytecode without per-op lookups
+PUSH_LEN = tuple(
+    BYTECODES[val].push_len() if val in BYTECODES else 0
+    for val in range(256)
+)
+"""Number of immediate argument bytes following each possible byte value"""
+
+ENDS_BLOCK = tuple(
+    BYTECODES[val].alters_flow() if val in BYTECODES else True
+    for val in range(256)
+)
+"""
+Whether each possible byte value ends a basic block when executed.
+Unknown byte values are invalid instructions, and so always halt.
+"""
@@ -38,6 +38,8 @@ class Visitable(abc.ABC):
     Provides an interface for an object which can accept a :obj:`Visitor`.
     """
 
+    __slots__ = ()
+
     def accept(self, visitor: 'Visitor'):
         """
         Accepts a :obj:`Visitor` and calls :obj:`Visitor.visit`
@@ -32,6 +32,7 @@ objects."""
 
 import copy
 import logging
+import time
 import typing as t
 
 import networkx as nx
@@ -51,6 +52,72 @@ UNRES_DEST = "?"
 """The name of the unresolved jump destination auxiliary node."""
 
 
+def immediate_dominators(succs: t.List[t.List[int]], start: int) -> t.List[int]:
+    """
+    Compute immediate dominators with the iterative algorithm of Cooper,
+    Harvey and Kennedy, "A Simple, Fast Dominance Algorithm".
+
+    Args:
+      succs: the successor indices of each node in a graph over 0..n-1.
+      start: the index of the entry node.
+
+    Returns:
+      The index of each node's immediate dominator; the start node dominates
+      itself, and nodes unreachable from the start are given -1.
+    """
+    # Number the reachable nodes in postorder with an iterative DFS.
+    order = [-1] * len(succs)
+    postorder = []
+    visited = [False] * len(succs)
+    visited[start] = True
+    stack = [(start, iter(succs[start]))]
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            if not visited[child]:
+                visited[child] = True
+                stack.append((child, iter(succs[child])))
+                break
+        else:
+            stack.pop()
+            order[node] = len(postorder)
+            postorder.append(node)
+
+    preds = [[] for _ in succs]
+    for node in postorder:
+        for succ in succs[node]:
+            preds[succ].append(node)
+
+    idom = [-1] * len(succs)
+    idom[start] = start
+    changed = True
+    while changed:
+        changed = False
+        for node in reversed(postorder):
+            if node == start:
+                continue
+            new_idom = -1
+            for pred in preds[node]:
+                if idom[pred] == -1:
+                    continue
+                if new_idom == -1:
+                    new_idom = pred
+                    continue
+                # Intersect: walk both fingers up the tree until they meet.
+                a, b = pred, new_idom
+                while a != b:
+                    while order[a] < order[b]:
+                        a = idom[a]
+                    while order[b] < order[a]:
+                        b = idom[b]
+                new_idom = a
+            if idom[node] != new_idom:
+                idom[node] = new_idom
+                changed = True
+
+    return idom
+
+
 class TACGraph(cfg.ControlFlowGraph):
     """
     A control flow graph holding Three-Address Code blocks and
@@ -95,6 +162,12 @@ class TACGraph(cfg.ControlFlowGraph):
         and extraction logic.
         """
 
+        self.__idom_cache = {}
+        """
+        Immediate dominator computations, keyed by (post, op_edges), each
+        stored alongside the graph version and root it was computed from.
+        """
+
         # Propagate constants and add CFG edges.
         self.apply_operations()
         self.hook_up_jumps()
@@ -144,16 +217,43 @@ class TACGraph(cfg.ControlFlowGraph):
     def op_edge_list(self) -> t.Iterable[t.Tuple['TACOp', 'TACOp']]:
         """
         Returns:
-          a list of the CFG's operation edges, with each edge in the form
+          a generator of the CFG's operation edges, with each edge in the form
           `(pred, succ)` where pred and succ are object references.
         """
-        edges = []
         for block in self.blocks:
-            intra_edges = list(zip(block.tac_ops[:-1], block.tac_ops[1:]))
-            edges += intra_edges
+            yield from zip(block.tac_ops[:-1], block.tac_ops[1:])
             for succ in block.succs:
-                edges.append((block.tac_ops[-1], succ.tac_ops[0]))
-        return edges
+                yield block.tac_ops[-1], succ.tac_ops[0]
+
+    def __flow_graph(self, op_edges: bool) \
+        -> t.Tuple[t.Dict[t.Union[int, str], int], t.List[t.Tuple[int, int]]]:
+        """
+        Number the nodes of this CFG densely, and return the mapping from node
+        keys to ids along with the list of edges between ids. Nodes are keyed by
+        block identifier, or by op pc if op_edges is true; jumps to unresolved
+        destinations lead to an extra UNRES_DEST node.
+        """
+        ids = {}
+
+        def node(key):
+            return ids.setdefault(key, len(ids))
+
+        if op_edges:
+            for op in self.tac_ops:
+                node(op.pc)
+            edges = [(node(p.pc), node(s.pc)) for p, s in self.op_edge_list()]
+        else:
+            for block in self.blocks:
+                node(block.ident())
+            edges = [(node(p.ident()), node(s.ident())) for p, s in self.edge_list()]
+
+        edges += [(node(block.last_op.pc if op_edges else block.ident()), node(UNRES_DEST))
+                  for block in self.blocks if block.has_unresolved_jump]
+        return ids, edges
+
+    @staticmethod
+    def __label(key: t.Union[int, str]) -> str:
+        return hex(key) if isinstance(key, int) else key
 
     def nx_graph(self, op_edges=False) -> nx.DiGraph:
         """
@@ -163,19 +263,53 @@ class TACGraph(cfg.ControlFlowGraph):
         Args:
           op_edges: if true, return edges between instructions rather than blocks.
         """
+        ids, edges = self.__flow_graph(op_edges)
+        labels = [self.__label(key) for key in ids]
         g = nx.DiGraph()
+        g.add_nodes_from(labels)
+        g.add_edges_from((labels[p], labels[s]) for p, s in edges)
+        return g
 
-        if op_edges:
-            g.add_nodes_from(hex(op.pc) for op in self.tac_ops)
-            g.add_edges_from((hex(p.pc), hex(s.pc)) for p, s in self.op_edge_list())
-            g.add_edges_from((hex(block.last_op.pc), UNRES_DEST)
-                             for block in self.blocks if block.has_unresolved_jump)
+    def __dominance_graph(self, post: bool, op_edges: bool) \
+        -> t.Tuple[t.List[t.Union[int, str]], t.List[t.List[int]], int]:
+        """
+        Return the graph over which (post)dominators are computed, as a list of
+        node keys, a successor list of node ids per node, and the id of the
+        start node. This is the graph of nx_graph(), reversed and with an END
+        node leading to every terminal op if post is true.
+        """
+        ids, edges = self.__flow_graph(op_edges)
+
+        if post:
+            edges = [(s, p) for p, s in edges]
+            end = ids.setdefault(POSTDOM_END_NODE, len(ids))
+            for op in self.terminal_ops:
+                key = op.pc if op_edges else op.block.ident()
+                edges.append((end, ids.setdefault(key, len(ids))))
+            start = end
         else:
-            g.add_nodes_from(b.ident() for b in self.blocks)
-            g.add_edges_from((p.ident(), s.ident()) for p, s in self.edge_list())
-            g.add_edges_from((block.ident(), UNRES_DEST) for block in self.blocks
-                             if block.has_unresolved_jump)
-        return g
+            # Logic here is not quite robust when op_edges is true, but correct
+            # whenever there is a unique entry node, and no graph-splitting.
+            start = ids.setdefault(self.root.entry if op_edges else self.root.ident(),
+                                  len(ids))
+
+        return list(ids), cfg.CSRGraph(ids, edges).successor_lists(), start
+
+    def __idoms(self, post: bool, op_edges: bool) -> t.Tuple[t.List[str], t.List[int]]:
+        """
+        Return the node identifiers of the dominance graph, and the index of
+        each node's immediate dominator, or -1 for nodes unreachable from the
+        start. The result is cached until the graph changes.
+        """
+        cached = self.__idom_cache.get((post, op_edges))
+        if cached is not None and cached[0] == self.version and cached[1] is self.root:
+            return cached[2], cached[3]
+
+        keys, succs, start = self.__dominance_graph(post, op_edges)
+        idom = immediate_dominators(succs, start)
+        nodes = [self.__label(key) for key in keys]
+        self.__idom_cache[(post, op_edges)] = (self.version, self.root, nodes, idom)
+        return nodes, idom
 
     def immediate_dominators(self, post: bool = False, op_edges=False) \
         -> t.Dict[str, str]:
@@ -192,27 +326,11 @@ class TACGraph(cfg.ControlFlowGraph):
         Returns:
           dict: str -> str, maps from node identifiers to node identifiers.
         """
-        nx_graph = self.nx_graph(op_edges).reverse() if post \
-            else self.nx_graph(op_edges)
-
-        # Logic here is not quite robust when op_edges is true, but correct
-        # whenever there is a unique entry node, and no graph-splitting.
-        start = POSTDOM_END_NODE if post else self.root.ident()
-
-        if post:
-            if op_edges:
-                terminal_edges = [(POSTDOM_END_NODE, hex(op.pc))
-                                  for op in self.terminal_ops]
-            else:
-                terminal_edges = [(POSTDOM_END_NODE, op.block.ident())
-                                  for op in self.terminal_ops]
-            nx_graph.add_node(POSTDOM_END_NODE)
-            nx_graph.add_edges_from(terminal_edges)
-
-        doms = nx.algorithms.dominance.immediate_dominators(nx_graph, start)
-        idents = [b.ident() for b in self.blocks]
+        nodes, idom = self.__idoms(post, op_edges)
+        doms = {nodes[n]: nodes[d] for n, d in enumerate(idom) if d != -1}
 
         if not op_edges:
+            idents = {b.ident() for b in self.blocks}
             for d in [d for d in doms if d not in idents]:
                 del doms[d]
 
@@ -221,6 +339,28 @@ class TACGraph(cfg.ControlFlowGraph):
 
         return doms
 
+    def dominator_pairs(self, post: bool = False, op_edges=False) \
+        -> t.Iterator[t.Tuple[str, str]]:
+        """
+        Generate the (node, dominator) pairs of this graph, by walking up the
+        dominator tree from each node, without materialising any dominator sets.
+        Each node dominates itself.
+
+        Args
+          post: if true, generate postdominators instead.
+          op_edges: if true, generate pairs of instructions rather than blocks.
+        """
+        nodes, idom = self.__idoms(post, op_edges)
+        idents = None if op_edges else {b.ident() for b in self.blocks}
+        for n, d in enumerate(idom):
+            if d == -1 or (idents is not None and nodes[n] not in idents):
+                continue
+            node = nodes[n]
+            yield node, node
+            while d != n:
+                yield node, nodes[d]
+                n, d = d, idom[d]
+
     def dominators(self, post: bool = False, op_edges=False) \
         -> t.Dict[str, t.Set[str]]:
         """
@@ -235,19 +375,12 @@ class TACGraph(cfg.ControlFlowGraph):
         Returns:
           dict: str -> [str], a map block identifiers to block identifiers.
         """
-
-        idoms = self.immediate_dominators(post, op_edges)
-        doms = {d: set() for d in idoms}
-
-        for d in doms:
-            prev = d
-            while prev not in doms[d]:
-                doms[d].add(prev)
-                prev = idoms[prev]
-
+        doms = {}
+        for n, d in self.dominator_pairs(post, op_edges):
+            doms.setdefault(n, set()).add(d)
         return doms
 
-    def apply_operations(self, use_sets=False) -> None:
+    def apply_operations(self, use_sets=False) -> t.Tuple[int, int]:
         """
         Propagate and fold constants through the arithmetic TAC instructions
         in this CFG.
@@ -255,9 +388,17 @@ class TACGraph(cfg.ControlFlowGraph):
         If use_sets is True, folding will also be done on Variables that
         possess multiple possible values, performing operations in all possible
         combinations of values.
+
+        Returns:
+            The number of operations folded, and the number skipped because
+            nothing they depend on had changed.
         """
+        folded = skipped = 0
         for block in self.blocks:
-            block.apply_operations(use_sets)
+            f, s = block.apply_operations(use_sets)
+            folded += f
+            skipped += s
+        return folded, skipped
 
     def hook_up_stack_vars(self) -> None:
         """
@@ -342,24 +483,37 @@ class TACGraph(cfg.ControlFlowGraph):
 
         return ops
 
-    def clone_ambiguous_jump_blocks(self) -> bool:
+    def clone_ambiguous_jump_blocks(self, bailout_seconds: float = -1) \
+        -> t.Tuple[bool, bool]:
         """
         If block terminates in a jump with an ambiguous (but constrained)
         jump destination, then find its most recent ancestral confluence point
         and split the path of blocks between into parallel paths, one for each
         predecessor of the block at the confluence point.
 
+        Args:
+            bailout_seconds: stop looking for further paths to split once this
+                             many seconds have elapsed. Negative means no cap.
+
         Returns:
-            True iff some block was cloned.
+            A pair of booleans: whether some block was cloned, and whether
+            cloning was cut short by the time limit.
         """
 
         split_occurred = False
+        bailed_out = False
         modified = True
         skip = set()
+        start = time.perf_counter()
 
         while modified:
             modified = False
 
+            if bailout_seconds >= 0 and time.perf_counter() - start > bailout_seconds:
+                logging.info("Block cloning bailed out after %s seconds.", bailout_seconds)
+                bailed_out = True
+                break
+
             for block in self.blocks:
 
                 if not self.__split_block_is_splittable(block, skip):
@@ -403,7 +557,7 @@ class TACGraph(cfg.ControlFlowGraph):
                 modified = True
                 split_occurred = True
 
-        return split_occurred
+        return split_occurred, bailed_out
 
     def __split_block_is_splittable(self, block, skip):
         """
@@ -619,6 +773,9 @@ class TACGraph(cfg.ControlFlowGraph):
                                 new_block.succs.append(succ)
                         del self.split_node_succs[new_block.entry]
 
+                    # Its identifier and perhaps its successors changed.
+                    self.mark_modified()
+
             # Recondition the graph, having merged everything.
             for block in self.blocks:
                 block.build_entry_stack()
@@ -685,10 +842,11 @@ class TACGraph(cfg.ControlFlowGraph):
         Returns:
             An iterable of the groups of blocks which were merged.
         """
-        reached = self.transitive_closure(origin_addresses)
+        reached = self.reached(origin_addresses)
 
         # Sort the unreached ones for more-efficient merging.
-        unreached = sorted([b for b in self.blocks if b not in reached], key=lambda b: b.entry)
+        unreached = sorted([b for i, b in enumerate(self.blocks) if not reached[i]],
+                           key=lambda b: b.entry)
         if len(unreached) == 0:
             return []
 
@@ -713,16 +871,43 @@ class TACGraph(cfg.ControlFlowGraph):
         if len(group) > 1:
             groups.append(group)
 
-        # Merge the blocks in each run.
-        merged = []
+        # Merge each run in one step, then drop all the merged blocks at once.
         for g in groups:
-            block = g[0]
-            for n in g[1:]:
-                block = self.merge_contiguous(block, n)
-            merged.append(block)
+            self.__merge_run(g)
+        self.remove_blocks(b for g in groups for b in g)
 
         return groups
 
+    def __merge_run(self, run: t.List['TACBasicBlock']) -> 'TACBasicBlock':
+        """
+        Add to the cfg the block produced by merging each block of the given
+        contiguous run into the next with merge_contiguous(), without building
+        the intermediate blocks. The run itself is left in the graph.
+        """
+        first, last = run[0], run[-1]
+        delta_stack = first.delta_stack.copy()
+        ident_suffix = first.ident_suffix
+        for b in run[1:]:
+            delta_stack.pop_many(delta_stack.empty_pops)
+            delta_stack.push_many(reversed(b.delta_stack.value))
+            ident_suffix += ident_suffix
+
+        merged = TACBasicBlock(first.entry, last.exit,
+                               [op for b in run for op in b.tac_ops],
+                               [op for b in run for op in b.evm_ops],
+                               delta_stack, self)
+        merged.entry_stack = first.entry_stack.copy()
+        merged.has_unresolved_jump = last.has_unresolved_jump
+        merged.ident_suffix = ident_suffix
+
+        self.add_block(merged)
+        for b in first.preds:
+            self.add_edge(b, merged)
+        for b in last.succs:
+            self.add_edge(merged, b)
+
+        return merged
+
     def prop_vars_between_blocks(self) -> None:
         """
         If some entry stack variable is defined in exactly one place, fetch the
@@ -730,31 +915,30 @@ class TACGraph(cfg.ControlFlowGraph):
         all occurrences of that stack variable in operations and the exit stack.
         """
 
+        # The operation at each pc of each defining block, indexed on demand.
+        def_ops = {}
+
         for block in self.blocks:
-            for i in range(len(block.entry_stack)):
-                stack = block.entry_stack
-                if stack.value[i].def_sites.is_const:
-                    # Fetch variable from def site.
-                    location = next(iter(stack.value[i].def_sites))
-                    old_var = stack.value[i]
-                    new_var = None
-                    for op in location.block.tac_ops:
-                        if op.pc == location.pc:
-                            new_var = op.lhs
-
-                    # Reassign the entry stack position.
-                    stack.value[i] = new_var
-
-                    # Reassign exit stack occurrences
-                    for j in range(len(block.exit_stack)):
-                        if block.exit_stack.value[j] is old_var:
-                            block.exit_stack.value[j] = new_var
-
-                    # Reassign occurrences on RHS of operations
-                    for o in block.tac_ops:
-                        for j in range(len(o.args)):
-                            if o.args[j].value is old_var:
-                                o.args[j].var = new_var
+            stack = block.entry_stack
+            table = None
+            for i in range(len(stack)):
+                old_var = stack.value[i]
+                if not old_var.def_sites.is_const:
+                    continue
+
+                # Fetch variable from def site.
+                location = next(iter(old_var.def_sites))
+                ops = def_ops.get(location.block)
+                if ops is None:
+                    ops = def_ops[location.block] = {op.pc: op for op in location.block.tac_ops}
+                new_var = ops[location.pc].lhs if location.pc in ops else None
+
+                # Reassign the entry stack position, then the exit stack and
+                # operation argument occurrences.
+                stack.value[i] = new_var
+                if table is None:
+                    table = VariableTable(block)
+                table.substitute(old_var, new_var)
 
     def make_stack_names_unique(self) -> None:
         """
@@ -764,33 +948,17 @@ class TACGraph(cfg.ControlFlowGraph):
         """
 
         for block in self.blocks:
-            # Group up the variables by their names
-            variables = sorted(block.entry_stack.value, key=lambda x: x.name)
-            if len(variables) == 0:
-                continue
-            groups = [[variables[0]]]
-            for i in range(len(variables))[1:]:
-                v = variables[i]
-                # When the var name in the name-sorted list changes, start a new group.
-                if v.name != variables[i - 1].name:
-                    groups.append([v])
-                else:
-                    # If the variable has already been processed, it only needs to
-                    # be renamed once.
-                    appeared = False
-                    for prev_var in groups[-1]:
-                        if v is prev_var:
-                            appeared = True
-                            break
-                    if not appeared:
-                        groups[-1].append(v)
+            # Group up the distinct variables by their names, in order of appearance.
+            groups = {}
+            for v in block.entry_stack.value:
+                groups.setdefault(v.name, {}).setdefault(id(v), v)
 
             # Actually perform the renaming operation on any groups longer than 1
-            for group in groups:
+            for group in groups.values():
                 if len(group) < 2:
                     continue
-                for i in range(len(group)):
-                    group[i].name += str(i)
+                for i, v in enumerate(group.values()):
+                    v.name += str(i)
 
     def extract_functions(self):
         """
@@ -853,6 +1021,18 @@ class TACBasicBlock(evm_cfg.EVMBasicBlock):
         from the top of the stack at entry to this block.
         """
 
+        self.exit_version = 0
+        """
+        A counter incremented whenever the exit stack may have changed, so that
+        successors can tell whether their entry stacks need rebuilding.
+        """
+
+        self.__entry_inputs = None
+        """
+        The (predecessor, exit_version) pairs the entry stack was last joined
+        from, or None if it must be rebuilt regardless.
+        """
+
         self.entry_stack = mem.VariableStack()
         """Holds the complete stack state before execution of the block."""
 
@@ -865,6 +1045,12 @@ class TACBasicBlock(evm_cfg.EVMBasicBlock):
         analysis of this block.
         """
 
+        self.__folds = {}
+        """
+        The result value and inputs of each operation as of the last time
+        apply_operations() folded it.
+        """
+
         self.cfg = cfg
         """The TACGraph to which this block belongs."""
 
@@ -913,6 +1099,26 @@ class TACBasicBlock(evm_cfg.EVMBasicBlock):
 
         return new_block
 
+    @property
+    def entry_stack(self) -> mem.VariableStack:
+        """Holds the complete stack state before execution of the block."""
+        return self.__entry_stack
+
+    @entry_stack.setter
+    def entry_stack(self, stack: mem.VariableStack) -> None:
+        self.__entry_stack = stack
+        self.__entry_inputs = None
+
+    @property
+    def exit_stack(self) -> mem.VariableStack:
+        """Holds the complete stack state after execution of the block."""
+        return self.__exit_stack
+
+    @exit_stack.setter
+    def exit_stack(self, stack: mem.VariableStack) -> None:
+        self.__exit_stack = stack
+        self.exit_version += 1
+
     @property
     def last_op(self) -> 'TACOp':
         """Return the last TAC operation in this block if it exists."""
@@ -930,6 +1136,9 @@ class TACBasicBlock(evm_cfg.EVMBasicBlock):
             self.tac_ops[-1] = op
         else:
             self.tac_ops.append(op)
+        # The last op determines whether this block is terminal.
+        if self.cfg is not None:
+            self.cfg.mark_modified()
 
     def reset_block_refs(self) -> None:
         """Update all operations and new def sites to refer to this block."""
@@ -942,18 +1151,34 @@ class TACBasicBlock(evm_cfg.EVMBasicBlock):
                 for site in op.lhs.def_sites:
                     site.block = self
 
+    def invalidate_entry_stack(self) -> None:
+        """
+        Force the next build_entry_stack() to rejoin the predecessor stacks.
+        Call this after modifying the entry stack in place.
+        """
+        self.__entry_inputs = None
+
     def build_entry_stack(self) -> bool:
         """
         Construct this block's entry stack by joining all predecessor stacks.
+        If the predecessors and their exit stack versions are unchanged since
+        the last join, the stack is left as it is.
 
         Returns:
             True iff the new stack is different from the old one.
         """
+        inputs = [(pred, pred.exit_version) for pred in self.preds]
+        old_inputs = self.__entry_inputs
+        if old_inputs is not None and len(old_inputs) == len(inputs) and \
+           all(p is q and v == w for (p, v), (q, w) in zip(old_inputs, inputs)):
+            return False
+
         old_stack = self.entry_stack
         pred_stacks = [pred.exit_stack for pred in self.preds]
         self.entry_stack = mem.VariableStack.join_all(pred_stacks)
         self.entry_stack.set_max_size(old_stack.max_size)
         self.entry_stack.metafy()
+        self.__entry_inputs = inputs
 
         return old_stack != self.entry_stack
 
@@ -1040,7 +1265,16 @@ class TACBasicBlock(evm_cfg.EVMBasicBlock):
                 for b in self.cfg.get_blocks_by_pc(d):
                     self.cfg.add_edge(self, b)
 
-            self.has_unresolved_jump = (len(non_top_vars) == 0)
+            self.__set_unresolved(len(non_top_vars) == 0)
+
+    def __set_unresolved(self, unresolved: bool) -> None:
+        """
+        Set whether this block has an unresolved jump, which gives its graph an
+        extra edge to the unresolved destination node.
+        """
+        if unresolved != self.has_unresolved_jump:
+            self.has_unresolved_jump = unresolved
+            self.cfg.mark_modified()
 
     def hook_up_jumps(self) -> bool:
         """
@@ -1119,7 +1353,7 @@ class TACBasicBlock(evm_cfg.EVMBasicBlock):
         # are invalid.
         if settings.generate_throws and invalid_jump:
             self.last_op = TACOp.convert_jump_to_throw(last_op)
-        self.has_unresolved_jump = unresolved
+        self.__set_unresolved(unresolved)
 
         for address, block_list in list(jumpdests.items()):
             to_add = [d for d in block_list if d in self.succs]
@@ -1171,7 +1405,7 @@ class TACBasicBlock(evm_cfg.EVMBasicBlock):
 
         return True
 
-    def apply_operations(self, use_sets=False) -> None:
+    def apply_operations(self, use_sets=False) -> t.Tuple[int, int]:
         """
         Propagate and fold constants through the arithmetic TAC instructions
         in this block.
@@ -1179,16 +1413,52 @@ class TACBasicBlock(evm_cfg.EVMBasicBlock):
         If use_sets is True, folding will also be done on Variables that
         possess multiple possible values, performing operations in all possible
         combinations of values.
+
+        An operation is only folded again if its arguments or their values, or
+        the value of its result, have changed since it was last folded. Since
+        a fold gives its result a new value, the operations using the result
+        are then folded again in turn.
+
+        Returns:
+            The number of operations folded, and the number skipped because
+            nothing they depend on had changed.
         """
+        folded = skipped = 0
+        changed = False
+
         for op in self.tac_ops:
+            if op.opcode != opcodes.CONST and not op.opcode.is_arithmetic():
+                continue
+
+            # Values are replaced rather than updated, so their identities
+            # serve as versions.
+            inputs = [use_sets]
+            for arg in op.args:
+                inputs += (arg.value, arg.value.value)
+            old_val = op.lhs.value
+            last = self.__folds.get(op)
+            if last is not None and last[0] is old_val and len(last[1]) == len(inputs) \
+               and all(a is b for a, b in zip(last[1], inputs)):
+                skipped += 1
+                continue
+
             if op.opcode == opcodes.CONST:
                 op.lhs.values = op.args[0].value.values
-            elif op.opcode.is_arithmetic():
-                if op.constant_args() or (op.constrained_args() and use_sets):
-                    rhs = [arg.value for arg in op.args]
-                    op.lhs.values = mem.Variable.arith_op(op.opcode.name, rhs).values
-                elif not op.lhs.is_unconstrained:
-                    op.lhs.widen_to_top()
+            elif op.constant_args() or (op.constrained_args() and use_sets):
+                rhs = [arg.value for arg in op.args]
+                op.lhs.values = mem.Variable.arith_op(op.opcode.name, rhs).values
+            elif not op.lhs.is_unconstrained:
+                op.lhs.widen_to_top()
+
+            folded += 1
+            changed |= op.lhs.value is not old_val
+            self.__folds[op] = (op.lhs.value, inputs)
+
+        # Operation results may be on the exit stack, and have changed in place.
+        if changed:
+            self.exit_version += 1
+
+        return folded, skipped
 
 
 class TACOp(patterns.Visitable):
@@ -1199,6 +1469,8 @@ class TACOp(patterns.Visitable):
     of the EVM instruction it was derived from.
     """
 
+    __slots__ = ("opcode", "args", "pc", "block")
+
     def __init__(self, opcode: opcodes.OpCode, args: t.List['TACArg'],
                  pc: int, block=None):
         """
@@ -1270,6 +1542,8 @@ class TACAssignOp(TACOp):
     this operation's result is implicitly bound.
     """
 
+    __slots__ = ("lhs", "print_name")
+
     def __init__(self, lhs: mem.Variable, opcode: opcodes.OpCode,
                  args: t.List['TACArg'], pc: int, block=None,
                  print_name: bool = True):
@@ -1323,6 +1597,8 @@ class TACArg:
     of a TACBasicBlock.
     """
 
+    __slots__ = ("var", "stack_var")
+
     def __init__(self, var: mem.Variable = None, stack_var: mem.MetaVariable = None):
         self.var = var
         """The actual variable this arg contains."""
@@ -1356,6 +1632,8 @@ class TACArg:
 class TACLocRef:
     """Contains a reference to a program counter within a particular block."""
 
+    __slots__ = ("block", "pc")
+
     def __init__(self, block, pc):
         self.block = block
         """The block that contains the referenced instruction."""
@@ -1382,6 +1660,77 @@ class TACLocRef:
         return None
 
 
+class VariableTable:
+    """
+    Dense ids for the variables used in a TACBasicBlock, with a list of the
+    uses of each: the exit stack slots and operation arguments holding it.
+    """
+
+    def __init__(self, block: TACBasicBlock):
+        """
+        Index the uses of every variable in the given block.
+
+        Args:
+          block: the block whose exit stack and operations are indexed.
+        """
+        self.block = block
+        """The block whose variable uses are indexed."""
+
+        self.ids = {}
+        """A mapping from the object id of each variable to its dense id."""
+
+        self.vars = []
+        """The variable with each dense id."""
+
+        self.exit_uses = []
+        """The exit stack slots holding each variable, by dense id."""
+
+        self.arg_uses = []
+        """The TACArgs whose value is each variable, by dense id."""
+
+        for j, var in enumerate(block.exit_stack.value):
+            self.exit_uses[self.var_id(var)].append(j)
+        for op in block.tac_ops:
+            for arg in op.args:
+                if isinstance(arg, TACArg):
+                    self.arg_uses[self.var_id(arg.value)].append(arg)
+
+    def var_id(self, var: mem.Variable) -> int:
+        """Return the dense id of the given variable, assigning one if it is new."""
+        vid = self.ids.get(id(var))
+        if vid is None:
+            vid = self.ids[id(var)] = len(self.vars)
+            self.vars.append(var)
+            self.exit_uses.append([])
+            self.arg_uses.append([])
+        return vid
+
+    def substitute(self, old_var: mem.Variable, new_var: mem.Variable) -> None:
+        """
+        Replace every use of old_var in the block with new_var, and record
+        those uses as uses of new_var.
+        """
+        vid = self.ids.get(id(old_var))
+        if vid is None or old_var is new_var:
+            return
+
+        exit_uses, self.exit_uses[vid] = self.exit_uses[vid], []
+        arg_uses, self.arg_uses[vid] = self.arg_uses[vid], []
+
+        exit_stack = self.block.exit_stack.value
+        for j in exit_uses:
+            exit_stack[j] = new_var
+        for arg in arg_uses:
+            arg.var = new_var
+
+        if new_var is not None:
+            self.exit_uses[self.var_id(new_var)].extend(exit_uses)
+        # An argument without a variable falls back to its stack variable.
+        for arg in arg_uses:
+            if arg.stack_var is not None or new_var is not None:
+                self.arg_uses[self.var_id(arg.value)].append(arg)
+
+
 class Destackifier:
     """Converts EVMBasicBlocks into corresponding TACBasicBlocks.
 
@@ -0,0 +1,93 @@
+# BSD 3-Clause License
+#
+# Copyright (c) 2016, 2017, The University of Sydney. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+
+import pytest
+
+import src.blockparse as blockparse
+import src.opcodes as opcodes
+import src.settings as settings
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+
+@pytest.fixture(params=['basic', 'basic_optimized', 'checked', 'dao_hack',
+                        'mem_leak', 'slides', 'withdraw_dao'])
+def parsed(request):
+    """
+    Returns: the blocks parsed from a file's bytecode and from its disassembly
+    """
+    settings.import_config()
+    with open(dir_path + '/data/hex/' + request.param + '.hex', 'r') as f:
+        hex_blocks = blockparse.EVMBytecodeParser(f.read().strip()).parse()
+    with open(dir_path + '/data/dasm/' + request.param + '.dasm', 'r') as f:
+        dasm_blocks = blockparse.EVMDasmParser(f).parse()
+    return hex_blocks, dasm_blocks
+
+
+class TestEVMBytecodeParser:
+
+    def test_matches_disassembly(self, parsed):
+        hex_blocks, dasm_blocks = parsed
+        assert len(hex_blocks) == len(dasm_blocks)
+        for h, d in zip(hex_blocks, dasm_blocks):
+            assert (h.entry, h.exit) == (d.entry, d.exit)
+            assert h.has_unresolved_jump == d.has_unresolved_jump
+            assert [str(op) for op in h.evm_ops] == [str(op) for op in d.evm_ops]
+            assert all(op.block is h for op in h.evm_ops)
+
+    def test_scan(self):
+        # PUSH1 0x5b; JUMPDEST; JUMP; STOP; ADD; JUMPDEST; JUMPDEST; PUSH2 0xff
+        # The push argument is not a JUMPDEST, and the last push is truncated.
+        parser = blockparse.EVMBytecodeParser("605b5b5600015b5b61ff")
+        parser.scan()
+        assert list(parser.pcs) == [0, 2, 3, 4, 5, 6, 7, 8]
+        assert list(parser.jumpdests) == [1, 5, 6]
+        assert list(parser.block_starts) == [0, 1, 3, 4, 5, 6]
+
+    def test_lazy_ops(self):
+        parser = blockparse.EVMBytecodeParser("60ff0c61ff")
+        parser.scan()
+        ops = parser._ops
+        assert len(ops) == 3
+        assert ops[0] is ops[0]
+        assert ops[0].opcode == opcodes.PUSH1 and ops[0].value == 0xff
+        assert ops[1].opcode.is_missing() and ops[1].value == 0x0c
+        assert ops[-1].opcode == opcodes.PUSH2 and ops[-1].value == 0xff
+        assert [op.pc for op in ops] == [0, 2, 3]
+
+    def test_strict(self):
+        settings.save()
+        settings.strict = True
+        try:
+            with pytest.raises(LookupError):
+                blockparse.EVMBytecodeParser("600c0c").parse()
+        finally:
+            settings.restore()
@@ -0,0 +1,105 @@
+# BSD 3-Clause License
+#
+# Copyright (c) 2016, 2017, The University of Sydney. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import pickle
+
+import pytest
+
+import src.cache as cache
+import src.exporter as exporter
+import src.settings as settings
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+
+@pytest.fixture(params=['/data/hex/basic_example.hex',
+                        '/data/hex/mem_leak.hex',
+                        '/data/regression/private_func_no_body.hex'])
+def bytecode(request):
+    """
+    Returns: the raw bytecode of a file
+    """
+    settings.import_config()
+    with open(dir_path + request.param, 'r') as f:
+        return cache.bytecode_bytes(f)
+
+
+class TestGraphCache:
+
+    def test_round_trip(self, bytecode):
+        cfg, _ = cache.analyse_bytecode(bytecode)
+        loaded = cache.loads(cache.dumps(cfg))
+        assert exporter.CFGStringExporter(loaded).export() == \
+            exporter.CFGStringExporter(cfg).export()
+        assert all(b.cfg is loaded for b in loaded.blocks)
+        assert [(op.pc, op.block.ident()) for op in loaded.tac_ops] == \
+            [(op.pc, op.block.ident()) for op in cfg.tac_ops]
+
+    def test_hit(self, bytecode, tmpdir):
+        graph_cache = cache.GraphCache(str(tmpdir))
+        first, _ = cache.analyse_bytecode(bytecode, graph_cache)
+        second, _ = cache.analyse_bytecode(bytecode.hex(), graph_cache)
+        assert (graph_cache.hits, graph_cache.misses) == (1, 1)
+        assert exporter.CFGStringExporter(first).export() == \
+            exporter.CFGStringExporter(second).export()
+
+    def test_settings_change_key(self, bytecode, tmpdir):
+        graph_cache = cache.GraphCache(str(tmpdir))
+        key = graph_cache.key(bytecode)
+        settings.save()
+        try:
+            settings.widen_threshold += 1
+            assert graph_cache.key(bytecode) != key
+        finally:
+            settings.restore()
+        assert graph_cache.key(bytecode) == key
+
+    def test_eviction(self, tmpdir):
+        settings.import_config()
+        graph_cache = cache.GraphCache(str(tmpdir))
+        old, new = bytes.fromhex("6000"), bytes.fromhex("6001")
+        cache.analyse_bytecode(old, graph_cache)
+        path = next(tmpdir.visit("*" + cache.ENTRY_EXT))
+        os.utime(str(path), (0, 0))
+
+        # Room for one entry, so storing a second evicts the older.
+        graph_cache.max_size = path.size() * 3 // 2
+        cache.analyse_bytecode(new, graph_cache)
+        assert graph_cache.get(new) is not None
+        assert graph_cache.get(old) is None
+
+    def test_unsafe_entry(self, tmpdir):
+        graph_cache = cache.GraphCache(str(tmpdir))
+        key = graph_cache.key(b"6000")
+        path = tmpdir.mkdir(key[:2]).join(key + cache.ENTRY_EXT)
+        meta = pickle.dumps(os.system)
+        path.write_binary(len(meta).to_bytes(4, "big") + meta)
+        assert graph_cache.get(b"6000") is None
+        assert not path.exists()
@@ -159,7 +159,7 @@ class TestBasicBlock:
 
 class TestControlFlowGraph:
     def test_construction(self, graph):
-        assert graph.blocks == []
+        assert graph.blocks == ()
         assert graph.root is None
 
     def test_accept(self, graph):
@@ -188,7 +188,8 @@ class TestControlFlowGraph:
         assert len(graph.edge_list()) == 0, "graph must start empty"
 
         # Add blocks to graph and build edge connections
-        graph.blocks.extend(blocks.values())
+        for b in blocks.values():
+            graph.add_block(b)
         for e_en, e_ex in edges:
             pred = blocks[e_en]
             succ = blocks[e_ex]
@@ -220,7 +221,7 @@ class TestControlFlowGraph:
             for b_prev in blocks[:i]:
                 assert str(b_prev) in str(graph)
             # add the block to the graph:
-            graph.blocks.append(b)
+            graph.add_block(b)
             # ensure its str() is in the graph's str()
             assert str(b) in str(graph)
 
@@ -228,8 +229,53 @@ class TestControlFlowGraph:
         # graph starts out empty
         assert len(graph) == len(graph.blocks) == 0
         # add a block
-        graph.blocks.append(SubBlock(1, 2))
+        graph.add_block(SubBlock(1, 2))
         assert len(graph) == len(graph.blocks) == 1
         # add another block
-        graph.blocks.append(SubBlock(3, 4))
+        graph.add_block(SubBlock(3, 4))
         assert len(graph) == len(graph.blocks) == 2
+
+    def test_remove_block(self, graph):
+        blocks = [SubBlock(i * 10, i * 10 + 9) for i in range(4)]
+        for b in blocks:
+            graph.add_block(b)
+        graph.add_edge(blocks[0], blocks[1])
+        graph.add_edge(blocks[1], blocks[2])
+        graph.add_edge(blocks[1], blocks[3])
+
+        # the blocks handed out before a removal are left as they were
+        before = graph.blocks
+        assert graph.blocks is before
+        graph.remove_block(blocks[1])
+        assert before == tuple(blocks)
+        assert graph.blocks == (blocks[0], blocks[2], blocks[3])
+        assert len(graph) == 3
+        assert blocks[0].succs == [] and blocks[2].preds == []
+
+        # the blocks can be iterated over in any order while removing them
+        for b in sorted(graph.blocks, key=lambda b: -b.entry)[1:]:
+            graph.remove_block(b)
+        assert graph.blocks == (blocks[3],)
+        assert len(graph) == 1
+
+        with pytest.raises(ValueError):
+            graph.remove_block(blocks[1])
+
+    def test_remove_unreachable_blocks(self, graph):
+        blocks = [SubBlock(i * 10, i * 10 + 9) for i in range(5)]
+        for b in blocks:
+            graph.add_block(b)
+        graph.add_edge(blocks[0], blocks[2])
+        graph.add_edge(blocks[2], blocks[4])
+        graph.add_edge(blocks[1], blocks[4])
+        graph.add_edge(blocks[3], blocks[1])
+
+        assert graph.transitive_closure([0]) == [blocks[0], blocks[2], blocks[4]]
+        assert graph.reaches(blocks[3], [blocks[4]])
+        assert not graph.reaches(blocks[4], [blocks[0], blocks[3]])
+
+        removed = graph.remove_unreachable_blocks([0])
+        assert removed == [blocks[1], blocks[3]]
+        assert graph.blocks == (blocks[0], blocks[2], blocks[4])
+        assert blocks[4].preds == [blocks[2]]
+        assert blocks[1].preds == blocks[1].succs == []
@@ -0,0 +1,101 @@
+# BSD 3-Clause License
+#
+# Copyright (c) 2016, 2017, The University of Sydney. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+
+import pytest
+
+import src.dataflow as dataflow
+import src.settings as settings
+import src.tac_cfg as tac_cfg
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+
+@pytest.fixture(scope="module",
+                params=['/data/hex/basic_example.hex',
+                        '/data/hex/dao_hack.hex'])
+def analytics(request):
+    """
+    Returns: the analytics dict produced by analysing a file
+    """
+    settings.save()
+    settings.import_config()
+    settings.analytics = True
+    try:
+        with open(dir_path + request.param, 'r') as f:
+            cfg = tac_cfg.TACGraph.from_bytecode(f.read())
+        yield dataflow.analyse_graph(cfg)
+    finally:
+        settings.restore()
+
+
+class TestAnalyticsProfile:
+
+    def test_phases_reported(self, analytics):
+        phases = analytics["phases"]
+        for name in ["stack_analysis", "clone", "merge", "unreachable", "functions"]:
+            assert name in phases
+            assert phases[name]["calls"] >= 1
+            assert phases[name]["time"] >= 0
+
+    def test_stack_iterations_counted(self, analytics):
+        assert analytics["phases"]["stack_analysis"]["iterations"] > 0
+
+    def test_folds_counted(self, analytics):
+        stats = analytics["phases"]["stack_analysis"]
+        assert stats["folds"] > 0
+        assert stats["folds_skipped"] > 0
+
+    def test_refold_skipped(self):
+        settings.import_config()
+        with open(dir_path + '/data/hex/dao_hack.hex', 'r') as f:
+            cfg = tac_cfg.TACGraph.from_bytecode(f.read())
+        dataflow.analyse_graph(cfg)
+        cfg.apply_operations()
+        folded, skipped = cfg.apply_operations()
+        assert folded == 0 and skipped > 0
+
+    def test_clone_bailout_counted(self):
+        settings.save()
+        settings.import_config()
+        settings.analytics = True
+        settings.clone_bailout_seconds = 0
+        try:
+            with open(dir_path + '/data/hex/dao_hack.hex', 'r') as f:
+                cfg = tac_cfg.TACGraph.from_bytecode(f.read())
+            stats = dataflow.analyse_graph(cfg)["phases"]["clone"]
+        finally:
+            settings.restore()
+        assert stats["bailouts"] == stats["calls"] >= 1
+
+    def test_budget(self):
+        assert not dataflow.Budget(-1).expired
+        assert dataflow.Budget(-1).remaining == float("inf")
+        assert dataflow.Budget(0).remaining <= 0
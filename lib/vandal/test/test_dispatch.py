@@ -0,0 +1,132 @@
+# BSD 3-Clause License
+#
+# Copyright (c) 2016, 2017, The University of Sydney. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+
+import pytest
+
+import src.dataflow as dataflow
+import src.dispatch as dispatch
+import src.opcodes as opcodes
+import src.settings as settings
+import src.tac_cfg as tac_cfg
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+
+def assemble(*ops) -> str:
+    """
+    Assemble the given ops into hex bytecode. Each op is an opcode name, a
+    (name, value) pair for a push, or a label ending in a colon, which marks
+    a JUMPDEST and may be used as a push value.
+    """
+    def size(op):
+        if op.endswith(":"):
+            return 1
+        return 1 + opcodes.opcode_by_name(op).push_len()
+
+    labels = {}
+    pc = 0
+    for op in ops:
+        name = op[0] if isinstance(op, tuple) else op
+        if name.endswith(":"):
+            labels[name[:-1]] = pc
+        pc += size(name)
+
+    code = bytearray()
+    for op in ops:
+        name, value = op if isinstance(op, tuple) else (op, None)
+        if name.endswith(":"):
+            code.append(opcodes.JUMPDEST.code)
+            continue
+        opcode = opcodes.opcode_by_name(name)
+        code.append(opcode.code)
+        if opcode.is_push():
+            value = labels.get(value, value)
+            code += value.to_bytes(opcode.push_len(), "big")
+    return code.hex()
+
+
+# The shape of a dispatcher from a recent solc, with a binary search.
+BINARY_SEARCH = assemble(
+    ("PUSH1", 0x80), ("PUSH1", 0x40), "MSTORE",
+    ("PUSH1", 0x04), "CALLDATASIZE", "LT", ("PUSH2", "fallback"), "JUMPI",
+    ("PUSH1", 0), "CALLDATALOAD", ("PUSH1", 0xe0), "SHR",
+    "DUP1", ("PUSH4", 0x70a08231), "GT", ("PUSH2", "upper"), "JUMPI",
+    "DUP1", ("PUSH4", 0x06fdde03), "EQ", ("PUSH2", "name"), "JUMPI",
+    "DUP1", ("PUSH4", 0x095ea7b3), "EQ", ("PUSH2", "approve"), "JUMPI",
+    ("PUSH2", "fallback"), "JUMP",
+    "upper:",
+    "DUP1", ("PUSH4", 0x70a08231), "EQ", ("PUSH2", "balance"), "JUMPI",
+    ("PUSH4", 0xa9059cbb), "DUP2", "EQ", ("PUSH2", "transfer"), "JUMPI",
+    "fallback:", ("PUSH1", 0), "DUP1", "REVERT",
+    "name:", "STOP",
+    "approve:", "STOP",
+    "balance:", "STOP",
+    "transfer:", "STOP",
+)
+
+
+@pytest.fixture(params=['basic_example', 'dao_hack', 'example_two',
+                        'multisig', 'mutual_recursion', 'withdraw_dao'])
+def bytecode(request):
+    settings.import_config()
+    with open(dir_path + '/data/hex/' + request.param + '.hex', 'r') as f:
+        return f.read().strip()
+
+
+class TestDispatch:
+
+    def test_matches_full_analysis(self, bytecode):
+        selectors = dispatch.scan_selectors(bytecode)
+        assert selectors
+
+        cfg = tac_cfg.TACGraph.from_bytecode(bytecode)
+        dataflow.analyse_graph(cfg)
+        cfg.extract_functions()
+        for f in cfg.function_extractor.public_functions:
+            if f.signature:
+                assert selectors[f.signature] == f.start_block.entry
+        assert len(selectors) == len({f.signature for f in cfg.function_extractor.public_functions
+                                      if f.signature})
+
+    def test_binary_search(self):
+        settings.import_config()
+        selectors = dispatch.scan_selectors(BINARY_SEARCH)
+        assert sorted(selectors) == ["0x6fdde03", "0x70a08231",
+                                     "0x95ea7b3", "0xa9059cbb"]
+        for sig, entry in selectors.items():
+            assert BINARY_SEARCH[2 * entry:2 * entry + 2] == "5b"
+
+    def test_unrecognised(self):
+        settings.import_config()
+        # Creation code jumps relative to the runtime code it copies.
+        with open(dir_path + '/data/hex/checked.hex', 'r') as f:
+            assert dispatch.scan_selectors(f.read().strip()) is None
+        assert dispatch.function_selectors(assemble("STOP")) == {}
@@ -0,0 +1,99 @@
+# BSD 3-Clause License
+#
+# Copyright (c) 2016, 2017, The University of Sydney. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import io
+import os
+import re
+
+import pytest
+
+import src.dataflow as dataflow
+import src.exporter as exporter
+import src.settings as settings
+import src.tac_cfg as tac_cfg
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+
+@pytest.fixture(scope="module", params=['dao_hack', 'multisig'])
+def cfg(request):
+    settings.import_config()
+    with open(dir_path + '/data/hex/' + request.param + '.hex', 'r') as f:
+        cfg = tac_cfg.TACGraph.from_bytecode(f.read())
+    dataflow.analyse_graph(cfg)
+    return cfg
+
+
+class TestCFGStringExporter:
+
+    def test_write(self, cfg):
+        out = io.StringIO()
+        exporter.CFGStringExporter(cfg).write(out)
+        assert out.getvalue() == exporter.CFGStringExporter(cfg).export()
+
+
+class TestCFGDotExporter:
+
+    @staticmethod
+    def dot(cfg, max_nodes=None):
+        out = io.StringIO()
+        exporter.CFGDotExporter(cfg, max_nodes).write(out)
+        text = out.getvalue()
+        nodes = re.findall(r'^"([^"]*)" \[', text, re.M)
+        edges = re.findall(r'^"([^"]*)" -> "([^"]*)";', text, re.M)
+        return nodes, edges
+
+    def test_uncapped(self, cfg):
+        nodes, edges = self.dot(cfg)
+        assert sorted(nodes) == sorted(b.ident() for b in cfg.blocks)
+        assert sorted(edges) == sorted((p.ident(), s.ident()) for p, s in cfg.edge_list())
+
+    def test_collapsed_chains(self, cfg):
+        nodes, edges = self.dot(cfg, max_nodes=1)
+        assert len(nodes) < len(cfg.blocks)
+
+        # Every edge of the graph either joins two nodes or lies within one.
+        node_of = {}
+        for group in exporter.CFGDotExporter(cfg, 1).node_groups():
+            for b in group:
+                node_of[b.ident()] = group[0].ident()
+            for p, s in zip(group, group[1:]):
+                assert p.succs == [s] and s.preds == [p]
+        assert set(node_of.values()) == set(nodes)
+        assert len(node_of) == len(cfg.blocks)
+        for p, s in cfg.edge_list():
+            a, b = node_of[p.ident()], node_of[s.ident()]
+            assert (a, b) in edges or (a == b and b != s.ident())
+
+
+def test_svg_to_html():
+    svg = "<?xml?>\n<!DOCTYPE svg>\n<!-- generated -->\n<svg>\n</svg>"
+    html = exporter.svg_to_html(svg)
+    assert "<svg>\n</svg>" in html
+    assert "DOCTYPE" not in html
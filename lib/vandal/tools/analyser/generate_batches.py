@@ -1,27 +1,241 @@
 #!/usr/bin/env python3
-import sys
+"""generate_batches.py: divide contracts into batches of balanced cost"""
+
+import argparse
+import csv
 import glob
-from os.path import join
+import heapq
+import json
+import re
+import sys
+from os.path import abspath, basename, dirname, getsize, join
+
+src_path = join(dirname(abspath(__file__)), "../../")
+sys.path.insert(0, src_path)
 
-if len(sys.argv) != 3:
-    print("Usage: generate_batches.py CONTRACT_DIR NUM_BATCHES", file=sys.stderr)
-    sys.exit(1)
+import src.cache as cache
+import src.normalise as normalise
+import src.opcodes as opcodes
 
 GLOB = '*_runtime.hex'
 
-CONTRACT_DIR = sys.argv[1]
-N_BATCHES = int(sys.argv[2])
+BATCH_FILE = 'batch_{}.txt'
+"""Batch i is written to the file of this name, in the current directory."""
+
+DUPLICATES_FILE = 'duplicates.txt'
+"""Duplicates left out of the batches are listed in this file."""
+
+JUMP_WEIGHT = 32
+"""
+The estimated cost of each JUMP or JUMPI, relative to one byte of bytecode.
+Jumps, which must be resolved by the decompiler, drive most of the cost of
+analysing a contract beyond its length.
+"""
+
+JUMPS = {opcodes.JUMP.code, opcodes.JUMPI.code}
+
+DEFAULT_TIMEOUT = 120
+"""
+The per-contract timeout, in seconds, assumed for contracts which timed out in
+results.jsonl files, which do not record it; the bulk analyser's default.
+"""
+
+TIMEOUT_RE = re.compile(r"TIMEOUT_\w+_(\d+(?:\.\d*)?)")
+"""Matches the timeout rows in batch_N.txt.out files, capturing the timeout."""
+
+parser = argparse.ArgumentParser(
+    description="Divide the contracts in CONTRACT_DIR/{} into NUM_BATCHES "
+                "batches, each written to {}, so that the batches take as "
+                "close to the same time to analyse as possible."
+                .format(GLOB, BATCH_FILE.format("N")))
+
+parser.add_argument("contract_dir",
+                    metavar="CONTRACT_DIR",
+                    help="the directory to read contracts from.")
+
+parser.add_argument("num_batches",
+                    type=int,
+                    metavar="NUM_BATCHES",
+                    help="the number of batches to divide the contracts into.")
+
+parser.add_argument("-H",
+                    "--history",
+                    nargs="*",
+                    default=[],
+                    metavar="FILE",
+                    help="estimate costs from the timings in these previous "
+                         "results: batch_N.txt.out files written by "
+                         "run_all.sh, or results.jsonl files written by the "
+                         "bulk analyser.")
+
+parser.add_argument("-T",
+                    "--timeout",
+                    type=float,
+                    default=DEFAULT_TIMEOUT,
+                    metavar="SECONDS",
+                    help="the per-contract timeout the results.jsonl files "
+                         "given with -H were produced with (default: {})."
+                         .format(DEFAULT_TIMEOUT))
+
+parser.add_argument("-d",
+                    "--dedup",
+                    choices=["none", "identical", "exact", "structural"],
+                    default="identical",
+                    help="analyse only one of each set of duplicate contracts, "
+                         "listing the others in {}. 'identical' duplicates "
+                         "have the same bytecode; 'exact' duplicates may also "
+                         "differ in their compiler metadata; 'structural' "
+                         "duplicates may also differ in their large constants "
+                         "(default: identical).".format(DUPLICATES_FILE))
+
+
+def estimate_cost(code: bytes) -> int:
+    """
+    Estimate the cost of analysing a contract from its bytecode: its length,
+    plus a fixed weight for each JUMP and JUMPI.
+    """
+    push_len = opcodes.PUSH_LEN
+    jumps = 0
+    pc, size = 0, len(code)
+    while pc < size:
+        byte = code[pc]
+        if byte in JUMPS:
+            jumps += 1
+        pc += 1 + push_len[byte]
+    return size + JUMP_WEIGHT * jumps
+
+
+def read_timings(filenames, timeout: float = DEFAULT_TIMEOUT) -> dict:
+    """
+    Read the time taken to analyse each contract from previous results, as
+    a mapping from contract file basename to seconds. Contracts which timed
+    out are given their timeout, as a lower bound on their time; contracts
+    which failed otherwise have no timing.
+
+    Args:
+      filenames: batch_N.txt.out or results.jsonl files.
+      timeout: the per-contract timeout of the results.jsonl files.
+    """
+    timings = {}
+
+    def record(name, seconds, bound=False):
+        # Later timings replace earlier ones, but a lower bound only raises them.
+        timings[name] = max(seconds, timings.get(name, 0)) if bound else seconds
+
+    for filename in filenames:
+        with open(filename) as f:
+            if filename.endswith(".jsonl"):
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    try:
+                        name, _, meta, analytics = json.loads(line)[:4]
+                    except ValueError:
+                        continue
+                    if "TIMEOUT" in meta:
+                        record(basename(name), timeout, bound=True)
+                    elif "decomp_time" in analytics and "souffle_time" in analytics:
+                        # In batched results, one datalog run covers the batch.
+                        record(basename(name), analytics["decomp_time"] +
+                               analytics["souffle_time"] / analytics.get("batch_size", 1))
+            else:
+                for row in csv.reader(f):
+                    if len(row) < 2:
+                        continue
+                    match = TIMEOUT_RE.fullmatch(row[1])
+                    if match is not None:
+                        record(row[0], float(match.group(1)), bound=True)
+                        continue
+                    try:
+                        record(row[0], float(row[1]) + float(row[2]))
+                    except (IndexError, ValueError):
+                        continue
+    return timings
+
+
+def partition(costs: dict, n: int) -> list:
+    """
+    Divide the given contracts into n batches of near-equal total cost, by
+    assigning them in descending order of cost, each to the batch with the
+    least cost so far (longest processing time first).
+
+    Args:
+      costs: a mapping from each contract to its estimated cost.
+      n: the number of batches.
+
+    Returns:
+      A list of n (total cost, contracts) pairs.
+    """
+    heap = [(0, i) for i in range(n)]
+    batches = [[] for _ in range(n)]
+    totals = [0] * n
+    for name in sorted(costs, key=lambda c: (-costs[c], c)):
+        total, i = heapq.heappop(heap)
+        batches[i].append(name)
+        totals[i] = total + costs[name]
+        heapq.heappush(heap, (totals[i], i))
+    return list(zip(totals, batches))
+
+
+def main():
+    args = parser.parse_args()
+    if args.num_batches < 1:
+        parser.error("NUM_BATCHES must be positive.")
+
+    files = sorted(glob.glob(join(args.contract_dir, GLOB)))
+
+    estimates = {}
+    duplicates = []
+    fingerprints = {}
+    for fname in files:
+        try:
+            with open(fname) as f:
+                code = cache.bytecode_bytes(f)
+        except (OSError, ValueError) as e:
+            # Leave the analyser to report it, estimating its cost by its size.
+            print("Could not read {}: {}".format(fname, e), file=sys.stderr)
+            try:
+                estimates[fname] = getsize(fname) // 2
+            except OSError:
+                estimates[fname] = 0
+            continue
+        if args.dedup != "none":
+            fp = normalise.fingerprint(code, canonicalise=args.dedup == "structural",
+                                       strip=args.dedup != "identical")
+            if fp in fingerprints:
+                duplicates.append((fname, fingerprints[fp]))
+                continue
+            fingerprints[fp] = fname
+        estimates[fname] = estimate_cost(code)
+
+    # Where timings are known, use them, scaled into estimated cost units by
+    # the ratio of estimated cost to time over the contracts with timings.
+    costs = estimates
+    timings = read_timings(args.history, args.timeout)
+    timed = [f for f in estimates if basename(f) in timings]
+    seconds = sum(timings[basename(f)] for f in timed)
+    if seconds > 0:
+        scale = sum(estimates[f] for f in timed) / seconds
+        costs = {f: timings[basename(f)] * scale if basename(f) in timings else c
+                 for f, c in estimates.items()}
+        print("Using timings for {} of {} contracts.".format(len(timed), len(costs)),
+              file=sys.stderr)
 
-files = glob.glob(join(CONTRACT_DIR, GLOB))
+    batches = partition(costs, args.num_batches)
+    for i, (total, b) in enumerate(batches):
+        with open(BATCH_FILE.format(i), 'w') as f:
+            for fname in b:
+                print(fname, file=f)
+        print("{}: {} contracts, cost {:.0f}".format(BATCH_FILE.format(i), len(b), total),
+              file=sys.stderr)
 
-batches = [[] for x in range(N_BATCHES)]
+    if duplicates:
+        with open(DUPLICATES_FILE, 'w') as f:
+            for fname, original in duplicates:
+                print(fname, original, file=f)
+        print("Left {} duplicate contracts out, listed in {}."
+              .format(len(duplicates), DUPLICATES_FILE), file=sys.stderr)
 
-i = 0
-while len(files) > 0:
-    batches[i % N_BATCHES].append(files.pop())
-    i += 1
 
-for i, b in enumerate(batches):
-    with open('batch_{}.txt'.format(i), 'w') as f:
-        for fname in b:
-            print(fname, file=f)
+if __name__ == "__main__":
+    main()
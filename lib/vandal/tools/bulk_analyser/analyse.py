@@ -41,10 +41,15 @@ import os
 import re
 import subprocess
 import sys
+import shutil
 import signal
+import tempfile
 import time
+import typing as t
 import sys
-from multiprocessing import Process, SimpleQueue, Manager, Event
+from collections import deque
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait
 from os.path import abspath, dirname, join
 
 # Add the source directory to the path to ensure the imports work
@@ -52,10 +57,13 @@ src_path = join(dirname(abspath(__file__)), "../../")
 sys.path.insert(0, src_path)
 
 # Local project imports
+import src.cache as cache
 import src.dataflow as dataflow
+import src.datalog as datalog
 import src.tac_cfg as tac_cfg
 import src.opcodes as opcodes
 import src.exporter as exporter
+import src.normalise as normalise
 import src.settings as settings
 
 ## Constants
@@ -66,15 +74,27 @@ DEFAULT_SOUFFLE_BIN = '../../../souffle/src/souffle'
 DEFAULT_CONTRACT_DIR = 'contracts'
 """Directory to fetch contract files from by default."""
 
-DEFAULT_RESULTS_FILE = 'results.json'
-"""File to write results to by default."""
+DEFAULT_RESULTS_FILE = 'results.jsonl'
+"""File to write results to by default, one JSON result per line."""
 
 DEFAULT_SPEC_DL = '../../datalog/demo_analyses.dl'
 """Vulnerability specification file."""
 
-TEMP_WORKING_DIR = ".temp"
+TMPFS_DIR = "/dev/shm"
+"""A memory-backed filesystem to hold the working directory, if available."""
+
+if os.path.isdir(TMPFS_DIR) and os.access(TMPFS_DIR, os.W_OK):
+    TEMP_WORKING_DIR = join(TMPFS_DIR, "vandal-{}".format(os.getpid()))
+else:
+    TEMP_WORKING_DIR = ".temp"
 """Scratch working directory."""
 
+SOUFFLE_EXE = join(TEMP_WORKING_DIR, "analysis")
+"""Location of the executable produced when the spec is compiled."""
+
+BATCH_SPEC = join(TEMP_WORKING_DIR, "batch.dl")
+"""Location of the batched version of the spec, in batched datalog mode."""
+
 DEFAULT_TIMEOUT = 120
 """Default time before killing analysis of a contract."""
 
@@ -87,8 +107,11 @@ DEFAULT_BAILOUT = -1
 DEFAULT_PATTERN = ".*runtime.hex"
 """Default filename pattern for contract files."""
 
-FLUSH_PERIOD = 3
-"""Wait a little to flush the files and join the processes when concluding."""
+TIMEOUT_GRACE = 5
+"""
+Seconds a contract may run beyond its timeout before its worker is killed and
+replaced. This gives Souffle's own timeout a chance to fire first.
+"""
 
 DOMINATORS = True
 """Whether or not the cfg relations should include dominators"""
@@ -99,6 +122,12 @@ OPCODES = ["CALL", "JUMPI" ,"SSTORE" ,"SLOAD" ,"MLOAD" ,"MSTORE"]
 DEFAULT_NUM_JOBS = 4
 """The number of subprocesses to run at once."""
 
+DEFAULT_BATCH_SIZE = 4
+"""The number of contracts handed to a worker at a time."""
+
+DEFAULT_CACHE_SIZE = cache.DEFAULT_MAX_SIZE // 1024 ** 2
+"""Default maximum size of the decompiled graph cache, in megabytes."""
+
 # Command Line Arguments
 
 parser = argparse.ArgumentParser(
@@ -121,11 +150,20 @@ parser.add_argument("-S",
                     metavar="BINARY",
                     help="the location of the souffle binary.")
 
+parser.add_argument("-E",
+                    "--backend",
+                    choices=["souffle", "python"],
+                    default="souffle",
+                    help="evaluate the datalog spec with Souffle, or with "
+                         "the slower built-in evaluator, which needs no "
+                         "Souffle installation.")
+
 parser.add_argument("-M",
                     "--compile_souffle",
                     action="store_true",
                     default=False,
-                    help="compile souffle step.")
+                    help="compile the datalog spec to an executable once, "
+                         "and run that on every contract.")
 
 parser.add_argument("-p",
                     "--filename_pattern",
@@ -144,6 +182,13 @@ parser.add_argument("-r",
                     metavar="FILE",
                     help="the location to write the results.")
 
+parser.add_argument("-R",
+                    "--resume",
+                    action="store_true",
+                    default=False,
+                    help="Append to an existing results file, skipping the "
+                         "contracts it already contains.")
+
 parser.add_argument("-f",
                     "--from_file",
                     nargs="?",
@@ -162,6 +207,24 @@ parser.add_argument("-j",
                     metavar="NUM",
                     help="The number of subprocesses to run at once.")
 
+parser.add_argument("-b",
+                    "--batch_size",
+                    type=int,
+                    nargs="?",
+                    default=DEFAULT_BATCH_SIZE,
+                    const=DEFAULT_BATCH_SIZE,
+                    metavar="NUM",
+                    help="The number of contracts handed to a worker "
+                         "process at a time.")
+
+parser.add_argument("-B",
+                    "--batch_datalog",
+                    action="store_true",
+                    default=False,
+                    help="Analyse each batch of contracts with a single run "
+                         "of the datalog spec, rewritten so that every "
+                         "relation is tagged with a contract id.")
+
 parser.add_argument("-n",
                     "--num_contracts",
                     type=int,
@@ -232,6 +295,35 @@ parser.add_argument("-t",
                          "precise. A negative value means no cap on the "
                          "running time. No cap by default.")
 
+parser.add_argument("-G",
+                    "--cache_dir",
+                    nargs="?",
+                    default=None,
+                    metavar="DIR",
+                    help="cache analysed graphs in the given directory, and "
+                         "reuse them for contracts with identical bytecode "
+                         "analysed under the same settings.")
+
+parser.add_argument("-Z",
+                    "--cache_size",
+                    type=int,
+                    nargs="?",
+                    default=DEFAULT_CACHE_SIZE,
+                    const=DEFAULT_CACHE_SIZE,
+                    metavar="MB",
+                    help="the maximum size of the graph cache in megabytes; "
+                         "least recently used graphs are evicted beyond this.")
+
+parser.add_argument("-D",
+                    "--dedup",
+                    choices=["exact", "structural"],
+                    default=None,
+                    help="analyse only one contract from each group of "
+                         "duplicates, and copy its results to the others. "
+                         "'exact' duplicates differ only in their compiler "
+                         "metadata; 'structural' duplicates may also differ "
+                         "in large embedded constants such as addresses.")
+
 parser.add_argument("-q",
                     "--quiet",
                     action="store_true",
@@ -297,49 +389,32 @@ def empty_working_dir(index) -> None:
             os.remove(join(d_triple[0], fname))
 
 
-def analyse_contract(job_index: int, index: int, filename: str, result_queue, timeout: int) -> None:
+def analyse_contract(job_index: int, index: int, filename: str, timeout: int) -> tuple:
     """
-    Perform dataflow analysis on a contract, storing the result in the queue.
-    This is a worker function to be passed to a subprocess.
+    Perform dataflow analysis on a contract, returning the result as a
+    (filename, vulns, meta, analytics) quadruple.
 
     Args:
-        job_index: the job number for this invocation of analyse_contract
+        job_index: the job number of the worker running this analysis
         index: the number of the particular contract being analysed
         filename: the location of the contract bytecode file to process
-        result_queue: a multiprocessing queue in which to store the analysis results
+        timeout: the number of seconds after which to abandon the analysis
     """
-    global souffle_proc
+    souffle_start = None
     try:
         with open(join(args.contract_dir, filename)) as file:
             # Decompile and perform dataflow analysis upon the given graph
             decomp_start = time.time()
-            cfg = tac_cfg.TACGraph.from_bytecode(file)
-            analytics = dataflow.analyse_graph(cfg)
-
-            # Export relations to temp working directory
-            empty_working_dir(job_index)
-            work_dir = working_dir(job_index)
-            out_dir = working_dir(job_index, True)
-            exporter.CFGTsvExporter(cfg).export(output_dir=work_dir,
-                                                dominators=DOMINATORS,
-                                                out_opcodes=OPCODES)
-
-            # Run souffle on those relations
+            cfg, analytics = cache.analyse_bytecode(file, graph_cache)
+
+            # Generate relations in memory
+            facts = exporter.CFGTsvExporter(cfg).facts(dominators=DOMINATORS,
+                                                       out_opcodes=OPCODES)
+
+            # Run the spec on those relations, for whatever time remains
             souffle_start = time.time()
-            souffle_args = [args.souffle_bin, "--fact-dir={}".format(work_dir),
-                            "--output-dir={}".format(out_dir),
-                            args.spec.name]
-            if args.compile_souffle:
-                souffle_args.append("--compile")
-            souffle_proc = subprocess.Popen(souffle_args)
-            souffle_proc.communicate(timeout=timeout)
-
-            # Collect the results and put them in the result queue
-            vulns = []
-            for fname in os.listdir(out_dir):
-                fpath = join(out_dir, fname)
-                if os.path.getsize(fpath) != 0:
-                    vulns.append(fname.split(".")[0])
+            outputs = run_spec(job_index, facts, timeout - (souffle_start - decomp_start))
+            vulns = [rel for rel, tuples in outputs.items() if tuples]
 
             meta = []
             if cfg.has_unresolved_jump:
@@ -355,35 +430,339 @@ def analyse_contract(job_index: int, index: int, filename: str, result_queue, ti
             analytics["decomp_time"] = decomp_time
             analytics["souffle_time"] = souffle_time
 
-            result_queue.put((filename, vulns, meta, analytics))
+            return filename, vulns, meta, analytics
 
-    except subprocess.TimeoutExpired as e:
-        souffle_proc.terminate()
-        log("{} timed out after {} secs (limit {} secs).".format(filename,
-            time.time() - souffle_start, e.timeout))
-        res_queue.put((filename, [], ["TIMEOUT"], {}))
+    except (subprocess.TimeoutExpired, datalog.EvaluationTimeout):
+        log("{} timed out after {:.2f} secs (limit {} secs).".format(filename,
+            time.time() - souffle_start, timeout))
+        return filename, [], ["TIMEOUT"], {}
 
     except Exception as e:
         log("Error ({}): {}".format(filename, e))
-        result_queue.put((filename, [], ["error"], {}))
+        return filename, [], ["error"], {}
+
 
+def analyse_batch(job_index: int, batch: list, timeout: int) -> t.List[tuple]:
+    """
+    Perform dataflow analysis on a batch of contracts with a single run of
+    the batched datalog program, returning a list of
+    (filename, vulns, meta, analytics) quadruples.
+
+    Each contract's facts for the relations in scoped_relations are tagged
+    with its position in the batch, which identifies the contract in those
+    output relations. Output relations which are not scoped to a contract
+    cannot be attributed to one, and are reported for the whole batch.
 
-def flush_queue(period, run_sig,
-                result_queue, result_list):
+    Args:
+        job_index: the job number of the worker running this analysis
+        batch: a list of (index, filename) pairs of the contracts to analyse
+        timeout: the number of seconds after which to abandon the analysis
+    """
+    results = {}
+    analysed = []
+    facts = {}
+    decomp_start = time.time()
+    for cid, (index, filename) in enumerate(batch):
+        try:
+            with open(join(args.contract_dir, filename)) as file:
+                start = time.time()
+                cfg, analytics = cache.analyse_bytecode(file, graph_cache)
+                contract_facts = {}
+                for rel, text in exporter.CFGTsvExporter(cfg).facts(
+                        dominators=DOMINATORS, out_opcodes=OPCODES).items():
+                    if rel.split(".")[0] in scoped_relations:
+                        text = "".join("{}\t{}\n".format(cid, line)
+                                       for line in text.splitlines())
+                    elif text and not text.endswith("\n"):
+                        text += "\n"
+                    contract_facts[rel] = text
+        except Exception as e:
+            log("Error ({}): {}".format(filename, e))
+            results[filename] = (filename, [], ["error"], {})
+            continue
+
+        # Only a contract whose facts were all exported joins the batch.
+        for rel, text in contract_facts.items():
+            facts[rel] = facts.get(rel, "") + text
+
+        analytics["decomp_time"] = time.time() - start
+        meta = ["unresolved"] if cfg.has_unresolved_jump else []
+        analysed.append((str(cid), index, filename, meta, analytics))
+
+    if not analysed:
+        return [results[f] for _, f in batch]
+
+    souffle_start = time.time()
+    try:
+        outputs = run_spec(job_index, facts, timeout - (souffle_start - decomp_start))
+    except Exception as e:
+        timeouts = (subprocess.TimeoutExpired, datalog.EvaluationTimeout)
+        reason = "TIMEOUT" if isinstance(e, timeouts) else "error"
+        log("Batch of {} contracts failed ({}): {}".format(len(batch), reason, e))
+        for _, _, filename, _, _ in analysed:
+            results[filename] = (filename, [], [reason], {})
+        return [results[f] for _, f in batch]
+
+    # Demultiplex the output tuples by their contract id.
+    found = {}
+    unscoped = []
+    for rel, tuples in outputs.items():
+        if rel not in scoped_relations:
+            if tuples:
+                unscoped.append(rel)
+            continue
+        for row in tuples:
+            found.setdefault(row[0], set()).add(rel)
+    if unscoped:
+        log("Batch of {} contracts: {} not attributable to a contract.".format(
+            len(batch), ", ".join(sorted(unscoped))))
+
+    souffle_time = time.time() - souffle_start
+    for cid, index, filename, meta, analytics in analysed:
+        log("{}: {:.20}... completed in {:.2f} + {:.2f} secs (batch of {})".format(
+            index, filename, analytics["decomp_time"], souffle_time, len(batch)))
+        analytics["souffle_time"] = souffle_time
+        analytics["batch_size"] = len(batch)
+        if unscoped:
+            analytics["batch_outputs"] = sorted(unscoped)
+        results[filename] = (filename, sorted(found.get(cid, [])), meta, analytics)
+
+    return [results[f] for _, f in batch]
+
+
+def run_spec(job_index: int, facts: t.Dict[str, str],
+             timeout: float) -> t.Dict[str, t.List[t.List[str]]]:
     """
-    For flushing the queue periodically to a list so it doesn't fill up.
+    Run the datalog spec on the given facts with the selected backend, and
+    return a mapping from each output relation to its list of tuples.
 
     Args:
-        period: flush the result_queue to result_list every period seconds
-        run_sig: terminate when the Event run_sig is cleared.
-        result_queue: the queue in which results accumulate before being flushed
-        result_list: the final list of results.
+        job_index: the job number whose working directory Souffle may use
+        facts: a mapping from .facts file names to their contents
+        timeout: seconds to allow the analysis to run; at least one is allowed
+
+    Raises:
+        subprocess.TimeoutExpired: if Souffle does not finish in time.
+        datalog.EvaluationTimeout: if the built-in evaluator does not finish
+                                   in time.
     """
-    while run_sig.is_set():
-        time.sleep(period)
-        while not result_queue.empty():
-            item = result_queue.get()
-            result_list.append(item)
+    global souffle_proc
+    if args.backend == "python":
+        outputs = spec_program.evaluate(spec_program.load_facts(facts),
+                                        max(timeout, 1))
+        return {rel: [[str(v) for v in tup] for tup in tuples]
+                for rel, tuples in outputs.items()}
+
+    empty_working_dir(job_index)
+    work_dir = working_dir(job_index)
+    out_dir = working_dir(job_index, True)
+    exporter.write_facts(facts, work_dir)
+    if args.compile_souffle:
+        souffle_args = [SOUFFLE_EXE, "--facts={}".format(work_dir),
+                        "--output={}".format(out_dir)]
+    else:
+        souffle_args = [args.souffle_bin,
+                        "--fact-dir={}".format(work_dir),
+                        "--output-dir={}".format(out_dir),
+                        spec_path]
+    souffle_proc = subprocess.Popen(souffle_args)
+    try:
+        souffle_proc.communicate(timeout=max(timeout, 1))
+    except subprocess.TimeoutExpired:
+        souffle_proc.terminate()
+        souffle_proc.wait()
+        raise
+    finally:
+        souffle_proc = None
+
+    outputs = {}
+    for fname in os.listdir(out_dir):
+        with open(join(out_dir, fname)) as f:
+            outputs[fname.split(".")[0]] = [line.rstrip("\n").split("\t")
+                                            for line in f if line.strip()]
+    return outputs
+
+
+def worker(job_index: int, conn) -> None:
+    """
+    The body of a long-lived worker process. Repeatedly receive a batch of
+    (index, filename) pairs from the main process and analyse each contract,
+    until a None batch is received.
+
+    The worker sends ("start", filenames, secs) before analysing some of its
+    contracts within the given number of seconds, ("result", result) as each
+    one finishes, and ("ready",) when it wants a new batch. In batched datalog
+    mode, the whole batch is analysed at once.
+
+    Args:
+        job_index: the job number of this worker, selecting its working directory
+        conn: this worker's end of a pipe to the main process
+    """
+    conn.send(("ready",))
+    while True:
+        batch = conn.recv()
+        if batch is None:
+            break
+        if args.batch_datalog:
+            timeout = args.timeout_secs * len(batch)
+            conn.send(("start", [fname for _, fname in batch], timeout))
+            for result in analyse_batch(job_index, batch, timeout):
+                conn.send(("result", result))
+        else:
+            for index, fname in batch:
+                conn.send(("start", [fname], args.timeout_secs))
+                conn.send(("result", analyse_contract(job_index, index, fname,
+                                                      args.timeout_secs)))
+        conn.send(("ready",))
+
+
+def start_worker(job_index: int) -> dict:
+    """
+    Start a worker process using the working directory for job_index, and
+    return a dict tracking its state.
+    """
+    empty_working_dir(job_index)
+    conn, worker_conn = Pipe()
+    proc = Process(target=worker, args=(job_index, worker_conn))
+    proc.start()
+    worker_conn.close()
+    return {"job_index": job_index,
+            "proc": proc,
+            "conn": conn,
+            "batch": [],
+            "names": [],
+            "deadline": None}
+
+
+def contract_fingerprint(filename: str) -> t.Optional[str]:
+    """
+    Return the fingerprint of a contract used to detect duplicates, according
+    to the requested dedup mode, or None if the contract can't be read.
+
+    Args:
+        filename: the location of the contract bytecode file to fingerprint
+    """
+    try:
+        with open(join(args.contract_dir, filename)) as file:
+            code = cache.bytecode_bytes(file)
+    except (OSError, ValueError):
+        return None
+    return normalise.fingerprint(code, canonicalise=args.dedup == "structural")
+
+
+def contract_batches(contracts) -> t.Iterator[list]:
+    """
+    Generate batches of (index, filename) pairs to be analysed from the given
+    enumeration of contract filenames, skipping those already done and
+    duplicates if requested.
+    """
+    batch = []
+    for index, fname in contracts:
+        if fname in done:
+            if args.dedup is not None:
+                fp = contract_fingerprint(fname)
+                if fp is not None:
+                    fingerprints.setdefault(fp, fname)
+            continue
+        if args.dedup is not None:
+            fp = contract_fingerprint(fname)
+            if fp in fingerprints:
+                duplicates[fname] = fingerprints[fp]
+                continue
+            if fp is not None:
+                fingerprints[fp] = fname
+        batch.append((index, fname))
+        if len(batch) >= args.batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def resume_results(filename: str) -> int:
+    """
+    Tally the results already in the given results file and mark their
+    contracts as done. A trailing partial line, as left by an interrupted run,
+    is truncated away so that new results can be appended. Lines which cannot
+    be read are logged and dropped, so their contracts are analysed again.
+
+    Returns:
+        The number of results read.
+    """
+    if not os.path.exists(filename):
+        return 0
+
+    end = 0
+    corrupt = []
+    with open(filename, 'rb+') as f:
+        for i, line in enumerate(f):
+            if not line.endswith(b"\n"):
+                break
+            try:
+                result = json.loads(line.decode())
+                tally_result(result)
+            except (ValueError, TypeError) as e:
+                logging.warning("Dropping unreadable result on line %s of %s: %s",
+                                i + 1, filename, e)
+                corrupt.append(i)
+            else:
+                done.add(result[0])
+            end += len(line)
+        f.truncate(end)
+
+    if corrupt:
+        drop = set(corrupt)
+        with open(filename, 'rb') as f, \
+             tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(filename)),
+                                         delete=False) as out:
+            out.writelines(line for i, line in enumerate(f) if i not in drop)
+        os.replace(out.name, filename)
+    return len(done)
+
+
+def tally_result(result: list) -> None:
+    """
+    Tally the categories of a (filename, vulns, meta, analytics) result.
+    """
+    global total
+    global total_flagged
+    filename, vulns, meta, _ = result
+
+    total += 1
+    if len(vulns + meta) > 0:
+        total_flagged += 1
+    for res in vulns + meta:
+        counts[res] = counts.get(res, 0) + 1
+
+    if args.dedup is not None:
+        summaries[filename] = (vulns, meta)
+
+
+def record_result(result: tuple) -> None:
+    """
+    Append a (filename, vulns, meta, analytics) result to the results file as
+    a single line, and tally its categories. The file is flushed so that an
+    interrupted run loses nothing that has already finished.
+    """
+    results_file.write(json.dumps(result) + "\n")
+    results_file.flush()
+    tally_result(result)
+
+
+def retire_worker(w: dict, reason: str) -> None:
+    """
+    Kill a worker that has timed out or died, recording the contracts it was
+    analysing as failed for the given reason, and requeueing the rest of its
+    batch. A fresh worker takes its place.
+    """
+    w["proc"].terminate()
+    w["proc"].join()
+    w["conn"].close()
+    for name in w["names"]:
+        record_result((name, [], [reason], {}))
+    if w["batch"]:
+        requeued.appendleft(w["batch"])
+    workers[w["job_index"]] = start_worker(w["job_index"])
 
 
 # Main Body
@@ -399,12 +778,17 @@ if args.config is not None:
 settings.max_iterations = args.max_iter
 settings.bailout_seconds = args.bail_time
 # Force analytics to be turned on.
-settings.collect_analytics = True
+settings.analytics = True
 
 log_level = logging.WARNING if args.quiet else logging.INFO + 1
 log = lambda msg: logging.log(logging.INFO + 1, msg)
 logging.basicConfig(format='%(message)s', level=log_level)
 
+graph_cache = None
+if args.cache_dir is not None:
+    log("Using graph cache {}.".format(args.cache_dir))
+    graph_cache = cache.GraphCache(args.cache_dir, args.cache_size * 1024 ** 2)
+
 log("Setting up working directory {}.".format(TEMP_WORKING_DIR))
 for i in range(args.jobs):
     os.makedirs(working_dir(i, True), exist_ok=True)
@@ -413,6 +797,32 @@ for i in range(args.jobs):
 log("Reading TSV settings.")
 acquire_tsv_settings()
 
+spec_path = args.spec.name
+scoped_relations = set()
+if args.batch_datalog:
+    spec_path = BATCH_SPEC
+    log("Writing batched datalog spec to {}.".format(spec_path))
+    with open(spec_path, 'w') as f:
+        f.write(datalog.batch_program(args.spec.name))
+    scoped_relations = datalog.contract_relations(
+        datalog.read_program(args.spec.name))
+
+if args.backend == "python":
+    log("Parsing {}.".format(spec_path))
+    if args.batch_datalog:
+        spec_program = datalog.Program(datalog.batch_program(args.spec.name))
+    else:
+        spec_program = datalog.Program.from_file(spec_path)
+elif args.compile_souffle:
+    log("Compiling {} to {}.".format(spec_path, SOUFFLE_EXE))
+    try:
+        subprocess.run([args.souffle_bin, "--dl-program={}".format(SOUFFLE_EXE),
+                        spec_path], check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        log("Could not compile {}: {}".format(spec_path, e))
+        shutil.rmtree(TEMP_WORKING_DIR)
+        sys.exit(1)
+
 # Extract contract filenames.
 log("Processing contract names.")
 if args.from_file:
@@ -434,35 +844,33 @@ runtime_files = filter(lambda filename: pattern.match(filename) is not None,
 stop_index = None if args.num_contracts is None else args.skip + args.num_contracts
 to_process = itertools.islice(runtime_files, args.skip, stop_index)
 
-log("Setting up workers.")
-# Set up multiprocessing result list and queue.
-manager = Manager()
+# Map contract fingerprints to the first contract analysed with that
+# fingerprint, and duplicate contracts to that contract.
+fingerprints = {}
+duplicates = {}
 
-# This list contains analysis results as
-# (filename, category, meta, analytics) quadruples.
-res_list = manager.list()
+# Contracts whose results were read from a previous run.
+done = set()
 
-# Holds results transiently before flushing to res_list
-res_queue = SimpleQueue()
+# Batches handed back by workers that were killed before finishing them.
+requeued = deque()
+batches = contract_batches(enumerate(to_process))
 
-# Start the periodic flush process, only run while run_signal is set.
-run_signal = Event()
-run_signal.set()
-flush_proc = Process(target=flush_queue, args=(FLUSH_PERIOD, run_signal,
-                                               res_queue, res_list))
-flush_proc.start()
+# Results are tallied as they are streamed to disk.
+counts = {}
+total = 0
+total_flagged = 0
 
-workers = []
-avail_jobs = list(range(args.jobs))
-contract_iter = enumerate(to_process)
-contracts_exhausted = False
+# The vulns and meta of each analysed contract when deduplicating, for copying
+# to the contracts that duplicate it.
+summaries = {}
 
-# Track the souffle process started by the current fork so we can kill it in
+# Track the souffle process started by the current worker so we can kill it in
 # the signal handler.
 souffle_proc = None
 
-# Register signal handler for current fork so it will DIE like it should upon
-# receiving SIGINT or SIGTERM.
+# Register signal handler so that workers (which inherit it) DIE like they
+# should upon receiving SIGINT or SIGTERM, and the main process cleans up.
 def handle_signal(signal, frame):
     global souffle_proc
     log("Terminating!")
@@ -474,80 +882,81 @@ def handle_signal(signal, frame):
 signal.signal(signal.SIGINT, handle_signal)
 signal.signal(signal.SIGTERM, handle_signal)
 
+if args.resume:
+    log("Resuming from {} results in {}.".format(resume_results(args.results_file),
+                                                 args.results_file))
+results_file = open(args.results_file, 'a' if args.resume else 'w')
+
+log("Setting up workers.")
+workers = {i: start_worker(i) for i in range(args.jobs)}
+
 log("Analysing...\n")
 try:
-    while not contracts_exhausted:
-        # If there's both workers and contracts available, use the former to work on the latter.
-        while not contracts_exhausted and len(avail_jobs) > 0:
+    while workers:
+        # Sleep until a worker has something to say, or the earliest running
+        # contract runs out of time.
+        deadlines = [w["deadline"] for w in workers.values() if w["names"]]
+        wait_time = max(min(deadlines) - time.time(), 0) if deadlines else None
+        ready = wait([w["conn"] for w in workers.values()], wait_time)
+
+        for w in list(workers.values()):
+            if w["conn"] not in ready:
+                continue
             try:
-                index, fname = next(contract_iter)
-                job_index = avail_jobs.pop()
-                proc = Process(
-                        target=analyse_contract,
-                        args=(job_index, index, fname, res_queue, args.timeout_secs))
-                proc.start()
-                start_time = time.time()
-                workers.append({"name": fname,
-                                "proc": proc,
-                                "time": start_time,
-                                "job_index": job_index})
-            except StopIteration:
-                contracts_exhausted = True
-
-        # Loop until some process terminates (to retask it) or,
-        # if there are no unanalysed contracts left, until currently-running contracts are done
-        while len(avail_jobs) == 0 or (contracts_exhausted and 0 < len(workers)):
-            to_remove = []
-            for i in range(len(workers)):
-                start_time = workers[i]["time"]
-                proc = workers[i]["proc"]
-                name = workers[i]["name"]
-                job_index = workers[i]["job_index"]
-
-                if not proc.is_alive():
-                    to_remove.append(i)
-                    proc.join()
-                    avail_jobs.append(job_index)
-
-            # Reverse index order so as to pop elements correctly
-            for i in reversed(to_remove):
-                workers.pop(i)
-
-            time.sleep(0.01)
-
-    # Conclude and write results to file.
-    log("\nFinishing...\n")
-    run_signal.clear()
-    flush_proc.join(FLUSH_PERIOD + 1)
-
-    counts = {}
-    total_flagged = 0
-    for contract, vulns, meta, analytics in res_list:
-        rlist = vulns + meta
-        if len(rlist) > 0:
-            total_flagged += 1
-        for res in rlist:
-            if res not in counts:
-                counts[res] = 1
-            else:
-                counts[res] += 1
+                msg = w["conn"].recv()
+            except EOFError:
+                log("Worker {} died.".format(w["job_index"]))
+                retire_worker(w, "error")
+                continue
 
-    total = len(res_list)
+            if msg[0] == "ready":
+                batch = requeued.popleft() if requeued else next(batches, None)
+                w["conn"].send(batch)
+                if batch is None:
+                    w["proc"].join()
+                    del workers[w["job_index"]]
+                else:
+                    w["batch"] = list(batch)
+            elif msg[0] == "start":
+                w["names"] = msg[1]
+                w["deadline"] = time.time() + msg[2] + TIMEOUT_GRACE
+                del w["batch"][:len(msg[1])]
+            elif msg[0] == "result":
+                w["names"].remove(msg[1][0])
+                record_result(msg[1])
+
+        # Replace any workers stuck on a contract for too long.
+        for w in list(workers.values()):
+            if w["names"] and time.time() > w["deadline"]:
+                log("{} timed out; restarting worker {}.".format(", ".join(w["names"]),
+                                                                 w["job_index"]))
+                retire_worker(w, "TIMEOUT")
+
+    # Duplicate contracts inherit the results of the contract they duplicate.
+    if duplicates:
+        log("Copying results to {} duplicate contracts.".format(len(duplicates)))
+        for fname, original in duplicates.items():
+            if original in summaries:
+                vulns, meta = summaries[original]
+                record_result((fname, vulns, meta, {"duplicate_of": original}))
+
+    # Conclude and summarise results.
+    log("\nFinishing...\n")
     log("{} of {} contracts flagged.\n".format(total_flagged, total))
     for res, count in counts.items():
         log("  {}: {:.2f}%".format(res, 100 * count / total))
 
-    log("\nWriting results to {}".format(args.results_file))
-    with open(args.results_file, 'w') as f:
-        f.write(json.dumps(list(res_list)))
-
 except Exception as e:
     import traceback
 
     traceback.print_exc()
-    flush_proc.terminate()
 
-log("Removing working directory {}".format(TEMP_WORKING_DIR))
-import shutil
+finally:
+    for w in workers.values():
+        w["proc"].terminate()
+        w["proc"].join()
+    results_file.close()
+    log("Results written to {}".format(args.results_file))
 
-shutil.rmtree(TEMP_WORKING_DIR)
+    log("Removing working directory {}".format(TEMP_WORKING_DIR))
+    shutil.rmtree(TEMP_WORKING_DIR)
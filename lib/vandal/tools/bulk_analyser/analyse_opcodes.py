@@ -37,7 +37,9 @@ import collections
 import csv
 import glob
 import math
+import multiprocessing
 import os
+import re
 import sys
 import typing as t
 
@@ -48,18 +50,44 @@ src_path = join(dirname(abspath(__file__)), "../../")
 sys.path.insert(0, src_path)
 
 # decompiler project imports
-import src.blockparse as blockparse
 import src.opcodes as opcodes
 
+# NumPy is optional: counting falls back to pure Python without it, but it is
+# needed to write the columnar output.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 DEFAULT_CONTRACT_DIR = 'contracts'
 """Directory to fetch contract files from by default."""
 
 CONTRACT_GLOB = '*_runtime.hex'
 """Files in the contract_dir which match this glob will be processed"""
 
-CSV_FIELDS = ['contract'] + list(sorted(opcodes.OPCODES.keys())) + ['total']
+MISSING_FIELD = 'MISSING'
+"""Field counting the bytes which are not valid opcodes."""
+
+CSV_FIELDS = ['contract'] + list(sorted(opcodes.OPCODES.keys())) + [MISSING_FIELD, 'total']
 """fields to appear in output CSV, in this order"""
 
+DEFAULT_NUM_JOBS = os.cpu_count() or 1
+"""The number of processes counting opcodes at once."""
+
+CHUNK_SIZE = 64
+"""The number of contracts sent to a process at a time."""
+
+PUSH_RE = re.compile(b"[" + re.escape(bytes(b for b in range(256) if opcodes.PUSH_LEN[b])) + b"]")
+"""Matches the bytes which are PUSH opcodes, and so are followed by a payload."""
+
+FIELD_BYTES = {}
+"""The byte values counted in each opcode field of the output."""
+for name in CSV_FIELDS[1:-2]:
+    # Pseudo-opcodes never occur in bytecode, and aliases are counted once.
+    code = opcodes.OPCODES[name].code
+    FIELD_BYTES[name] = [code] if 0 <= code < 256 and opcodes.BYTECODES[code].name == name else []
+FIELD_BYTES[MISSING_FIELD] = [b for b in range(256) if b not in opcodes.BYTECODES]
+
 parser = argparse.ArgumentParser()
 
 parser.add_argument("-c",
@@ -71,14 +99,31 @@ parser.add_argument("-c",
                     help="the location to grab contracts from (as bytecode "
                          "files).")
 
+parser.add_argument("-j",
+                    "--jobs",
+                    type=int,
+                    nargs="?",
+                    default=DEFAULT_NUM_JOBS,
+                    const=DEFAULT_NUM_JOBS,
+                    metavar="NUM",
+                    help="The number of processes to count opcodes with "
+                         "(the number of CPUs by default).")
+
+parser.add_argument("-z",
+                    "--npz",
+                    default=None,
+                    metavar="FILE",
+                    help="Also write the counts to the given NumPy .npz file, "
+                         "as a contracts array of file names and a "
+                         "contracts x 256 counts matrix indexed by opcode "
+                         "byte value. Requires NumPy.")
+
 parser.add_argument('outfile',
                     type=argparse.FileType('w'),
                     help="CSV file where output statistics will be written, "
                          "one row per contract, with a CSV header as row 1. "
                          "Defaults to stdout if not specified.")
 
-args = parser.parse_args()
-
 
 def print_progress(progress: int, item: str = ""):
     """
@@ -95,46 +140,84 @@ def print_progress(progress: int, item: str = ""):
     sys.stdout.flush()
 
 
-def count_opcodes(bytecode: t.Union[str, bytes]) -> collections.Counter:
+def op_bytes(code: bytes) -> bytes:
+    """
+    Return the opcode bytes of the given bytecode, with the payloads of PUSH
+    operations skipped. Runs of non-PUSH operations are copied in one step.
+    """
+    ops = bytearray()
+    pc, size = 0, len(code)
+    while pc < size:
+        push = PUSH_RE.search(code, pc)
+        if push is None:
+            ops += code[pc:]
+            break
+        start = push.start()
+        ops += code[pc:start + 1]
+        pc = start + 1 + opcodes.PUSH_LEN[code[start]]
+    return bytes(ops)
+
+
+def count_opcodes(bytecode: t.Union[str, bytes]) -> t.Sequence[int]:
     """
     count_opcodes counts the number of each type of opcode from a given bytecode
-    sequence, returning a dict-compatible collections.Counter.
+    sequence, returning the count for each of the 256 byte values.
     """
-    parser = blockparse.EVMBytecodeParser(bytecode)
-    parser.parse()
+    if type(bytecode) is str:
+        bytecode = bytes.fromhex(bytecode.replace("0x", ""))
+    ops = op_bytes(bytecode)
 
-    # convert EVMOps to OpCodes
-    ops = list(map(lambda op: op.opcode, parser._ops))
+    if np is not None:
+        return np.bincount(np.frombuffer(ops, dtype=np.uint8), minlength=256)
+    counts = collections.Counter(ops)
+    return [counts[b] for b in range(256)]
 
-    # use Python's Counter to count each
-    return collections.Counter(ops), ops
 
+def count_file(fname: str) -> t.Tuple[str, t.Sequence[int]]:
+    """Count the opcodes in the given contract file, returning its name too."""
+    with open(fname, 'r') as f:
+        return os.path.basename(fname), count_opcodes(f.read().strip())
 
-print("Searching for files...")
-pattern = join(args.contract_dir, CONTRACT_GLOB)
-files = glob.glob(pattern)
-print("Located {} contract files matching {}".format(len(files), pattern))
 
-print("Writing output to {}".format(args.outfile.name))
+def main():
+    args = parser.parse_args()
+    if args.npz is not None and np is None:
+        parser.error("--npz requires NumPy.")
 
-writer = csv.DictWriter(args.outfile, restval=0, fieldnames=CSV_FIELDS)
-writer.writeheader()
+    print("Searching for files...")
+    pattern = join(args.contract_dir, CONTRACT_GLOB)
+    files = glob.glob(pattern)
+    print("Located {} contract files matching {}".format(len(files), pattern))
 
-for i, fname in enumerate(files):
-    with open(fname, 'r') as f:
-        bname = os.path.basename(f.name)
+    print("Writing output to {}".format(args.outfile.name))
+
+    writer = csv.writer(args.outfile)
+    writer.writerow(CSV_FIELDS)
+    field_bytes = [FIELD_BYTES[name] for name in CSV_FIELDS[1:-1]]
+
+    names = []
+    matrix = np.zeros((len(files), 256), dtype=np.uint32) if args.npz is not None else None
+
+    with multiprocessing.Pool(max(args.jobs, 1)) as pool:
+        for i, (bname, counts) in enumerate(pool.imap(count_file, files, CHUNK_SIZE)):
+            # update a progress bar after processing 10 contracts
+            if i % 10 == 0 or i + 1 == len(files):
+                print_progress(math.floor((i + 1) / len(files) * 100),
+                               "{}/{} {}".format(i + 1, len(files), bname))
+
+            # contract filename always goes in first CSV field, and the
+            # total in the last
+            row = [sum(int(counts[b]) for b in bs) for bs in field_bytes]
+            writer.writerow([bname] + row + [sum(row)])
 
-        # update a progress bar after processing 10 contracts
-        if i % 10 == 0 or i + 1 == len(files):
-            print_progress(math.floor((i + 1) / len(files) * 100),
-                           "{}/{} {}".format(i + 1, len(files), bname))
+            if matrix is not None:
+                names.append(bname)
+                matrix[i] = counts
 
-        counts, ops = count_opcodes(f.read().strip())
-        row = {op.name: count for op, count in counts.items()}
+    if matrix is not None:
+        np.savez_compressed(args.npz, contracts=np.array(names), counts=matrix)
+        print("Wrote counts to {}".format(args.npz))
 
-        # add a "total" column to each row
-        row['total'] = sum(row.values())
 
-        # contract filename always goes in first CSV field
-        row[CSV_FIELDS[0]] = bname
-        writer.writerow(row)
+if __name__ == "__main__":
+    main()
@@ -32,18 +32,88 @@
 """filter_results.py: filter down the results from analyse.py"""
 
 import argparse
+import collections
+import glob
+import hashlib
 import json
+import os
+import sqlite3
+import sys
+import typing as t
 
-JSON_FILE = "results.json"
+JSON_FILE = "results.jsonl"
+OUT_FILE = "filtered_results.jsonl"
+
+SHARD_GLOB = "*.jsonl"
+"""Files in an input directory which match this glob are read as results."""
+
+ARRAY_CHUNK = 1 << 20
+"""Number of characters read at a time from a results file written as one array."""
+
+INDEX_VERSION = 2
+"""Version of the index schema. Indexes of any other version are rebuilt."""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, offset INTEGER NOT NULL,
+                                    size INTEGER NOT NULL, mtime REAL NOT NULL,
+                                    inode INTEGER NOT NULL, head TEXT NOT NULL,
+                                    tail_start INTEGER NOT NULL, tail TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS results (id INTEGER PRIMARY KEY, source TEXT NOT NULL,
+                                    filename TEXT NOT NULL, result TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS properties (result INTEGER NOT NULL, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS flags (result INTEGER NOT NULL, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS analytics (result INTEGER NOT NULL, name TEXT NOT NULL, value);
+CREATE INDEX IF NOT EXISTS results_source ON results (source);
+CREATE INDEX IF NOT EXISTS results_filename ON results (filename);
+CREATE INDEX IF NOT EXISTS properties_name ON properties (name, result);
+CREATE INDEX IF NOT EXISTS flags_name ON flags (name, result);
+CREATE INDEX IF NOT EXISTS analytics_name ON analytics (name, value);
+"""
+"""
+The index schema. Each result is stored whole, as its JSON line, alongside
+one indexed row per property, flag and analytic, so that filters and counts
+touch only the rows they need. sources records how far into each results file
+has been indexed, along with what the file looked like then: its size,
+modification time and inode, a hash of its first line, and the position and
+hash of the last line indexed.
+"""
+
+parser = argparse.ArgumentParser(
+    description="Filter the results of analyse.py, either by streaming through "
+                "results files or through a SQLite index of them.")
 
-parser = argparse.ArgumentParser()
 parser.add_argument("-i",
                     "--in_file",
-                    nargs="?",
-                    default=JSON_FILE,
-                    const=JSON_FILE,
+                    nargs="+",
+                    default=[JSON_FILE],
+                    metavar="FILEPATH",
+                    help="take input from the specified results files, or from "
+                         "every {} file in the specified directories."
+                         .format(SHARD_GLOB)
+                    )
+
+parser.add_argument("-o",
+                    "--out_file",
+                    default=OUT_FILE,
                     metavar="FILEPATH",
-                    help="take input from the specified file."
+                    help="write output to the specified file, or to stdout if "
+                         "it is -."
+                    )
+
+parser.add_argument("-x",
+                    "--index",
+                    default=None,
+                    metavar="DBPATH",
+                    help="answer the query from the specified SQLite index, "
+                         "first indexing any new results in the input files."
+                    )
+
+parser.add_argument("-c",
+                    "--counts",
+                    default=False,
+                    action="store_true",
+                    help="output the number of matching results with each "
+                         "property and flag, rather than the results."
                     )
 
 parser.add_argument("-n",
@@ -85,45 +155,389 @@ parser.add_argument("-F",
                     help="exclude results exhibiting any of the given flags."
                     )
 
-args = parser.parse_args()
+
+def results_files(paths: t.Iterable[str]) -> t.List[str]:
+    """
+    Return the results files at the given paths, expanding each directory
+    into the results shards inside it.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, SHARD_GLOB))))
+        else:
+            files.append(path)
+    return files
 
 
-def satisfies(triple):
+def read_lines(filename: str, offset: int = 0) -> t.Iterator[t.Tuple[int, bytes]]:
     """
+    Generate the complete lines of a results file from the given byte offset
+    on, each with the offset just past its end. A trailing partial line, as
+    left by an interrupted analysis, is reported and skipped.
+
     Args:
-      triple: a triple of [filename, properties, flags]
-  
+      filename: the results file to read.
+      offset: the byte offset to start reading from.
+    """
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                print("Skipping incomplete last line of {}: {:.60}"
+                      .format(filename, repr(line)), file=sys.stderr)
+                break
+            offset += len(line)
+            yield offset, line
+
+
+def is_array(filename: str) -> bool:
+    """
+    Decide whether a results file is a single JSON array of results, as
+    written by earlier versions of analyse.py, rather than one result per line.
+    """
+    with open(filename, 'rb') as f:
+        start = f.read(64).lstrip()
+    return start[:1] == b"[" and start[1:].lstrip()[:1] in (b"[", b"]")
+
+
+def read_array(filename: str) -> t.Iterator[bytes]:
+    """
+    Generate the results in a results file written as a single JSON array,
+    each as the bytes of its JSON. The array is decoded incrementally, so that
+    it is never held in memory whole. If it is malformed or truncated, that is
+    reported and the results before the fault are kept.
+
+    Args:
+      filename: the results file to read.
+    """
+    decoder = json.JSONDecoder()
+    count = 0
+    with open(filename, encoding="utf-8") as f:
+        buf, pos, eof = "", 0, False
+
+        def peek() -> str:
+            """Skip whitespace and return the next character, or "" at the end."""
+            nonlocal buf, pos, eof
+            while True:
+                while pos < len(buf) and buf[pos].isspace():
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return buf[pos:pos + 1]
+                buf, pos = f.read(ARRAY_CHUNK), 0
+                eof = not buf
+
+        expected = "["
+        while peek() == expected:
+            pos += 1
+            if peek() == "]" and expected == "[":
+                return
+            while True:
+                try:
+                    _, end = decoder.raw_decode(buf, pos)
+                    break
+                except ValueError:
+                    if eof:
+                        end = None
+                        break
+                    more = f.read(ARRAY_CHUNK)
+                    buf, pos, eof = buf[pos:] + more, 0, not more
+            if end is None:
+                break
+            count += 1
+            yield buf[pos:end].encode()
+            pos = end
+            if peek() == "]":
+                return
+            expected = ","
+    print("Skipping the rest of malformed results array {} after {} results."
+          .format(filename, count), file=sys.stderr)
+
+
+def read_entries(filename: str, offset: int = 0) -> t.Iterator[t.Tuple[int, bytes]]:
+    """
+    Generate the results of a results file in either format, as for
+    read_lines. A file written as a single array is always read whole, and
+    each of its results is paired with the size of the file.
+    """
+    if is_array(filename):
+        size = os.path.getsize(filename)
+        return ((size, entry) for entry in read_array(filename))
+    return read_lines(filename, offset)
+
+
+def decode(filename: str, line: bytes) -> t.Optional[list]:
+    """
+    Decode a line of a results file, or log and return None if it is not a
+    well-formed result.
+    """
+    try:
+        result = json.loads(line.decode())
+        if isinstance(result, list) and len(result) >= 3 and \
+           isinstance(result[1], list) and isinstance(result[2], list):
+            return result
+    except ValueError:
+        pass
+    print("Skipping unreadable result in {}: {:.60}".format(filename, repr(line)),
+          file=sys.stderr)
+    return None
+
+
+def read_results(filenames: t.Iterable[str]) -> t.Iterator[list]:
+    """
+    Generate the results in the given results files, one JSON result per line
+    or a single JSON array of them, without holding more than one of them in
+    memory. Unreadable results are skipped.
+
+    Args:
+      filenames: the results files to read.
+    """
+    for filename in filenames:
+        for _, line in read_entries(filename):
+            result = decode(filename, line)
+            if result is not None:
+                yield result
+
+
+def satisfies(result: list, args) -> bool:
+    """
+    Args:
+      result: a result of the form [filename, properties, flags, ...]
+      args: the parsed filter arguments.
+
     Returns:
       True iff the conditions specified in the args are satisfied.
     """
-    filename, properties, flags = triple
+    properties, flags = set(result[1]), set(result[2])
+    return properties.issuperset(args.properties) and \
+           flags.issuperset(args.flags) and \
+           properties.isdisjoint(args.exclude_properties) and \
+           flags.isdisjoint(args.exclude_flags)
+
+
+def open_index(path: str) -> sqlite3.Connection:
+    """
+    Open the SQLite index at the given path, creating it if necessary, or
+    rebuilding it if it was written with a different schema.
+    """
+    db = sqlite3.connect(path)
+    if db.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+        with db:
+            for table in ("sources", "results", "properties", "flags", "analytics"):
+                db.execute("DROP TABLE IF EXISTS {}".format(table))
+    db.executescript(SCHEMA)
+    db.execute("PRAGMA user_version = {}".format(INDEX_VERSION))
+    return db
+
+
+def digest(data: bytes) -> str:
+    """Return a hash of the given bytes, to recognise them again later."""
+    return hashlib.sha1(data).hexdigest()
+
+
+def read_span(filename: str, start: int, end: int) -> bytes:
+    """Return the bytes of a file between the given offsets."""
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def appended(filename: str, stat: os.stat_result, source: tuple) -> bool:
+    """
+    Decide whether a results file has only been appended to since it was
+    indexed, rather than rewritten or replaced.
+
+    Args:
+      filename: the results file.
+      stat: the file's current status.
+      source: the file's (offset, size, mtime, inode, head, tail_start, tail)
+              row in the sources table.
+    """
+    offset, _, _, inode, head, tail_start, tail = source
+    if stat.st_ino != inode or stat.st_size < offset:
+        return False
+    first = next(read_lines(filename), (0, b""))[1]
+    return digest(first) == head and \
+        digest(read_span(filename, tail_start, offset)) == tail
+
+
+def update_index(db: sqlite3.Connection, filenames: t.Iterable[str]) -> int:
+    """
+    Index the results in the given files which are not yet in the index.
+    A file which is unchanged since it was last indexed is not read again.
+    Results appended to a file since then are added, and a file which has
+    been rewritten or replaced is indexed afresh, as is a changed file written
+    as a single array. Unreadable results are skipped, and the results of
+    files which no longer exist are removed.
+
+    Returns:
+      The number of results indexed.
+    """
+    for (source,) in db.execute("SELECT path FROM sources").fetchall():
+        if not os.path.exists(source):
+            drop_source(db, source)
+
+    added = 0
+    for filename in filenames:
+        if not os.path.exists(filename):
+            continue
+        source = os.path.abspath(filename)
+        stat = os.stat(filename)
+        row = db.execute("SELECT offset, size, mtime, inode, head, tail_start, tail "
+                         "FROM sources WHERE path = ?", (source,)).fetchone()
+        if row is not None and (row[1], row[2], row[3]) == \
+                (stat.st_size, stat.st_mtime, stat.st_ino):
+            continue
+
+        offset, head, tail_start, tail = 0, digest(b""), 0, digest(b"")
+        array = is_array(filename)
+        if row is not None:
+            if not array and appended(filename, stat, row):
+                offset, _, _, _, head, tail_start, tail = row
+            else:
+                drop_source(db, source)
+
+        with db:
+            for end, line in read_entries(filename, offset):
+                if offset == 0:
+                    head = digest(line)
+                offset, tail_start, tail = end, end - len(line), digest(line)
+                result = decode(filename, line)
+                if result is None:
+                    continue
+                rid = db.execute("INSERT INTO results (source, filename, result) "
+                                 "VALUES (?, ?, ?)",
+                                 (source, result[0], line.decode().rstrip("\n"))).lastrowid
+                db.executemany("INSERT INTO properties VALUES (?, ?)",
+                               ((rid, p) for p in result[1]))
+                db.executemany("INSERT INTO flags VALUES (?, ?)",
+                               ((rid, f) for f in result[2]))
+                if len(result) > 3 and isinstance(result[3], dict):
+                    db.executemany("INSERT INTO analytics VALUES (?, ?, ?)",
+                                   ((rid, k, v) for k, v in result[3].items()
+                                    if isinstance(v, (int, float, str)) or v is None))
+                added += 1
+            db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (source, offset, stat.st_size, stat.st_mtime, stat.st_ino,
+                        head, tail_start, tail))
+    return added
+
+
+def drop_source(db: sqlite3.Connection, source: str) -> None:
+    """Remove every result indexed from the given source file."""
+    ids = "SELECT id FROM results WHERE source = ?"
+    with db:
+        for table in ("properties", "flags", "analytics"):
+            db.execute("DELETE FROM {} WHERE result IN ({})".format(table, ids), (source,))
+        db.execute("DELETE FROM results WHERE source = ?", (source,))
+        db.execute("DELETE FROM sources WHERE path = ?", (source,))
+
+
+def select_sources(db: sqlite3.Connection, filenames: t.Iterable[str]) -> None:
+    """
+    Record the given results files as those to answer queries from, so that
+    results indexed from any other file are left out.
+    """
+    db.execute("CREATE TEMP TABLE IF NOT EXISTS inputs (path TEXT PRIMARY KEY)")
+    with db:
+        db.execute("DELETE FROM inputs")
+        db.executemany("INSERT OR IGNORE INTO inputs VALUES (?)",
+                       ((os.path.abspath(f),) for f in filenames))
+
+
+def index_query(args) -> t.Tuple[str, list]:
+    """
+    Build a query for the ids of the indexed results from the selected input
+    files satisfying the filter in the given arguments.
+
+    Returns:
+      The SQL query and its parameters.
+    """
+    clauses, params = ["source IN (SELECT path FROM inputs)"], []
+    for table, names, op in (("properties", args.properties, "IN"),
+                             ("flags", args.flags, "IN"),
+                             ("properties", args.exclude_properties, "NOT IN"),
+                             ("flags", args.exclude_flags, "NOT IN")):
+        for name in names:
+            clauses.append("id {} (SELECT result FROM {} WHERE name = ?)".format(op, table))
+            params.append(name)
+    return "SELECT id FROM results WHERE " + " AND ".join(clauses), params
+
+
+def query_index(db: sqlite3.Connection, args) -> t.Iterator[list]:
+    """Generate the indexed results satisfying the filter in the given arguments."""
+    ids, params = index_query(args)
+    rows = db.execute("SELECT result FROM results WHERE id IN ({}) ORDER BY id"
+                      .format(ids), params)
+    for row in rows:
+        yield json.loads(row[0])
+
+
+def count_index(db: sqlite3.Connection, args) -> t.Tuple[int, t.Counter]:
+    """
+    Count the indexed results satisfying the filter in the given arguments,
+    and how many of them exhibit each property and flag.
+    """
+    ids, params = index_query(args)
+    kept = db.execute("SELECT COUNT(*) FROM ({})".format(ids), params).fetchone()[0]
+    counts = collections.Counter()
+    for table in ("properties", "flags"):
+        rows = db.execute("SELECT name, COUNT(*) FROM {} WHERE result IN ({}) "
+                          "GROUP BY name".format(table, ids), params)
+        counts.update(dict(rows))
+    return kept, counts
+
+
+def main():
+    args = parser.parse_args()
+    # Never read back the output, which may be in an input directory.
+    filenames = [f for f in results_files(args.in_file)
+                 if args.out_file == "-" or not os.path.exists(args.out_file)
+                 or not os.path.samefile(f, args.out_file)]
+    out = sys.stdout if args.out_file == "-" else open(args.out_file, 'w')
+    log = sys.stderr if out is sys.stdout else sys.stdout
 
-    for p in args.properties:
-        if p not in properties:
-            return False
+    if args.index is not None:
+        db = open_index(args.index)
+        added = update_index(db, filenames)
+        select_sources(db, filenames)
+        total = db.execute("SELECT COUNT(*) FROM results WHERE source IN "
+                           "(SELECT path FROM inputs)").fetchone()[0]
+        print("Indexed {} new results, {} in total.".format(added, total), file=log)
+        if args.counts:
+            kept, counts = count_index(db, args)
+            matches = None
+        else:
+            matches = query_index(db, args)
+    else:
+        total = 0
+        counts = collections.Counter()
 
-    for f in args.flags:
-        if f not in flags:
-            return False
+        def stream():
+            nonlocal total
+            for result in read_results(filenames):
+                total += 1
+                if satisfies(result, args):
+                    yield result
 
-    for p in args.exclude_properties:
-        if p in properties:
-            return False
+        matches = stream()
 
-    for f in args.exclude_flags:
-        if f in flags:
-            return False
+    if matches is not None:
+        kept = 0
+        for result in matches:
+            kept += 1
+            if args.counts:
+                counts.update(result[1] + result[2])
+            else:
+                out.write(json.dumps(result[0] if args.names_only else result) + "\n")
 
-    # result satisfied the filter => return True
-    return True
+    if args.counts:
+        for name, count in sorted(counts.items(), key=lambda c: (-c[1], c[0])):
+            out.write("{}\t{}\n".format(name, count))
+    if out is not sys.stdout:
+        out.close()
+    print("{} results filtered down to {}.".format(total, kept), file=log)
 
 
-with open(args.in_file, 'r') as f:
-    results = json.loads(f.read())
-    with open("filtered_results.json", 'w') as g:
-        filtered = filter(satisfies, results)
-        if args.names_only:
-            filtered = map(lambda t: t[0], filtered)
-        filtered = list(filtered)
-        print("{} results filtered down to {}.".format(len(results), len(filtered)))
-        g.write(json.dumps(filtered))
+if __name__ == "__main__":
+    main()
@@ -1,104 +1,198 @@
+import argparse
+import collections
+import json
+import multiprocessing
+import os
 import sys
+import typing as t
 from os import listdir
 from os.path import abspath, dirname, join
 import re
-import json
 
 src_path = join(dirname(abspath(__file__)), "../../")
 sys.path.insert(0, src_path)
 
-import src.dataflow as dataflow
-import src.tac_cfg as tac_cfg
+import src.dispatch as dispatch
 import src.settings as settings
 
 INTERFACES_DIR = "interfaces"
 CONTRACTS_DIR = "contracts"
+DEFAULT_NUM_JOBS = os.cpu_count() or 1
+CHUNK_SIZE = 16
 
-func_re = re.compile("(\w|$)+\([^()]*\)")
+func_re = re.compile(r"(\w|$)+\([^()]*\)")
 sig_re = re.compile("(0x)?[0-9A-Fa-f]{8}")
 
-def ensure_0x(string):
-    if string.startswith("0x"):
-        return string
-    return "0x" + string
-
-interfaces = {}
-
-# Import eth-utils only if required.
-import_eth_utils = False
-for interface_file in listdir(INTERFACES_DIR):
-    if interface_file.startswith('.'):
-        continue
-    with open(join(INTERFACES_DIR, interface_file), 'r') as f:
-        for line in f:
-            func_name = line.strip()
-            if func_re.fullmatch(func_name) is not None or \
-               func_re.fullmatch(func_name) is not None:
-                   import_eth_utils = True
-                   break
-    if import_eth_utils:
-        break
-if import_eth_utils:
-    from eth_utils import function_signature_to_4byte_selector as encode_sig
-    from eth_utils import function_abi_to_4byte_selector as encode_abi
-
-# Read Solidity function interfaces.
-print("Reading interfaces...")
-for interface_file in listdir(INTERFACES_DIR):
-    if interface_file.startswith('.'):
-        continue
-    print("  - {}".format(interface_file))
-    with open(join(INTERFACES_DIR, interface_file), 'r') as f:
-        interface = {}
-        # Handle a json contract ABI.
-        if interface_file.endswith(".json"):
-            abi = json.load(f)
-            for func in [func for func in abi if func['type'] == 'function']:
-                interface[func['name']] = ensure_0x(encode_abi(func).hex())
-        # Otherwise just take a file with signatures listed line by line.
-        else:
-            for line in f:
-                func_name = line.strip()
-                func_match = func_re.fullmatch(func_name)
-                sig_match = sig_re.fullmatch(func_name)
-                
-                # Handle either the unencoded string or the four-byte selector
-                if func_match is not None:
-                    interface[func_name] = ensure_0x(encode_sig(func_name).hex())
-                elif sig_match is not None:
-                    interface[func_name] = ensure_0x(func_name)
-        interfaces[interface_file] = interface
-print()
-
-# Perform a minimal decompile and extract functions.
-settings.import_config()
-settings.extract_functions = True
-settings.mark_functions = False
-settings.max_iterations = 0
-settings.analytics = False
-settings.merge_unreachable = False
-settings.remove_unreachable = False
-
-for contract_file in listdir(CONTRACTS_DIR):
-    with open(join(CONTRACTS_DIR, contract_file), 'r') as f:
-        print("{}".format(contract_file), end="")
-        cfg = tac_cfg.TACGraph.from_bytecode(f)
-        dataflow.analyse_graph(cfg)
-        sigs = [func.signature for func in cfg.function_extractor.public_functions]
-
-        # Pad any short signatures with leading zeroes until eight nibbles long.
-        for i in range(len(sigs)):
-            sig = sigs[i]
-            if len(sig) < 10:
-                sigs[i] = ensure_0x("0"*(10 - len(sig)) + sig[2:])
-
-        conforming = []
-        for interface, interface_sigs in interfaces.items():
-            if all(sig in sigs for sig in interface_sigs.values()):
-                conforming.append(interface)
-        
-        if conforming:
-            print(" conforms to {}.".format(", ".join(conforming)))
-        else:
-            print(": no matching interface provided.")
+parser = argparse.ArgumentParser(
+    description="Report which of a set of interfaces each contract implements. "
+                "Writes one JSON object per contract, with its public function "
+                "selectors and the interfaces all of whose selectors it has.")
+
+parser.add_argument("-i",
+                    "--interfaces_dir",
+                    default=INTERFACES_DIR,
+                    metavar="DIR",
+                    help="the directory to read interfaces from.")
+
+parser.add_argument("-c",
+                    "--contracts_dir",
+                    default=CONTRACTS_DIR,
+                    metavar="DIR",
+                    help="the directory to read contract bytecode from.")
+
+parser.add_argument("-j",
+                    "--jobs",
+                    type=int,
+                    default=DEFAULT_NUM_JOBS,
+                    metavar="NUM",
+                    help="the number of processes to check contracts with "
+                         "(the number of CPUs by default).")
+
+parser.add_argument("-o",
+                    "--output",
+                    type=argparse.FileType("w"),
+                    default=sys.stdout,
+                    metavar="FILE",
+                    help="the file to write the report to (stdout by default).")
+
+
+def selector(string: str) -> int:
+    """Parse a four-byte selector from hex, with or without a leading 0x."""
+    return int(string, 16)
+
+
+def read_interfaces(interfaces_dir: str) -> t.Dict[str, t.Dict[str, int]]:
+    """
+    Read every interface in the given directory, mapping each interface file
+    name to the selectors of its functions, keyed by function. Each file is
+    read once; eth-utils is imported only if some function needs encoding.
+    """
+    encoders = {}
+
+    def encode_sig(func_name):
+        if not encoders:
+            from eth_utils import function_signature_to_4byte_selector
+            from eth_utils import function_abi_to_4byte_selector
+            encoders["sig"] = function_signature_to_4byte_selector
+            encoders["abi"] = function_abi_to_4byte_selector
+        return encoders["sig"](func_name)
+
+    def encode_abi(func):
+        encode_sig("()")
+        return encoders["abi"](func)
+
+    interfaces = {}
+    for interface_file in sorted(listdir(interfaces_dir)):
+        if interface_file.startswith('.'):
+            continue
+        print("  - {}".format(interface_file), file=sys.stderr)
+        with open(join(interfaces_dir, interface_file), 'r') as f:
+            interface = {}
+            # Handle a json contract ABI.
+            if interface_file.endswith(".json"):
+                abi = json.load(f)
+                for func in [func for func in abi if func['type'] == 'function']:
+                    interface[func['name']] = selector(encode_abi(func).hex())
+            # Otherwise just take a file with signatures listed line by line.
+            else:
+                for line in f:
+                    func_name = line.strip()
+
+                    # Handle either the unencoded string or the four-byte selector
+                    if func_re.fullmatch(func_name) is not None:
+                        interface[func_name] = selector(encode_sig(func_name).hex())
+                    elif sig_re.fullmatch(func_name) is not None:
+                        interface[func_name] = selector(func_name)
+            interfaces[interface_file] = interface
+    return interfaces
+
+
+class InterfaceIndex:
+    """
+    An inverted index from each function selector to the set of interfaces
+    containing it, with each set represented as a bitmask over the interfaces.
+    """
+
+    def __init__(self, interfaces: t.Dict[str, t.Dict[str, int]]):
+        self.names = list(interfaces)
+        """The name of each interface; interface i has bit 1 << i."""
+
+        self.sizes = {}
+        """The number of distinct selectors in each interface, by bit."""
+
+        self.index = collections.defaultdict(int)
+        """A mapping from each selector to the mask of the interfaces with it."""
+
+        self.trivial = 0
+        """The mask of the interfaces with no selectors at all."""
+
+        for i, name in enumerate(self.names):
+            bit = 1 << i
+            sels = set(interfaces[name].values())
+            self.sizes[bit] = len(sels)
+            if not sels:
+                self.trivial |= bit
+            for sel in sels:
+                self.index[sel] |= bit
+
+    def match(self, selectors: t.Iterable[int]) -> int:
+        """
+        Return the mask of the interfaces all of whose selectors are among the
+        given ones, counting the hits on each interface through the index.
+        """
+        hits = collections.Counter()
+        for sel in set(selectors):
+            mask = self.index.get(sel, 0)
+            while mask:
+                bit = mask & -mask
+                hits[bit] += 1
+                mask ^= bit
+        return self.trivial | sum(bit for bit, n in hits.items() if n == self.sizes[bit])
+
+    def interfaces(self, mask: int) -> t.List[str]:
+        """Return the names of the interfaces in the given mask."""
+        return [name for i, name in enumerate(self.names) if mask >> i & 1]
+
+
+def configure():
+    """
+    Configure a minimal decompilation, used to extract the functions of
+    contracts whose dispatchers are not recognised directly.
+    """
+    settings.import_config()
+    settings.extract_functions = True
+    settings.mark_functions = False
+    settings.max_iterations = 0
+    settings.analytics = False
+    settings.merge_unreachable = False
+    settings.remove_unreachable = False
+
+
+def contract_selectors(path: str) -> t.Tuple[str, t.List[int]]:
+    """Return the name and the public function selectors of a contract file."""
+    with open(path, 'r') as f:
+        bytecode = "".join(l.strip() for l in f)
+    return os.path.basename(path), sorted(selector(sig) for sig in
+                                          dispatch.function_selectors(bytecode))
+
+
+def main():
+    args = parser.parse_args()
+
+    # Read Solidity function interfaces.
+    print("Reading interfaces...", file=sys.stderr)
+    index = InterfaceIndex(read_interfaces(args.interfaces_dir))
+
+    paths = [join(args.contracts_dir, c) for c in sorted(listdir(args.contracts_dir))]
+    with multiprocessing.Pool(max(args.jobs, 1), initializer=configure) as pool:
+        for name, sels in pool.imap(contract_selectors, paths, CHUNK_SIZE):
+            report = {
+                "contract": name,
+                "selectors": ["0x{:08x}".format(sel) for sel in sels],
+                "interfaces": index.interfaces(index.match(sels)),
+            }
+            print(json.dumps(report), file=args.output)
+
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+# BSD 3-Clause License
+#
+# Copyright (c) 2016, 2017, The University of Sydney. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""cache.py: A persistent cache of analysed TAC graphs, keyed by bytecode.
+
+Entries are unpickled only into the graph, block, operation, variable and
+lattice types of this package, so a cache entry cannot name arbitrary
+callables. A cache directory should nonetheless only be writable by users
+trusted to run the analysis.
+
+Keys are SHA3-256 digests from hashlib rather than Ethereum's Keccak-256, which
+differs only in its padding and is not in the standard library. Keys are never
+compared with on-chain hashes, so either serves, and this keeps the
+decompiler free of third-party dependencies."""
+
+import hashlib
+import io
+import logging
+import os
+import pickle
+import tempfile
+import typing as t
+import zlib
+
+import src.blockparse as blockparse
+import src.dataflow as dataflow
+import src.normalise as normalise
+import src.opcodes as opcodes
+import src.settings as settings
+import src.tac_cfg as tac_cfg
+
+FORMAT_VERSION = 6
+"""
+Version of the serialised graph format.
+Entries written with a different format version are never read back.
+"""
+
+DEFAULT_MAX_SIZE = 1024 ** 3
+"""Default maximum total size in bytes of all entries in a cache directory."""
+
+ENTRY_EXT = ".graph"
+"""Filename extension of cache entries."""
+
+EVICT_RATIO = 0.9
+"""
+When the cache grows beyond its maximum size, least recently used entries
+are evicted until it is at most this fraction of its maximum size.
+"""
+
+SAFE_MODULES = {"src.cfg", "src.evm_cfg", "src.function", "src.lattice",
+                "src.memtypes", "src.opcodes", "src.tac_cfg"}
+"""Modules whose classes may be reconstructed from a cache entry."""
+
+SAFE_BUILTINS = {"set", "frozenset"}
+"""Builtin types which may be reconstructed from a cache entry."""
+
+
+class _GraphPickler(pickle.Pickler):
+    """
+    Pickles the state of a TACGraph one block at a time.
+
+    Blocks, the graph itself, and builtin opcodes are written as references.
+    This keeps the pickling depth shallow however long the graph's paths
+    are, and lets the unpickler reconstruct blocks before their contents.
+    """
+
+    def __init__(self, file: t.BinaryIO):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+
+        self.blocks = []
+        """Every block referenced so far, in order of first reference."""
+
+        self.__block_ids = {}
+
+    def persistent_id(self, obj):
+        if isinstance(obj, tac_cfg.TACGraph):
+            return "cfg"
+        if isinstance(obj, tac_cfg.TACBasicBlock):
+            if id(obj) not in self.__block_ids:
+                self.__block_ids[id(obj)] = len(self.blocks)
+                self.blocks.append(obj)
+            return self.__block_ids[id(obj)]
+        if isinstance(obj, opcodes.OpCode) and \
+           opcodes.OPCODES.get(obj.name) is obj:
+            return obj.name
+        return None
+
+
+class _SafeUnpickler(pickle.Unpickler):
+    """
+    Refuses to load anything but the classes defined in SAFE_MODULES and
+    the types in SAFE_BUILTINS, so loading an entry cannot call arbitrary
+    functions.
+    """
+
+    def find_class(self, module, name):
+        if module == "builtins" and name in SAFE_BUILTINS:
+            return super().find_class(module, name)
+        if module in SAFE_MODULES:
+            cls = super().find_class(module, name)
+            if isinstance(cls, type) and cls.__module__ == module:
+                return cls
+        raise pickle.UnpicklingError("{}.{} is not allowed in a cache entry"
+                                     .format(module, name))
+
+
+class _GraphUnpickler(_SafeUnpickler):
+    """Resolves the references written by a _GraphPickler."""
+
+    def __init__(self, file: t.BinaryIO, cfg: tac_cfg.TACGraph):
+        super().__init__(file)
+        self.cfg = cfg
+        self.blocks = {}
+
+    def persistent_load(self, pid):
+        if pid == "cfg":
+            return self.cfg
+        if isinstance(pid, int):
+            return self.block(pid)
+        if pid in opcodes.OPCODES:
+            return opcodes.OPCODES[pid]
+        raise pickle.UnpicklingError("unknown reference {!r}".format(pid))
+
+    def block(self, index: int) -> tac_cfg.TACBasicBlock:
+        """Return the block with the given index, whose state may not be loaded yet."""
+        if index not in self.blocks:
+            self.blocks[index] = tac_cfg.TACBasicBlock.__new__(tac_cfg.TACBasicBlock)
+        return self.blocks[index]
+
+
+def dumps(cfg: tac_cfg.TACGraph) -> bytes:
+    """
+    Serialise a TACGraph, along with all its blocks, operations, variable
+    values, and extracted functions, to a compressed byte string.
+
+    Args:
+      cfg: the graph to serialise.
+    """
+    f = io.BytesIO()
+    pickler = _GraphPickler(f)
+
+    # The graph state comes first, then the state of each block it references,
+    # including blocks referenced only from other blocks, in order of reference.
+    pickler.dump(cfg.__dict__)
+    i = 0
+    while i < len(pickler.blocks):
+        pickler.dump(pickler.blocks[i].__dict__)
+        i += 1
+
+    return zlib.compress(f.getvalue())
+
+
+def loads(data: bytes) -> tac_cfg.TACGraph:
+    """
+    Reconstruct a TACGraph from a byte string produced by dumps().
+
+    Args:
+      data: the serialised graph.
+    """
+    f = io.BytesIO(zlib.decompress(data))
+    size = len(f.getbuffer())
+    cfg = tac_cfg.TACGraph.__new__(tac_cfg.TACGraph)
+    unpickler = _GraphUnpickler(f, cfg)
+
+    cfg.__dict__.update(unpickler.load())
+    i = 0
+    while f.tell() < size:
+        unpickler.block(i).__dict__.update(unpickler.load())
+        i += 1
+
+    return cfg
+
+
+def bytecode_bytes(bytecode: t.Union[str, bytes, t.Iterable[str]]) -> bytes:
+    """
+    Convert EVM bytecode to raw bytes.
+
+    Args:
+      bytecode: EVM bytecode, either as a bytes object, a hexadecimal string
+        optionally starting with 0x, or a sequence of lines of hex (e.g. a file).
+    """
+    if isinstance(bytecode, (bytes, bytearray)):
+        return bytes(bytecode)
+    if not isinstance(bytecode, str):
+        bytecode = "".join(l.strip() for l in bytecode)
+    return bytes.fromhex(bytecode.strip().replace("0x", ""))
+
+
+class GraphCache:
+    """
+    A directory of analysed TAC graphs and their analytics, keyed by a hash
+    of the contract bytecode and the analysis settings used.
+
+    Entries are written atomically, so a cache directory may be shared by
+    several processes. When the total size of the entries exceeds the
+    maximum, the least recently used entries are deleted.
+    """
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE):
+        """
+        Args:
+          directory: location of the cache; created if it does not exist.
+          max_size: maximum total size in bytes of all cache entries.
+        """
+        self.directory = directory
+        """Location of the cache entries."""
+
+        self.max_size = max_size
+        """Maximum total size in bytes of all cache entries."""
+
+        self.hits = 0
+        """Number of lookups which found a cached graph."""
+
+        self.misses = 0
+        """Number of lookups which found no cached graph."""
+
+        os.makedirs(directory, exist_ok=True)
+        self.__size = sum(e.stat().st_size for e in self.__entries())
+
+    def key(self, bytecode: bytes) -> str:
+        """
+        Return the cache key of the given bytecode under the current settings.
+
+        Args:
+          bytecode: raw EVM bytecode.
+        """
+        h = hashlib.sha3_256(bytecode)
+        h.update("{}:{}".format(FORMAT_VERSION, settings.fingerprint()).encode())
+        return h.hexdigest()
+
+    def __path(self, key: str) -> str:
+        # Shard entries into subdirectories so no single directory grows huge.
+        return os.path.join(self.directory, key[:2], key + ENTRY_EXT)
+
+    def __entries(self) -> t.Iterator[os.DirEntry]:
+        for shard in os.scandir(self.directory):
+            if shard.is_dir():
+                yield from (e for e in os.scandir(shard.path)
+                            if e.name.endswith(ENTRY_EXT))
+
+    def get(self, bytecode: bytes) \
+        -> t.Optional[t.Tuple[tac_cfg.TACGraph, t.Dict[str, t.Any]]]:
+        """
+        Look up the analysed graph of the given bytecode.
+
+        Args:
+          bytecode: raw EVM bytecode.
+
+        Returns:
+          A (graph, analytics) pair, or None if the bytecode is not cached.
+        """
+        path = self.__path(self.key(bytecode))
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Mark this entry as recently used.
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+
+        try:
+            analytics_len = int.from_bytes(data[:4], "big")
+            analytics = _SafeUnpickler(io.BytesIO(data[4:4 + analytics_len])).load()
+            cfg = loads(data[4 + analytics_len:])
+        except Exception as e:
+            logging.warning("Discarding unreadable cache entry %s: %s", path, e)
+            self.__remove(path)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return cfg, analytics
+
+    def put(self, bytecode: bytes, cfg: tac_cfg.TACGraph,
+            analytics: t.Dict[str, t.Any]) -> None:
+        """
+        Store the analysed graph of the given bytecode, evicting old entries
+        if the cache has grown too large.
+
+        Args:
+          bytecode: raw EVM bytecode.
+          cfg: the analysed graph of the bytecode.
+          analytics: the analytics produced when analysing the graph.
+        """
+        path = self.__path(self.key(bytecode))
+        meta = pickle.dumps(analytics, pickle.HIGHEST_PROTOCOL)
+        data = len(meta).to_bytes(4, "big") + meta + dumps(cfg)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path),
+                                         delete=False) as f:
+            f.write(data)
+        os.replace(f.name, path)
+
+        self.__size += len(data)
+        if self.__size > self.max_size:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Delete least recently used entries until the cache is comfortably
+        below its maximum size.
+        """
+        entries = sorted(((e.stat().st_mtime, e.stat().st_size, e.path)
+                          for e in self.__entries()), reverse=True)
+        self.__size = sum(size for _, size, _ in entries)
+
+        while entries and self.__size > self.max_size * EVICT_RATIO:
+            _, size, path = entries.pop()
+            self.__remove(path)
+            self.__size -= size
+
+    @staticmethod
+    def __remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            # Another process got there first.
+            pass
+
+
+def analyse_bytecode(bytecode: t.Union[str, bytes, t.Iterable[str]],
+                     cache: GraphCache = None) \
+    -> t.Tuple[tac_cfg.TACGraph, t.Dict[str, t.Any]]:
+    """
+    Decompile and analyse the given bytecode, reusing a cached result for the
+    same bytecode and settings if one exists.
+
+    Args:
+      bytecode: EVM bytecode, as accepted by bytecode_bytes().
+      cache: the cache to use. If None, always analyse from scratch.
+
+    Returns:
+      The analysed TACGraph, and the analytics dict produced by
+      dataflow.analyse_graph(). If analytics are enabled and the result came
+      from the cache, the analytics include "cached": True.
+    """
+    code = bytecode_bytes(bytecode)
+
+    # Contracts differing only in their metadata share a cache entry when
+    # the metadata is going to be stripped anyway.
+    key_code = normalise.strip_metadata(code) if settings.strip_metadata \
+        else code
+
+    if cache is not None:
+        cached = cache.get(key_code)
+        if cached is not None:
+            cfg, analytics = cached
+            if settings.analytics:
+                analytics["cached"] = True
+            return cfg, analytics
+
+    cfg = tac_cfg.TACGraph(blockparse.EVMBytecodeParser(code).parse())
+    analytics = dataflow.analyse_graph(cfg)
+
+    if cache is not None:
+        cache.put(key_code, cfg, analytics)
+
+    return cfg, analytics
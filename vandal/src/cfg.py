@@ -30,11 +30,96 @@
 """cfg.py: Base classes for representing Control Flow Graphs (CFGs)"""
 
 import abc
+import array
 import typing as t
 
 import src.patterns as patterns
 
 
+class CSRGraph:
+    """
+    An immutable snapshot of a directed graph, with its nodes numbered densely
+    from zero and its adjacency stored in compressed sparse row form, both
+    forwards and backwards. Graph algorithms run over the integer ids and only
+    translate back to nodes at the end.
+
+    Args:
+      nodes: the nodes of the graph; node i is given id i.
+      edges: (head, tail) pairs of node ids.
+    """
+
+    def __init__(self, nodes: t.Sequence[object],
+                 edges: t.Iterable[t.Tuple[int, int]]):
+        self.nodes = list(nodes)
+        """The node with each id."""
+
+        edges = list(edges)
+        self.succ_ptr, self.succ_idx = self.__compress(len(self.nodes), edges)
+        """
+        The successors of node i are succ_idx[succ_ptr[i]:succ_ptr[i+1]].
+        """
+
+        self.pred_ptr, self.pred_idx = self.__compress(len(self.nodes),
+                                                       ((s, h) for h, s in edges))
+        """
+        The predecessors of node i are pred_idx[pred_ptr[i]:pred_ptr[i+1]].
+        """
+
+    @staticmethod
+    def __compress(n: int, edges: t.Iterable[t.Tuple[int, int]]) \
+        -> t.Tuple[array.array, array.array]:
+        rows = [[] for _ in range(n)]
+        for h, s in edges:
+            rows[h].append(s)
+        ptr = array.array('l', [0])
+        idx = array.array('l')
+        for row in rows:
+            idx.extend(row)
+            ptr.append(len(idx))
+        return ptr, idx
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def succs(self, i: int) -> t.Sequence[int]:
+        """Return the ids of the successors of node i."""
+        return self.succ_idx[self.succ_ptr[i]:self.succ_ptr[i + 1]]
+
+    def preds(self, i: int) -> t.Sequence[int]:
+        """Return the ids of the predecessors of node i."""
+        return self.pred_idx[self.pred_ptr[i]:self.pred_ptr[i + 1]]
+
+    def successor_lists(self) -> t.List[t.List[int]]:
+        """Return the successor ids of every node, as a list of lists."""
+        return [list(self.succs(i)) for i in range(len(self.nodes))]
+
+    def reached(self, starts: t.Iterable[int], backward: bool = False) \
+        -> bytearray:
+        """
+        Return a bitmap over the node ids, whose entries are nonzero exactly
+        for the nodes reachable from the given start ids, including the starts.
+
+        Args:
+          starts: the ids to search from.
+          backward: if true, follow edges in reverse.
+        """
+        ptr, idx = (self.pred_ptr, self.pred_idx) if backward \
+            else (self.succ_ptr, self.succ_idx)
+        seen = bytearray(len(self.nodes))
+        stack = []
+        for s in starts:
+            if not seen[s]:
+                seen[s] = 1
+                stack.append(s)
+        while stack:
+            node = stack.pop()
+            for succ in idx[ptr[node]:ptr[node + 1]]:
+                if not seen[succ]:
+                    seen[succ] = 1
+                    stack.append(succ)
+        return seen
+
+
 class ControlFlowGraph(patterns.Visitable):
     """Abstract base class for a Control Flow Graph (CFG)"""
 
@@ -44,14 +129,62 @@ class ControlFlowGraph(patterns.Visitable):
     def __init__(self):
         """Create a new empty ControlFlowGraph"""
 
+        self.version = 0
+        """
+        Incremented whenever the blocks or edges of this graph change, so that
+        results computed from the graph can tell when they are out of date.
+        """
+
         self.blocks = []
-        """List of BasicBlock objects"""
 
         self.root = None
         """The root BasicBlock object, or None for the empty graph"""
 
+    @property
+    def blocks(self) -> t.Tuple['BasicBlock', ...]:
+        """
+        Tuple of BasicBlock objects. Blocks must be added and removed through
+        add_block() and remove_block(); the tuple is reused until they are.
+        """
+        if self.__view is None:
+            self.__view = tuple(self.__compact())
+        return self.__view
+
+    @blocks.setter
+    def blocks(self, blocks: t.Iterable['BasicBlock']) -> None:
+        self.__blocks = list(blocks)
+        self.__index_slots()
+        self.mark_modified()
+
+    def mark_modified(self) -> None:
+        """
+        Record that the blocks or edges of this graph have changed. The methods
+        which add and remove blocks and edges call this themselves; anything
+        else which changes the graph's structure must call it too.
+        """
+        self.version += 1
+
+    def __index_slots(self) -> None:
+        """
+        Map each block to its slot in the block list, which serves as its
+        dense integer id until the list is next compacted.
+        """
+        self.__slots = {b: i for i, b in enumerate(self.__blocks)}
+        self.__dead = 0
+        self.__view = None
+
+    def __compact(self) -> t.List['BasicBlock']:
+        """
+        Squeeze the tombstones of removed blocks out of the block list,
+        renumbering the slots, and return the list.
+        """
+        if self.__dead:
+            self.__blocks = [b for b in self.__blocks if b is not None]
+            self.__index_slots()
+        return self.__blocks
+
     def __len__(self):
-        return len(self.blocks)
+        return len(self.__slots)
 
     def __str__(self):
         return self.__STR_SEP.join(str(b) for b in self.blocks)
@@ -68,14 +201,51 @@ class ControlFlowGraph(patterns.Visitable):
         for s in list(block.succs):
             self.remove_edge(block, s)
 
-        self.blocks.remove(block)
+        self.__drop_slot(block)
+        self.mark_modified()
+
+    def remove_blocks(self, blocks: t.Iterable['BasicBlock']) -> None:
+        """
+        Remove all the given blocks from the graph at once, disconnecting all
+        their incident edges.
+        """
+        gone = set(blocks)
+        if self.root in gone:
+            self.root = None
+
+        # Each surviving neighbour has its edge lists filtered only once,
+        # however many of the removed blocks it was adjacent to.
+        neighbours = {n for b in gone for n in b.preds + b.succs} - gone
+        for n in neighbours:
+            n.preds = [p for p in n.preds if p not in gone]
+            n.succs = [s for s in n.succs if s not in gone]
+        for b in gone:
+            b.preds = []
+            b.succs = []
+            self.__drop_slot(b)
+        self.mark_modified()
+
+    def __drop_slot(self, block: 'BasicBlock') -> None:
+        """
+        Remove the given block from the block list in constant time, by leaving
+        a tombstone in its slot to be compacted away on the next read.
+        """
+        slot = self.__slots.pop(block, None)
+        if slot is None:
+            raise ValueError("Block {} is not in the graph".format(block))
+        self.__blocks[slot] = None
+        self.__dead += 1
+        self.__view = None
 
     def add_block(self, block: 'BasicBlock') -> None:
         """
         Add the given block to the graph, assuming it does not already exist.
         """
-        if block not in self.blocks:
-            self.blocks.append(block)
+        if block not in self.__slots:
+            self.__slots[block] = len(self.__blocks)
+            self.__blocks.append(block)
+            self.__view = None
+            self.mark_modified()
 
     def has_edge(self, head: 'BasicBlock', tail: 'BasicBlock') -> bool:
         """
@@ -87,15 +257,19 @@ class ControlFlowGraph(patterns.Visitable):
         """Remove the CFG edge that goes from head to tail."""
         if tail in head.succs:
             head.succs.remove(tail)
+            self.mark_modified()
         if head in tail.preds:
             tail.preds.remove(head)
+            self.mark_modified()
 
     def add_edge(self, head: 'BasicBlock', tail: 'BasicBlock'):
         """Add a CFG edge that goes from head to tail."""
         if tail not in head.succs:
             head.succs.append(tail)
+            self.mark_modified()
         if head not in tail.preds:
             tail.preds.append(head)
+            self.mark_modified()
 
     def get_blocks_by_pc(self, pc: int) -> t.List['BasicBlock']:
         """Return the blocks whose spans include the given program counter value."""
@@ -122,6 +296,19 @@ class ControlFlowGraph(patterns.Visitable):
         for block in self.blocks:
             for successor in block.succs:
                 successor.preds.append(block)
+        self.mark_modified()
+
+    def csr(self) -> CSRGraph:
+        """
+        Return a CSRGraph snapshot of this graph, whose node ids are the
+        positions of the blocks in self.blocks. Edges to blocks no longer in
+        the graph are ignored.
+        """
+        blocks = self.blocks
+        slots = self.__slots
+        edges = [(i, slots[s]) for i, b in enumerate(blocks)
+                 for s in b.succs if s in slots]
+        return CSRGraph(blocks, edges)
 
     def reaches(self, block: 'BasicBlock', dests: t.Iterable['BasicBlock']) -> bool:
         """
@@ -131,21 +318,44 @@ class ControlFlowGraph(patterns.Visitable):
           block: Any block that is part of the tac_cfg the class was initialised with
           dests: A list of dests to check reachability with
         """
-        if block in dests:
-            return True
+        target = bytearray(len(self.blocks))
+        slots = self.__slots
+        for d in dests:
+            if d is block:
+                return True
+            if d in slots:
+                target[slots[d]] = 1
+
+        seen = bytearray(len(target))
         queue = [block]
-        traversed = []
         while queue:
             curr_block = queue.pop()
-            traversed.append(curr_block)
-            for b in dests:
-                if b in curr_block.succs:
-                    return True
             for b in curr_block.succs:
-                if b not in traversed:
-                    queue.append(b)
+                i = slots.get(b)
+                if i is None or seen[i]:
+                    continue
+                if target[i]:
+                    return True
+                seen[i] = 1
+                queue.append(b)
         return False
 
+    def reached(self, origin_addresses: t.Iterable[int],
+                backward: bool = False) -> bytearray:
+        """
+        Return a bitmap over the positions of the blocks in self.blocks, with a
+        nonzero entry for each block reachable from the input addresses.
+
+        Args:
+            origin_addresses: the addresses whose blocks to search from.
+            backward: if true, find the blocks that can reach the input
+                      addresses instead.
+        """
+        graph = self.csr()
+        origins = [i for i, b in enumerate(graph.nodes)
+                   if any(b.entry <= a <= b.exit for a in origin_addresses)]
+        return graph.reached(origins, backward)
+
     def transitive_closure(self, origin_addresses: t.Iterable[int]) \
         -> t.Iterable['BasicBlock']:
         """
@@ -155,24 +365,8 @@ class ControlFlowGraph(patterns.Visitable):
             origin_addresses: the input addresses blocks from which are reachable
                               to be returned.
         """
-
-        # Populate the work queue with the origin blocks for the transitive closure.
-        queue = []
-        for address in origin_addresses:
-            for block in self.get_blocks_by_pc(address):
-                if block not in queue:
-                    queue.append(block)
-        reached = []
-
-        # Follow all successor edges until we can find no more new blocks.
-        while queue:
-            block = queue.pop()
-            reached.append(block)
-            for succ in block.succs:
-                if succ not in queue and succ not in reached:
-                    queue.append(succ)
-
-        return reached
+        reached = self.reached(origin_addresses)
+        return [b for i, b in enumerate(self.blocks) if reached[i]]
 
     def remove_unreachable_blocks(self, origin_addresses: t.Iterable[int] = [0]) \
         -> t.Iterable['BasicBlock']:
@@ -189,13 +383,9 @@ class ControlFlowGraph(patterns.Visitable):
         Returns:
             An iterable of the blocks which were removed.
         """
-
-        reached = self.transitive_closure(origin_addresses)
-        removed = []
-        for block in list(self.blocks):
-            if block not in reached:
-                removed.append(block)
-                self.remove_block(block)
+        reached = self.reached(origin_addresses)
+        removed = [b for i, b in enumerate(self.blocks) if not reached[i]]
+        self.remove_blocks(removed)
         return removed
 
     def edge_list(self) -> t.Iterable[t.Tuple['BasicBlock', 'BasicBlock']]:
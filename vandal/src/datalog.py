@@ -0,0 +1,648 @@
+# BSD 3-Clause License
+#
+# Copyright (c) 2016, 2017, The University of Sydney. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""datalog.py: Manipulate the Souffle Datalog programs that analyse decompiled
+contracts."""
+
+import os
+import re
+import time
+import typing as t
+
+CONTRACT_TYPE = "Contract"
+"""The type of the contract id column added to relations in batched programs."""
+
+CONTRACT_VAR = "CONTRACT"
+"""The rule variable that carries the contract id in batched programs."""
+
+SCOPED_TYPES = {"Statement", "Variable"}
+"""
+Relations with an attribute of one of these types describe a single contract,
+and are given a contract id column in batched programs.
+"""
+
+DEADLINE_INTERVAL = 1024
+"""Number of join steps taken between checks of the evaluation deadline."""
+
+_TOKEN_RE = re.compile(r'"(?:\\.|[^"\\])*"|//[^\n]*|/\*.*?\*/', re.DOTALL)
+_INCLUDE_RE = re.compile(r'^\s*#include\s+"([^"]+)"\s*$', re.MULTILINE)
+_DECL_RE = re.compile(r'\.decl\s+(\w+)\s*\(([^)]*)\)')
+_ATOM_RE = re.compile(r'(\.decl\s+)?(?<![\w.])(\w+)(\s*)\(')
+
+
+def strip_comments(text: str) -> str:
+    """
+    Remove the comments from Datalog source text, leaving string literals
+    untouched.
+    """
+    return _TOKEN_RE.sub(lambda m: m.group(0) if m.group(0).startswith('"')
+                         else " ", text)
+
+
+def read_program(path: str, included: t.Optional[t.Set[str]] = None) -> str:
+    """
+    Read a Datalog program from a file, recursively inlining its #include
+    directives and stripping comments. Each file is included at most once.
+
+    Args:
+      path: the location of the program's main source file.
+      included: absolute paths of the files already included.
+
+    Returns:
+      The full text of the program.
+    """
+    if included is None:
+        included = set()
+    included.add(os.path.abspath(path))
+
+    with open(path) as f:
+        text = strip_comments(f.read())
+
+    def include(match):
+        inc_path = os.path.join(os.path.dirname(path), match.group(1))
+        if os.path.abspath(inc_path) in included:
+            return ""
+        return read_program(inc_path, included)
+
+    return _INCLUDE_RE.sub(include, text)
+
+
+def declarations(program: str) -> t.Dict[str, t.List[t.Tuple[str, str]]]:
+    """
+    Return a mapping from each relation declared in the given program text to
+    its list of (attribute name, attribute type) pairs.
+    """
+    decls = {}
+    for name, attrs in _DECL_RE.findall(program):
+        decls[name] = [tuple(s.strip() for s in attr.split(":"))
+                       for attr in attrs.split(",") if attr.strip()]
+    return decls
+
+
+def contract_relations(program: str) -> t.Set[str]:
+    """
+    Return the names of the relations in the given program text which
+    describe a single contract: those with a Statement or Variable attribute.
+    """
+    return {name for name, attrs in declarations(program).items()
+            if any(typ in SCOPED_TYPES for _, typ in attrs)}
+
+
+def batch_program(path: str) -> str:
+    """
+    Rewrite a single-contract Datalog program so that it analyses many
+    contracts in one evaluation.
+
+    Every relation in contract_relations() gains a leading contract id
+    attribute, and every atom of such a relation gains a leading CONTRACT_VAR
+    argument, so that each rule only ever relates facts of a single contract.
+    Input facts must then be prefixed with their contract's id, as output
+    tuples will be.
+
+    Args:
+      path: the location of the program's main source file.
+
+    Returns:
+      The text of the batched program.
+
+    Raises:
+      ValueError: if the program already uses the name CONTRACT_VAR.
+    """
+    program = read_program(path)
+    if re.search(r'\b{}\b'.format(CONTRACT_VAR), program):
+        raise ValueError("{} already uses the name {}".format(path, CONTRACT_VAR))
+    scoped = contract_relations(program)
+
+    def add_contract(match):
+        decl, name, space = match.groups()
+        if name not in scoped:
+            return match.group(0)
+        if decl:
+            return "{}{}{}(c:{}, ".format(decl, name, space, CONTRACT_TYPE)
+        return "{}{}({}, ".format(name, space, CONTRACT_VAR)
+
+    return ".type {}\n".format(CONTRACT_TYPE) + _ATOM_RE.sub(add_contract, program)
+
+
+# Evaluation
+
+class EvaluationTimeout(Exception):
+    """Evaluation of a program took longer than its allotted time."""
+
+
+class Atom:
+    """
+    A possibly-negated atom r(t1, ..., tn) in a rule. Each term is a
+    ("var", name), ("const", value) or ("wild",) pair.
+    """
+
+    def __init__(self, name: str, terms: t.List[tuple], negated: bool = False):
+        self.name = name
+        self.terms = terms
+        self.negated = negated
+
+    def __str__(self):
+        terms = ", ".join("_" if term[0] == "wild" else str(term[1])
+                          for term in self.terms)
+        return "{}{}({})".format("!" if self.negated else "", self.name, terms)
+
+    @property
+    def vars(self) -> t.Set[str]:
+        """The names of the variables appearing in this atom."""
+        return {term[1] for term in self.terms if term[0] == "var"}
+
+
+class Comparison:
+    """A constraint `left op right` between two terms in a rule body."""
+
+    OPS = {"=": lambda a, b: a == b,
+           "!=": lambda a, b: a != b,
+           "<": lambda a, b: a < b,
+           ">": lambda a, b: a > b,
+           "<=": lambda a, b: a <= b,
+           ">=": lambda a, b: a >= b}
+
+    def __init__(self, op: str, left: tuple, right: tuple):
+        self.op = op
+        self.left = left
+        self.right = right
+
+    def __str__(self):
+        return "{} {} {}".format(self.left[1], self.op, self.right[1])
+
+    @property
+    def vars(self) -> t.Set[str]:
+        """The names of the variables appearing in this constraint."""
+        return {term[1] for term in (self.left, self.right) if term[0] == "var"}
+
+
+class Rule:
+    """A Horn clause `head :- body`, where the body is a conjunction."""
+
+    def __init__(self, head: Atom, body: t.List[t.Union[Atom, Comparison]]):
+        self.head = head
+        self.body = body
+
+    def __str__(self):
+        return "{} :- {}.".format(self.head, ", ".join(str(l) for l in self.body))
+
+    @property
+    def positive(self) -> t.List[Atom]:
+        """The positive atoms of this rule's body."""
+        return [l for l in self.body if isinstance(l, Atom) and not l.negated]
+
+
+class Relation:
+    """
+    A set of tuples, with hash indexes on whichever argument positions have
+    been looked up, which are kept up to date as tuples are added.
+    """
+
+    def __init__(self, tuples: t.Iterable[tuple] = ()):
+        self.tuples = set(tuples)
+        self.__indexes = {}
+
+    def __len__(self):
+        return len(self.tuples)
+
+    def lookup(self, positions: t.Tuple[int, ...], key: tuple) -> t.Iterable[tuple]:
+        """
+        Return the tuples whose values at the given positions equal key.
+        """
+        if not positions:
+            return self.tuples
+        if positions not in self.__indexes:
+            index = {}
+            for tup in self.tuples:
+                index.setdefault(tuple(tup[p] for p in positions), []).append(tup)
+            self.__indexes[positions] = index
+        return self.__indexes[positions].get(key, ())
+
+    def add(self, tuples: t.Iterable[tuple]) -> t.Set[tuple]:
+        """
+        Add the given tuples to this relation, returning those that were new.
+        """
+        new = set(tuples) - self.tuples
+        self.tuples |= new
+        for positions, index in self.__indexes.items():
+            for tup in new:
+                index.setdefault(tuple(tup[p] for p in positions), []).append(tup)
+        return new
+
+
+_CLAUSE_TOKEN_RE = re.compile(r'\s*(?:("(?:\\.|[^"\\])*")|(:-)|(!=|<=|>=|[=<>])'
+                              r'|([A-Za-z_?][\w?]*)|(-?\d+)|([(),;!.]))')
+
+
+class Program:
+    """
+    A Datalog program in the subset of Souffle's language used by the Vandal
+    analyses: relation declarations, input and output directives, ground
+    facts, and rules whose bodies may contain negation, disjunction and
+    comparisons. Evaluated bottom-up, one stratum at a time, semi-naively.
+    """
+
+    def __init__(self, text: str):
+        """
+        Args:
+          text: the program source, with includes and comments already
+                handled, as by read_program().
+
+        Raises:
+          ValueError: if the program cannot be parsed or is not stratifiable.
+        """
+        self.decls = {}
+        """A mapping from relation names to (attribute, type) pair lists."""
+
+        self.inputs = []
+        """The names of the relations to be read from the input facts."""
+
+        self.outputs = []
+        """The names of the relations produced as output."""
+
+        self.facts = {}
+        """A mapping from relation names to the ground facts in the program."""
+
+        self.rules = []
+        """The program's rules, with disjunctive bodies split apart."""
+
+        clauses = []
+        for line in text.splitlines():
+            stripped = line.strip()
+            if stripped.startswith("."):
+                self.__directive(stripped)
+            else:
+                clauses.append(line)
+        self.__parse_clauses(self.__tokenise("\n".join(clauses)))
+
+        self.strata = self.__stratify()
+        """Lists of mutually recursive relations, in evaluation order."""
+
+    @classmethod
+    def from_file(cls, path: str) -> 'Program':
+        """Parse the program in the given file, following its includes."""
+        return cls(read_program(path))
+
+    def __directive(self, line: str) -> None:
+        if line.startswith(".decl"):
+            for name, attrs in declarations(line).items():
+                self.decls[name] = attrs
+        elif line.startswith(".input") or line.startswith(".output"):
+            directive, _, names = line.partition(" ")
+            for name in names.split(","):
+                name = name.split("(")[0].strip()
+                if name:
+                    dest = self.inputs if directive == ".input" else self.outputs
+                    dest.append(name)
+
+    @staticmethod
+    def __tokenise(text: str) -> t.List[t.Tuple[str, str]]:
+        tokens = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            match = _CLAUSE_TOKEN_RE.match(text, pos)
+            if match is None:
+                raise ValueError("Unexpected input: {}".format(text[pos:pos+20]))
+            kinds = ("string", "turnstile", "cmp", "ident", "number", "punct")
+            for kind, value in zip(kinds, match.groups()):
+                if value is not None:
+                    tokens.append((kind, value))
+            pos = match.end()
+        return tokens
+
+    def __parse_clauses(self, tokens: t.List[t.Tuple[str, str]]) -> None:
+        pos = 0
+
+        def peek():
+            return tokens[pos] if pos < len(tokens) else (None, None)
+
+        def expect(value):
+            nonlocal pos
+            if peek()[1] != value:
+                raise ValueError("Expected '{}' but found '{}'".format(value, peek()[1]))
+            pos += 1
+
+        def term():
+            nonlocal pos
+            kind, value = peek()
+            pos += 1
+            if kind == "string":
+                return ("const", value[1:-1])
+            if kind == "number":
+                return ("const", int(value))
+            if kind == "ident":
+                return ("wild",) if value == "_" else ("var", value)
+            raise ValueError("Expected a term but found '{}'".format(value))
+
+        def atom(negated=False):
+            nonlocal pos
+            kind, name = peek()
+            if kind != "ident":
+                raise ValueError("Expected a relation name but found '{}'".format(name))
+            pos += 1
+            expect("(")
+            terms = [term()]
+            while peek()[1] == ",":
+                pos += 1
+                terms.append(term())
+            expect(")")
+            return Atom(name, terms, negated)
+
+        def literal():
+            nonlocal pos
+            if peek()[1] == "!":
+                pos += 1
+                return atom(negated=True)
+            if pos + 1 < len(tokens) and tokens[pos][0] == "ident" and \
+               tokens[pos + 1][1] == "(":
+                return atom()
+            left = term()
+            kind, op = peek()
+            if kind != "cmp":
+                raise ValueError("Expected a comparison but found '{}'".format(op))
+            pos += 1
+            return Comparison(op, left, term())
+
+        while pos < len(tokens):
+            head = atom()
+            if peek()[1] == ".":
+                pos += 1
+                if any(term[0] != "const" for term in head.terms):
+                    raise ValueError("Fact {} is not ground".format(head))
+                self.facts.setdefault(head.name, set()).add(
+                    tuple(term[1] for term in head.terms))
+                continue
+
+            expect(":-")
+            bodies = [[literal()]]
+            while peek()[1] in (",", ";"):
+                if peek()[1] == ";":
+                    bodies.append([])
+                pos += 1
+                bodies[-1].append(literal())
+            expect(".")
+            for body in bodies:
+                self.rules.append(Rule(head, body))
+
+    def __stratify(self) -> t.List[t.List[str]]:
+        # Order the strongly connected components of the dependency graph
+        # between derived relations, using Tarjan's algorithm.
+        deps = {}
+        for rule in self.rules:
+            deps.setdefault(rule.head.name, set()).update(
+                l.name for l in rule.body if isinstance(l, Atom))
+        derived = set(deps)
+
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        strata = []
+
+        def visit(node):
+            index[node] = low[node] = len(index)
+            stack.append(node)
+            on_stack.add(node)
+            for succ in deps.get(node, ()):
+                if succ not in derived:
+                    continue
+                if succ not in index:
+                    visit(succ)
+                    low[node] = min(low[node], low[succ])
+                elif succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            if low[node] == index[node]:
+                component = []
+                while True:
+                    succ = stack.pop()
+                    on_stack.discard(succ)
+                    component.append(succ)
+                    if succ == node:
+                        break
+                strata.append(component)
+
+        for node in sorted(derived):
+            if node not in index:
+                visit(node)
+
+        for component in strata:
+            for rule in self.rules:
+                if rule.head.name in component:
+                    for l in rule.body:
+                        if isinstance(l, Atom) and l.negated and l.name in component:
+                            raise ValueError("Program is not stratifiable: {} "
+                                             "depends negatively on {}".format(
+                                                 rule.head.name, l.name))
+        return strata
+
+    def load_facts(self, facts: t.Dict[str, str]) -> t.Dict[str, t.Set[tuple]]:
+        """
+        Convert the tab-separated .facts file contents generated by
+        exporter.CFGTsvExporter.facts() into tuples for this program's input
+        relations, converting number attributes to ints.
+        """
+        relations = {}
+        for name in self.inputs:
+            text = facts.get(name + ".facts", "")
+            numeric = [typ == "number" for _, typ in self.decls.get(name, [])]
+            tuples = set()
+            for line in text.splitlines():
+                values = line.split("\t")
+                tuples.add(tuple(int(v) if i < len(numeric) and numeric[i] else v
+                                 for i, v in enumerate(values)))
+            relations[name] = tuples
+        return relations
+
+    def evaluate(self, inputs: t.Dict[str, t.Iterable[tuple]],
+                 bailout_seconds: float = -1) -> t.Dict[str, t.Set[tuple]]:
+        """
+        Evaluate the program over the given input relations.
+
+        Args:
+          inputs: a mapping from input relation names to their tuples.
+          bailout_seconds: give up after this many seconds; negative for no
+                           limit.
+
+        Returns:
+          A mapping from each output relation to its tuples.
+
+        Raises:
+          EvaluationTimeout: if evaluation runs past bailout_seconds.
+        """
+        deadline = None
+        if bailout_seconds >= 0:
+            deadline = time.perf_counter() + bailout_seconds
+
+        relations = {}
+        for name in set(self.decls) | set(inputs) | set(self.facts):
+            relations[name] = Relation(self.facts.get(name, ()))
+        for name, tuples in inputs.items():
+            relations[name].add(tuples)
+
+        for stratum in self.strata:
+            self.__evaluate_stratum(stratum, relations, deadline)
+
+        return {name: relations[name].tuples for name in self.outputs}
+
+    def __evaluate_stratum(self, stratum: t.List[str],
+                           relations: t.Dict[str, Relation],
+                           deadline: t.Optional[float]) -> None:
+        rules = [r for r in self.rules if r.head.name in stratum]
+        recursive = set(stratum)
+
+        # The first round derives everything possible from the full relations;
+        # subsequent rounds only join through tuples derived in the last one.
+        self.__check_deadline(deadline)
+        delta = {}
+        for rule in rules:
+            new = relations[rule.head.name].add(self.__fire(rule, relations,
+                                                            deadline=deadline))
+            delta.setdefault(rule.head.name, set()).update(new)
+
+        while any(delta.values()):
+            self.__check_deadline(deadline)
+            delta_rels = {name: Relation(tuples) for name, tuples in delta.items()}
+            derived = {}
+            for rule in rules:
+                for i, atom in enumerate(rule.positive):
+                    if atom.name in recursive and delta_rels.get(atom.name):
+                        tuples = self.__fire(rule, relations, i, delta_rels[atom.name],
+                                             deadline)
+                        derived.setdefault(rule.head.name, set()).update(tuples)
+            delta = {name: relations[name].add(tuples)
+                     for name, tuples in derived.items()}
+
+    @staticmethod
+    def __check_deadline(deadline: t.Optional[float]) -> None:
+        if deadline is not None and time.perf_counter() > deadline:
+            raise EvaluationTimeout("Datalog evaluation timed out")
+
+    @staticmethod
+    def __plan(rule: Rule, relations: t.Dict[str, Relation],
+               delta_atom: t.Optional[Atom]) -> t.List[t.Union[Atom, Comparison]]:
+        # Order the body greedily: the delta atom first, then whichever atom has
+        # the most bound arguments (the smallest relation breaking ties), with
+        # negations and comparisons placed as soon as their variables are bound.
+        remaining = list(rule.body)
+        bound = set()
+        plan = []
+
+        def place_filters():
+            for l in list(remaining):
+                if (isinstance(l, Comparison) or l.negated) and l.vars <= bound:
+                    plan.append(l)
+                    remaining.remove(l)
+
+        if delta_atom is not None:
+            remaining.remove(delta_atom)
+            plan.append(delta_atom)
+            bound |= delta_atom.vars
+        place_filters()
+
+        while remaining:
+            atoms = [l for l in remaining if isinstance(l, Atom) and not l.negated]
+            if not atoms:
+                raise ValueError("Unbound variables in rule {}".format(rule))
+
+            def cost(a):
+                n_bound = sum(1 for term in a.terms
+                              if term[0] == "const" or
+                              (term[0] == "var" and term[1] in bound))
+                return -n_bound, len(relations[a.name])
+
+            best = min(atoms, key=cost)
+            remaining.remove(best)
+            plan.append(best)
+            bound |= best.vars
+            place_filters()
+
+        return plan
+
+    def __fire(self, rule: Rule, relations: t.Dict[str, Relation],
+               delta_index: t.Optional[int] = None,
+               delta: t.Optional[Relation] = None,
+               deadline: t.Optional[float] = None) -> t.Set[tuple]:
+        # Derive the head tuples of a rule, reading the delta_index'th positive
+        # atom from delta rather than its full relation. A single join can be
+        # arbitrarily large, so the deadline is checked as it goes.
+        delta_atom = None if delta_index is None else rule.positive[delta_index]
+        plan = self.__plan(rule, relations, delta_atom)
+        results = set()
+        steps = 0
+
+        def value(term, env):
+            return term[1] if term[0] == "const" else env[term[1]]
+
+        def join(step, env):
+            nonlocal steps
+            if step == len(plan):
+                results.add(tuple(value(term, env) for term in rule.head.terms))
+                return
+
+            l = plan[step]
+            if isinstance(l, Comparison):
+                if Comparison.OPS[l.op](value(l.left, env), value(l.right, env)):
+                    join(step + 1, env)
+                return
+
+            positions = []
+            key = []
+            free = []
+            for i, term in enumerate(l.terms):
+                if term[0] == "const":
+                    positions.append(i)
+                    key.append(term[1])
+                elif term[0] == "var":
+                    if term[1] in env:
+                        positions.append(i)
+                        key.append(env[term[1]])
+                    else:
+                        free.append((i, term[1]))
+            rel = delta if l is delta_atom else relations[l.name]
+            matches = rel.lookup(tuple(positions), tuple(key))
+
+            if l.negated:
+                if not matches:
+                    join(step + 1, env)
+                return
+
+            for tup in matches:
+                steps += 1
+                if steps % DEADLINE_INTERVAL == 0:
+                    self.__check_deadline(deadline)
+                new_env = dict(env)
+                for i, var in free:
+                    if new_env.setdefault(var, tup[i]) != tup[i]:
+                        break
+                else:
+                    join(step + 1, new_env)
+
+        join(0, {})
+        return results
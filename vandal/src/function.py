@@ -31,6 +31,7 @@
 Classes for identifying and exporting functions in the control flow graph.
 Tested and developed on Solidity version 0.4.11"""
 
+import collections
 import typing as t
 
 import src.memtypes as memtypes
@@ -77,6 +78,13 @@ class FunctionExtractor:
         self.private_functions = []
         self.invoc_pairs = {}  # a mapping from invocation sites to return addresses
 
+        # Indexes over the cfg, which live only while an extraction is running.
+        self.__graph = None  # a CSRGraph snapshot of the cfg
+        self.__slots = {}  # a mapping from blocks to their ids in the snapshot
+        self.__idents = {}  # a mapping from identifiers to blocks
+        self.__reachers = {}  # memoised bitmaps of the blocks reaching some set
+        self.__bodies = (None, None)  # cached function body sets
+
     def __str__(self) -> str:
         """
         Returns a string representation of all the functions in the graph
@@ -122,25 +130,27 @@ class FunctionExtractor:
 
         # Find the function signature variable holding call data 0,
         # at the earliest query to that location in the program.
-        load_list = []
-        load_block = None
-
-        for block in sorted(self.cfg.blocks):
-            load_list = [op for op in block.tac_ops
-                         if op.opcode == opcodes.CALLDATALOAD
-                         and op.args[0].value.const_value == 0]
-            if len(load_list) != 0:
-                load_block = block
-                break
-
-        if len(load_list) == 0:
+        loads = {}
+        for block in self.cfg.blocks:
+            for op in block.tac_ops:
+                if op.opcode == opcodes.CALLDATALOAD \
+                   and op.args[0].value.const_value == 0:
+                    loads.setdefault(block, op)
+        if len(loads) == 0:
             return []
-        sig_var = load_list[0].lhs
-
-        # Follow the signature until it's transformed into its final shape.
-        for o in load_block.tac_ops:
-            if not isinstance(o, tac_cfg.TACAssignOp) or id(sig_var) not in [id(a.value) for a in o.args]:
-                continue
+        load_block = min(loads)
+        sig_var = loads[load_block].lhs
+
+        # Follow the signature through its uses until it's transformed into its
+        # final shape.
+        uses = self.__var_uses()
+        pos = -1
+        while True:
+            local = [(i, o) for b, i, o in uses.get(id(sig_var), ())
+                     if b is load_block and i > pos]
+            if not local:
+                break
+            pos, o = local[0]
             if o.opcode == opcodes.EQ:
                 break
             sig_var = o.lhs
@@ -149,21 +159,18 @@ class FunctionExtractor:
         func_sigs = []
         fallthroughs = []
 
-        for b in self.cfg.blocks:
-            for o in b.tac_ops:
-                if not isinstance(o, tac_cfg.TACAssignOp) or id(sig_var) not in [id(a.value) for a in o.args]:
-                    continue
-                if o.opcode == opcodes.EQ:
-                    sig = [a.value for a in o.args if id(a.value) != id(sig_var)][0]
+        for b, _, o in uses.get(id(sig_var), ()):
+            if o.opcode == opcodes.EQ:
+                sig = [a.value for a in o.args if id(a.value) != id(sig_var)][0]
 
-                    # Append the non-fallthrough successor to the function sig list
-                    for succ in [s for s in b.succs if s != b.fallthrough]:
-                        func_sigs.append((succ, hex(sig.const_value)))
+                # Append the non-fallthrough successor to the function sig list
+                for succ in [s for s in b.succs if s != b.fallthrough]:
+                    func_sigs.append((succ, hex(sig.const_value)))
 
-                    # Save the fallthrough location so the last one can be added as
-                    # the fallback function
-                    if b.fallthrough is not None:
-                        fallthroughs.append(b.fallthrough)
+                # Save the fallthrough location so the last one can be added as
+                # the fallback function
+                if b.fallthrough is not None:
+                    fallthroughs.append(b.fallthrough)
 
         # Add the fallback function
         if fallthroughs:
@@ -171,6 +178,38 @@ class FunctionExtractor:
 
         return [self.get_public_function(s[0], signature=s[1]) for s in func_sigs]
 
+    def __var_uses(self) -> t.Dict[int, t.List[t.Tuple[tac_cfg.TACBasicBlock, int,
+                                                      tac_cfg.TACAssignOp]]]:
+        """
+        Index the assignments in the cfg by the variables they read.
+
+        Returns:
+          A mapping from the id of each variable to the (block, position, op)
+          triples of the TACAssignOps taking it as an argument, in graph order.
+        """
+        uses = {}
+        for block in self.cfg.blocks:
+            for i, op in enumerate(block.tac_ops):
+                if not isinstance(op, tac_cfg.TACAssignOp):
+                    continue
+                for var in {id(a.value): None for a in op.args}:
+                    uses.setdefault(var, []).append((block, i, op))
+        return uses
+
+    def __body_sets(self) -> t.Tuple[t.List[t.Set[tac_cfg.TACBasicBlock]],
+                                     t.Set[tac_cfg.TACBasicBlock]]:
+        """
+        Return the set of blocks in the body of each extracted function, in order,
+        and the set of blocks belonging to any function. The sets are memoised
+        until the extracted functions change.
+        """
+        funcs = self.functions
+        key = [id(f) for f in funcs]
+        if self.__bodies[0] != key:
+            bodies = [set(f.body) for f in funcs]
+            self.__bodies = (key, (bodies, set().union(*bodies)))
+        return self.__bodies[1]
+
     def get_public_function(self, block: tac_cfg.TACBasicBlock,
                             signature: str = "") -> Function:
         """
@@ -184,23 +223,25 @@ class FunctionExtractor:
           A Function object containing the blocks composing the function body.
         """
         body = []
-        queue = [block]
+        in_body = set()
+        queue = collections.deque([block])
         end_block = None
         cur_block = None  # A placeholder for prev_block
         jump = False  # Keeps track of whether we have just jumped or not
         pre_jump_block = block
+        func_bodies, _ = self.__body_sets()
         while len(queue) > 0:
             prev_block = cur_block
-            cur_block = queue.pop(0)
+            cur_block = queue.popleft()
 
             # jump over function bodies
-            for f in self.functions:
-                if cur_block in f.body and not jump:
-                    cur_block = self.__jump_to_next_loc(cur_block, body,
+            for f_body in func_bodies:
+                if cur_block in f_body and not jump:
+                    cur_block = self.__jump_to_next_loc(cur_block, in_body,
                                                         prev_block.exit_stack)
-                if cur_block in f.body and jump:
+                if cur_block in f_body and jump:
                     # If we jumped, the previous block is actually from before the jump
-                    cur_block = self.__jump_to_next_loc(cur_block, body,
+                    cur_block = self.__jump_to_next_loc(cur_block, in_body,
                                                         pre_jump_block.exit_stack)
                     jump = False
             # In case we didn't find a new block to jump to
@@ -210,16 +251,18 @@ class FunctionExtractor:
             if cur_block in self.invoc_pairs:
                 jump = True
                 pre_jump_block = cur_block
-                if cur_block not in body:
+                if cur_block not in in_body:
                     body.append(cur_block)
+                    in_body.add(cur_block)
                 cur_block = self.invoc_pairs[cur_block]
             # Since an invocation site always has a successor,
             # it can't be an end block for the function
 
             if len(cur_block.succs) == 0:
                 end_block = cur_block
-            if cur_block not in body:
+            if cur_block not in in_body:
                 body.append(cur_block)
+                in_body.add(cur_block)
                 for b in cur_block.succs:
                     queue.append(b)
         f = Function()
@@ -232,7 +275,7 @@ class FunctionExtractor:
         return f
 
     def __jump_to_next_loc(self, block: tac_cfg.TACBasicBlock,
-                           body: t.List[tac_cfg.TACBasicBlock],
+                           body: t.Collection[tac_cfg.TACBasicBlock],
                            exit_stack: memtypes.VariableStack) -> tac_cfg.TACBasicBlock:
         """
         Helper method to jump over private functions during public function
@@ -248,23 +291,21 @@ class FunctionExtractor:
                       function currently being identified.
         """
         queue = [block]
-        visited = [block]
+        visited = {block}
+        exit_stack = str(exit_stack)
+        _, func_blocks = self.__body_sets()
         while len(queue) > 0:
             block = queue.pop()
             if len(block.succs) == 0:
                 return block
-            visited.append(block)
-            in_func = False
-            for f in self.functions:
-                if block in f.body:
-                    in_func = True
-                    break
+            visited.add(block)
+            in_func = block in func_blocks
             # Check that the block is not related to another function,
             # and we haven't visited it yet, and that it is in the exit stack
             # We can discard blocks in the body of the function being identified
             # since we want to discover new blocks, not old ones
             if not in_func and block not in self.invoc_pairs.keys() and \
-                block.ident() in str(exit_stack) and block not in body:
+                block.ident() in exit_stack and block not in body:
                 return block
             for succ in block.succs:
                 if succ not in visited:
@@ -278,6 +319,49 @@ class FunctionExtractor:
          Returns:
           A list of of Function objects: the private functions identified in the cfg
         """
+        self.__index_cfg()
+        try:
+            return self.__extract_private_functions()
+        finally:
+            self.__graph = None
+            self.__slots = {}
+            self.__idents = {}
+            self.__reachers = {}
+
+    def __index_cfg(self) -> None:
+        """
+        Snapshot the cfg, so that the reachability queries made while
+        extracting functions can share one traversal per set of destinations.
+        """
+        self.__graph = self.cfg.csr()
+        self.__slots = {b: i for i, b in enumerate(self.__graph.nodes)}
+        self.__idents = {}
+        for b in self.__graph.nodes:
+            self.__idents.setdefault(b.ident(), b)
+        self.__reachers = {}
+
+    def __reaches(self, block: tac_cfg.TACBasicBlock,
+                  dests: t.Iterable[tac_cfg.TACBasicBlock]) -> bool:
+        """
+        As ControlFlowGraph.reaches(), but answered from a memoised backwards
+        traversal from the destinations while the cfg is indexed.
+        """
+        dests = frozenset(dests)
+        if self.__graph is None or block not in self.__slots \
+           or not dests <= self.__slots.keys():
+            return self.cfg.reaches(block, dests)
+        if dests not in self.__reachers:
+            self.__reachers[dests] = self.__graph.reached(
+                (self.__slots[d] for d in dests), backward=True)
+        return bool(self.__reachers[dests][self.__slots[block]])
+
+    def __block_by_ident(self, ident: str) -> tac_cfg.TACBasicBlock:
+        """As ControlFlowGraph.get_block_by_ident(), indexed while the cfg is."""
+        if self.__graph is None:
+            return self.cfg.get_block_by_ident(ident)
+        return self.__idents.get(ident)
+
+    def __extract_private_functions(self) -> t.List['Function']:
         # Get invocation site -> return block mappings
         start_blocks = []
         pair_list = []
@@ -337,9 +421,9 @@ class FunctionExtractor:
                 if len(pre.delta_stack) == 0:
                     return None
                 for val in list(pre.delta_stack):
-                    ref_block = self.cfg.get_block_by_ident(str(val))
+                    ref_block = self.__block_by_ident(str(val))
                     # Ensure that the block pointed to by the block exists and is reachable
-                    if ref_block is not None and self.cfg.reaches(pre, [ref_block]):
+                    if ref_block is not None and self.__reaches(pre, [ref_block]):
                         func_mapping[pre] = ref_block
                         func_succs.append(ref_block)
                         break
@@ -368,22 +452,25 @@ class FunctionExtractor:
         # Traverse down levels with BFS until we hit a block that has the return
         # addresses specified above
         body = []
-        queue = [block]
+        in_body = set()
+        returns = set(return_blocks)
+        queue = collections.deque([block])
         end = False
         while len(queue) > 0:
-            curr_block = queue.pop(0)
+            curr_block = queue.popleft()
             # When we call a function, we just jump to the return address
             for entry in invoc_pairs:
                 if curr_block in entry:
                     body.append(curr_block)
+                    in_body.add(curr_block)
                     curr_block = entry[curr_block]
-            cur_succs = [b for b in curr_block.succs]
-            if set(return_blocks).issubset(set(cur_succs)):
+            if returns.issubset(curr_block.succs):
                 end = True
-            if curr_block not in body and self.cfg.reaches(curr_block, return_blocks):
+            if curr_block not in in_body and self.__reaches(curr_block, returns):
                 body.append(curr_block)
+                in_body.add(curr_block)
                 for b in curr_block.succs:
-                    if b not in return_blocks:
+                    if b not in returns:
                         queue.append(b)
 
         if end:
@@ -42,6 +42,8 @@ from copy import copy
 
 
 class LatticeElement(abc.ABC):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         """
         Construct a lattice element with the given value.
@@ -119,6 +121,8 @@ class LatticeElement(abc.ABC):
 
 class BoundedLatticeElement(LatticeElement):
     """An element from a lattice with defined Top and Bottom elements."""
+    __slots__ = ()
+
     TOP_SYMBOL = "⊤"
     BOTTOM_SYMBOL = "⊥"
 
@@ -199,6 +203,8 @@ class IntLatticeElement(BoundedLatticeElement):
     compare superior and inferior with every other element, respectively.
     """
 
+    __slots__ = ()
+
     def __init__(self, value: int):
         """
         Args:
@@ -264,6 +270,8 @@ class SubsetLatticeElement(BoundedLatticeElement):
     elements, the bottom is the empty set, and other elements are subsets of top.
     """
 
+    __slots__ = ()
+
     def __init__(self, value: t.Iterable):
         """
         Args:
@@ -0,0 +1,216 @@
+# BSD 3-Clause License
+#
+# Copyright (c) 2016, 2017, The University of Sydney. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""normalise.py: Normalise EVM bytecode, so that contracts which differ only
+in compiler metadata or embedded constants can be recognised as equivalent.
+
+Fingerprints are SHA3-256 digests from hashlib, like the keys of the graph
+cache, rather than Ethereum's Keccak-256; they only identify code, and are
+never compared with on-chain hashes."""
+
+import hashlib
+
+import src.opcodes as opcodes
+
+METADATA_KEYS = {b"bzzr0", b"bzzr1", b"ipfs", b"solc", b"experimental", b"vyper"}
+"""Keys which identify a CBOR map as compiler metadata."""
+
+DEFAULT_MIN_CONST_SIZE = 20
+"""
+By default, only PUSH constants at least this many bytes long are
+canonicalised. Shorter constants are typically jump destinations, offsets and
+selectors, which determine the structure of the program. Longer ones are
+typically addresses, hashes and immutable values.
+"""
+
+
+def _cbor_item_end(data: bytes, i: int, depth: int = 0) -> int:
+    """
+    Return the index just past the CBOR data item starting at data[i].
+    Only the definite-length types used by compiler metadata are supported.
+
+    Raises:
+      ValueError: if the data is not a supported, well-formed CBOR item.
+    """
+    if i >= len(data) or depth > 4:
+        raise ValueError("Truncated CBOR item.")
+
+    major, info = data[i] >> 5, data[i] & 0x1f
+    i += 1
+
+    # Simple values: false, true, null.
+    if major == 7:
+        if info not in (20, 21, 22):
+            raise ValueError("Unsupported CBOR simple value.")
+        return i
+
+    # The argument is either inline, or in the following 1, 2, 4 or 8 bytes.
+    if info < 24:
+        arg = info
+    elif info < 28:
+        size = 1 << (info - 24)
+        if i + size > len(data):
+            raise ValueError("Truncated CBOR argument.")
+        arg = int.from_bytes(data[i:i + size], "big")
+        i += size
+    else:
+        raise ValueError("Unsupported CBOR argument encoding.")
+
+    if major in (0, 1):
+        return i
+    if major in (2, 3):
+        if i + arg > len(data):
+            raise ValueError("Truncated CBOR string.")
+        return i + arg
+    if major == 4:
+        for _ in range(arg):
+            i = _cbor_item_end(data, i, depth + 1)
+        return i
+    if major == 5:
+        for _ in range(2 * arg):
+            i = _cbor_item_end(data, i, depth + 1)
+        return i
+    raise ValueError("Unsupported CBOR major type.")
+
+
+def metadata_length(code: bytes) -> int:
+    """
+    Return the length of the compiler metadata trailer at the end of the given
+    runtime bytecode, including its two byte length suffix, or 0 if there is
+    no recognisable trailer.
+
+    Solidity and Vyper append a CBOR-encoded map (holding e.g. a swarm or
+    IPFS hash of the contract's metadata, and the compiler version) to the
+    runtime code, followed by the length of that map as a big-endian uint16.
+
+    Args:
+      code: raw EVM runtime bytecode.
+    """
+    if len(code) < 2:
+        return 0
+    length = int.from_bytes(code[-2:], "big")
+    start = len(code) - 2 - length
+    if length == 0 or start < 0 or code[start] >> 5 != 5:
+        return 0
+
+    cbor = code[start:-2]
+    keys = set()
+    try:
+        if _cbor_item_end(cbor, 0) != len(cbor) or cbor[0] & 0x1f >= 24:
+            return 0
+        i = 1
+        for _ in range(cbor[0] & 0x1f):
+            key_end = _cbor_item_end(cbor, i)
+            if cbor[i] >> 5 == 3:
+                keys.add(bytes(cbor[i + 1:key_end]))
+            i = _cbor_item_end(cbor, key_end)
+    except ValueError:
+        return 0
+
+    # The map must contain at least one key that metadata maps use.
+    if not any(k.endswith(m) for k in keys for m in METADATA_KEYS):
+        return 0
+
+    return length + 2
+
+
+def strip_metadata(code: bytes) -> bytes:
+    """
+    Return the given runtime bytecode without its compiler metadata trailer.
+
+    Args:
+      code: raw EVM runtime bytecode.
+    """
+    length = metadata_length(code)
+    return code[:len(code) - length] if length else code
+
+
+def canonicalise_constants(code: bytes,
+                           min_size: int = DEFAULT_MIN_CONST_SIZE) -> bytes:
+    """
+    Return the given bytecode with the arguments of all sufficiently large PUSH
+    instructions zeroed. Instruction boundaries and offsets are unchanged, so
+    the result has the same control flow structure as the input.
+
+    Args:
+      code: raw EVM bytecode.
+      min_size: only the arguments of PUSH instructions with at least this many
+        bytes of argument are zeroed.
+    """
+    out = bytearray(code)
+    push_len = opcodes.PUSH_LEN
+    pc = 0
+
+    while pc < len(out):
+        size = push_len[out[pc]]
+        if size >= min_size:
+            end = min(pc + 1 + size, len(out))
+            out[pc + 1:end] = bytes(end - pc - 1)
+        pc += 1 + size
+
+    return bytes(out)
+
+
+def normalise(code: bytes, strip: bool = True, canonicalise: bool = False,
+              min_const_size: int = DEFAULT_MIN_CONST_SIZE) -> bytes:
+    """
+    Normalise runtime bytecode.
+
+    Args:
+      code: raw EVM runtime bytecode.
+      strip: remove any compiler metadata trailer.
+      canonicalise: zero large PUSH constants; see canonicalise_constants().
+      min_const_size: the smallest PUSH argument size to canonicalise.
+    """
+    if strip:
+        code = strip_metadata(code)
+    if canonicalise:
+        code = canonicalise_constants(code, min_const_size)
+    return code
+
+
+def fingerprint(code: bytes, canonicalise: bool = True,
+                min_const_size: int = DEFAULT_MIN_CONST_SIZE,
+                strip: bool = True) -> str:
+    """
+    Return a structural fingerprint of the given runtime bytecode: a hex
+    digest of the code with its metadata trailer stripped and, by default,
+    its large PUSH constants canonicalised. Contracts with equal fingerprints
+    have identical control flow graphs.
+
+    Args:
+      code: raw EVM runtime bytecode.
+      canonicalise: zero large PUSH constants before hashing. If False, equal
+        fingerprints mean the code is identical apart from its metadata.
+      min_const_size: the smallest PUSH argument size to canonicalise.
+      strip: remove the metadata trailer before hashing. If this and
+        canonicalise are False, equal fingerprints mean identical code.
+    """
+    return hashlib.sha3_256(normalise(code, strip, canonicalise,
+                                      min_const_size)).hexdigest()
@@ -47,6 +47,17 @@ bailout_seconds:
   A negative value means no cap on the running time.
   No cap by default.
 
+stack_bailout_seconds:
+  Stop a single stack analysis fixed-point computation once it has run for
+  this many seconds. The elapsed time is checked on every worklist iteration.
+  A negative value means that bailout_seconds is used instead.
+  Negative by default.
+
+clone_bailout_seconds:
+  Stop searching for ambiguous jump paths to clone in a single cloning step
+  once it has run for this many seconds.
+  A negative value means no cap on the running time. No cap by default.
+
 remove_unreachable:
   Upon completion of the analysis, if there are blocks unreachable from the
   contract root, remove them. False by default.
@@ -119,7 +130,8 @@ set_valued_ops:
 
 analytics:
   If True, dataflow analysis will return a dict of information about
-  the contract, otherwise return an empty dict.
+  the contract, otherwise return an empty dict. This includes the time,
+  invocation and iteration counts of each analysis phase.
   Disabling this might yield a slight speed improvement. False by default.
 
 extract_functions:
@@ -132,6 +144,11 @@ strict:
   If true, then unrecognised opcodes and invalid disassembly
   will not be skipped, but will result in an error.
 
+strip_metadata:
+  If true, remove the compiler metadata trailer (a CBOR-encoded swarm or IPFS
+  hash) from the end of bytecode before decompiling it, so that it is not
+  decompiled as unreachable junk code. False by default.
+
 Note: If we have already reached complete information about our stack CFG
 structure and stack states, we can use die_on_empty_pop and reinit_stacks
 to discover places where empty stack exceptions will be thrown.
@@ -140,6 +157,8 @@ to discover places where empty stack exceptions will be thrown.
 # The settings - these are None until initialised by import_config
 max_iterations = None
 bailout_seconds = None
+stack_bailout_seconds = None
+clone_bailout_seconds = None
 remove_unreachable = None
 merge_unreachable = None
 die_on_empty_pop = None
@@ -161,6 +180,7 @@ analytics = None
 extract_functions = None
 mark_functions = None
 strict = None
+strip_metadata = None
 
 # A reference to this module for retrieving its members; import sys like this so that it does not appear in _names_.
 _module_ = __import__("sys").modules[__name__]
@@ -171,6 +191,7 @@ _names_ = [s for s in dir(_module_) if not (s.startswith("_"))]
 # Set up the types of the various settings, so they can be converted
 # correctly when being read from config.
 _types_ = {n: ("int" if n in ["max_iterations", "bailout_seconds",
+                              "stack_bailout_seconds", "clone_bailout_seconds",
                               "clamp_stack_minimum", "widen_threshold"]
 else "bool") for n in _names_}
 
@@ -179,6 +200,7 @@ _stack_ = []
 
 # Imports and definitions appearing below the definition of _names_
 # do not appear in that list, by design. Don't move them up.
+import hashlib
 import logging
 import sys
 from os.path import dirname, normpath, join
@@ -211,6 +233,16 @@ def restore():
     _get_dict_().update(_stack_.pop())
 
 
+def fingerprint() -> str:
+    """
+    Return a digest of the current setting configuration, identifying the
+    analysis results it produces. Equal configurations have equal fingerprints.
+    """
+    sd = _get_dict_()
+    desc = ",".join("{}={}".format(n, sd[n]) for n in sorted(_names_))
+    return hashlib.sha1(desc.encode()).hexdigest()
+
+
 def set_from_string(setting_name: str, value: str):
     """
     Assign to the named setting the given value, first converting that value
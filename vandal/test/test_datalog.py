@@ -0,0 +1,162 @@
+# BSD 3-Clause License
+#
+# Copyright (c) 2016, 2017, The University of Sydney. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import re
+import time
+
+import pytest
+
+import src.datalog as datalog
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+DEMO_SPEC = os.path.join(dir_path, "..", "datalog", "demo_analyses.dl")
+
+
+class TestDatalog:
+
+    def test_read_program(self):
+        program = datalog.read_program(DEMO_SPEC)
+        assert "#include" not in program
+        assert "//" not in program
+        assert program.count(".decl edge(") == 1
+        assert ".decl reentrantCall(" in program
+
+    def test_contract_relations(self):
+        scoped = datalog.contract_relations(datalog.read_program(DEMO_SPEC))
+        assert {"edge", "op", "reaches", "uncheckedCall"} <= scoped
+        assert "binArith" not in scoped
+
+    def test_batch_program(self):
+        program = datalog.batch_program(DEMO_SPEC)
+        assert ".decl edge(c:Contract, h:Statement, t:Statement)" in program
+        assert ".decl binArith(opcode:Opcode)" in program
+        assert 'binArith("ADD").' in program
+        assert '!reaches(CONTRACT, "0x0", stmt)' in program
+        assert ".input edge\n" in program
+
+        # Every atom of a contract relation is tagged.
+        for name in datalog.contract_relations(program):
+            for args in re.findall(r"(?<![\w.]){}\s*\(([^)]*)\)".format(name), program):
+                assert args.startswith("CONTRACT,") or args.startswith("c:Contract,")
+
+    def test_name_clash(self, tmpdir):
+        spec = tmpdir.join("spec.dl")
+        spec.write(".decl r(x:Statement)\nr(CONTRACT) :- r(CONTRACT).\n")
+        with pytest.raises(ValueError):
+            datalog.batch_program(str(spec))
+
+
+PATH_PROGRAM = """
+.type Node
+.decl edge(a:Node, b:Node)
+.decl weight(a:Node, w:number)
+.input edge
+.input weight
+.decl path(a:Node, b:Node)
+.decl unreachable(a:Node, b:Node)
+.decl heavy(a:Node)
+.decl node(a:Node)
+.output path
+.output unreachable
+.output heavy
+node(a) :- edge(a, _) ; edge(_, a).
+path(a, b) :- edge(a, b).
+path(a, c) :- path(a, b), edge(b, c).
+unreachable(a, b) :- node(a), node(b), a != b, !path(a, b).
+heavy(a) :- weight(a, w), w > 5.
+"""
+
+
+class TestEvaluator:
+
+    def test_evaluate(self):
+        program = datalog.Program(PATH_PROGRAM)
+        out = program.evaluate({"edge": {("a", "b"), ("b", "c"), ("c", "b")},
+                                "weight": {("a", 3), ("b", 10)}})
+        assert out["path"] == {("a", "b"), ("a", "c"), ("b", "c"),
+                               ("c", "b"), ("b", "b"), ("c", "c")}
+        assert out["unreachable"] == {("b", "a"), ("c", "a")}
+        assert out["heavy"] == {("b",)}
+
+    def test_load_facts(self):
+        program = datalog.Program(PATH_PROGRAM)
+        inputs = program.load_facts({"edge.facts": "a\tb\n",
+                                     "weight.facts": "a\t7\n"})
+        assert inputs == {"edge": {("a", "b")}, "weight": {("a", 7)}}
+
+    def test_unstratifiable(self):
+        with pytest.raises(ValueError):
+            datalog.Program(".decl p(x:T)\n.decl q(x:T)\n"
+                            "p(x) :- q(x), !p(x).\nq(\"a\").\n")
+
+    def test_timeout(self):
+        program = datalog.Program(PATH_PROGRAM)
+        edges = {(str(i), str(i + 1)) for i in range(200)}
+        with pytest.raises(datalog.EvaluationTimeout):
+            program.evaluate({"edge": edges, "weight": set()}, bailout_seconds=0)
+
+    def test_timeout_within_join(self):
+        # A single non-recursive join is cut short rather than run to completion.
+        program = datalog.Program(".decl node(a:Node)\n.input node\n"
+                                  ".decl pair(a:Node, b:Node)\n.output pair\n"
+                                  "pair(a, b) :- node(a), node(b).\n")
+        start = time.perf_counter()
+        with pytest.raises(datalog.EvaluationTimeout):
+            program.evaluate({"node": {(str(i),) for i in range(2000)}},
+                             bailout_seconds=0.05)
+        assert time.perf_counter() - start < 1
+
+    def test_batched(self):
+        # A batched program run over many contracts at once gives the same
+        # results as the original run over each contract separately.
+        program = datalog.Program.from_file(DEMO_SPEC)
+        batched = datalog.Program(datalog.batch_program(DEMO_SPEC))
+        contracts = [{"edge": {("0x0", "0x1")},
+                      "op": {("0x0", "ORIGIN"), ("0x1", "SSTORE")},
+                      "def": {("v0", "0x0")},
+                      "use": {("v0", "0x1", 1)}},
+                     {"edge": {("0x0", "0x1")},
+                      "op": {("0x0", "CALLER"), ("0x1", "SELFDESTRUCT")}}]
+
+        merged = {}
+        for cid, inputs in enumerate(contracts):
+            for rel, tuples in inputs.items():
+                merged.setdefault(rel, set()).update((str(cid),) + tup
+                                                     for tup in tuples)
+        batch_out = batched.evaluate(merged)
+
+        for cid, inputs in enumerate(contracts):
+            out = program.evaluate(inputs)
+            for rel, tuples in out.items():
+                assert tuples == {tup[1:] for tup in batch_out[rel]
+                                  if tup[0] == str(cid)}
+        assert batch_out["originUsed"] == {("0", "0x1")}
+        assert batch_out["destroyable"] == {("1", "0x1")}
@@ -0,0 +1,78 @@
+# BSD 3-Clause License
+#
+# Copyright (c) 2016, 2017, The University of Sydney. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+
+import pytest
+
+import src.cache as cache
+import src.normalise as normalise
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+SWARM_TRAILER = bytes.fromhex("a165627a7a72305820" + "11" * 32 + "0029")
+IPFS_TRAILER = bytes.fromhex("a2646970667358221220" + "22" * 32 +
+                             "64736f6c63430006060033")
+
+
+@pytest.fixture
+def bytecode():
+    """
+    Returns: the raw bytecode of a contract compiled with a metadata trailer
+    """
+    with open(dir_path + '/data/hex/basic_example.hex', 'r') as f:
+        return cache.bytecode_bytes(f)
+
+
+class TestNormalise:
+
+    def test_metadata_length(self, bytecode):
+        assert normalise.metadata_length(bytecode) == len(SWARM_TRAILER)
+        assert normalise.metadata_length(b"\x60\x00" + IPFS_TRAILER) == len(IPFS_TRAILER)
+        assert normalise.metadata_length(b"\x60\x00\x00\x29") == 0
+        assert normalise.metadata_length(b"") == 0
+
+    def test_strip_metadata(self, bytecode):
+        stripped = normalise.strip_metadata(bytecode)
+        assert stripped == bytecode[:-len(SWARM_TRAILER)]
+        assert normalise.strip_metadata(stripped) == stripped
+
+    def test_fingerprint(self, bytecode):
+        code = normalise.strip_metadata(bytecode)
+        assert normalise.fingerprint(code + SWARM_TRAILER) == \
+            normalise.fingerprint(code + IPFS_TRAILER)
+
+        # PUSH20 constants are canonicalised, but PUSH2 constants are not.
+        a = b"\x73" + b"\x01" * 20 + b"\x61\x00\x10"
+        b = b"\x73" + b"\x02" * 20 + b"\x61\x00\x10"
+        c = b"\x73" + b"\x01" * 20 + b"\x61\x00\x20"
+        assert normalise.fingerprint(a) == normalise.fingerprint(b)
+        assert normalise.fingerprint(a, canonicalise=False) != \
+            normalise.fingerprint(b, canonicalise=False)
+        assert normalise.fingerprint(a) != normalise.fingerprint(c)
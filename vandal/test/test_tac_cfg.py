@@ -0,0 +1,131 @@
+# BSD 3-Clause License
+#
+# Copyright (c) 2016, 2017, The University of Sydney. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import os
+
+import pytest
+
+import src.dataflow as dataflow
+import src.memtypes as mem
+import src.settings as settings
+import src.tac_cfg as tac_cfg
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+
+@pytest.fixture(params=['basic', 'dao_hack', 'slides'])
+def analysed(request):
+    """
+    Returns: an analysed TACGraph of a file's bytecode
+    """
+    settings.import_config()
+    with open(dir_path + '/data/hex/' + request.param + '.hex', 'r') as f:
+        cfg = tac_cfg.TACGraph.from_bytecode(f)
+    dataflow.analyse_graph(cfg)
+    return cfg
+
+
+class TestDominators:
+
+    def test_immediate_dominators(self):
+        # 0 -> 1 -> 2 -> 4, 0 -> 3 -> 2, 4 -> 1; 5 is unreachable.
+        succs = [[1, 3], [2], [4], [2], [1], [0]]
+        assert tac_cfg.immediate_dominators(succs, 0) == [0, 0, 0, 0, 2, -1]
+        assert tac_cfg.immediate_dominators(succs, 1) == [-1, 1, 1, -1, 2, -1]
+
+    def test_dominators(self, analysed):
+        for post in (False, True):
+            for op_edges in (False, True):
+                idoms = analysed.immediate_dominators(post, op_edges)
+                doms = analysed.dominators(post, op_edges)
+                for node, idom in idoms.items():
+                    assert node in doms[node]
+                    assert idom in doms[node]
+                    if idom != node and idom in doms:
+                        assert doms[node] == doms[idom] | {node}
+
+    def test_root(self, analysed):
+        root = analysed.root.ident()
+        assert analysed.immediate_dominators()[root] == root
+        assert analysed.dominators()[root] == {root}
+        end = tac_cfg.POSTDOM_END_NODE
+        assert analysed.immediate_dominators(post=True, op_edges=True)[end] == end
+
+    def test_changes_recomputed(self, analysed):
+        root = analysed.root.ident()
+        before = analysed.immediate_dominators()
+        assert analysed.immediate_dominators() == before
+        assert analysed.root.succs
+        for s in list(analysed.root.succs):
+            analysed.remove_edge(analysed.root, s)
+        assert analysed.immediate_dominators() == {root: root}
+
+
+class TestVariables:
+
+    def test_entry_vars_from_def_sites(self, analysed):
+        for block in analysed.blocks:
+            for var in block.entry_stack.value:
+                if var.def_sites.is_const:
+                    site = next(iter(var.def_sites))
+                    assert site.get_instruction().lhs is var
+
+    def test_stack_names_unique(self, analysed):
+        for block in analysed.blocks:
+            names = {}
+            for var in block.entry_stack.value:
+                assert names.setdefault(var.name, var) is var
+
+    def test_substitute(self, analysed):
+        def uses(block, var):
+            return sum(v is var for v in block.exit_stack.value) + \
+                   sum(a.value is var for op in block.tac_ops for a in op.args)
+
+        block = max(analysed.blocks, key=lambda b: len(b.tac_ops))
+        old_var = next(a.value for op in block.tac_ops for a in op.args)
+        new_var = mem.Variable(name="New")
+        count = uses(block, old_var)
+
+        tac_cfg.VariableTable(block).substitute(old_var, new_var)
+        assert uses(block, old_var) == 0
+        assert uses(block, new_var) == count > 0
+
+
+class TestStacks:
+
+    def test_entry_stack_rebuilt_on_change(self, analysed):
+        block = next(b for b in analysed.blocks if b.preds)
+        block.build_entry_stack()
+        stack = block.entry_stack
+        assert not block.build_entry_stack()
+        assert block.entry_stack is stack
+
+        pred = block.preds[0]
+        pred.exit_stack = pred.exit_stack.copy()
+        block.build_entry_stack()
+        assert block.entry_stack is not stack
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2016, 2017, The University of Sydney. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""measure_memory.py: measure the memory taken by the objects of decompiled graphs"""
+
+import argparse
+import collections
+import gc
+import sys
+import tracemalloc
+from os.path import abspath, dirname, join
+
+src_path = join(dirname(abspath(__file__)), "../../")
+sys.path.insert(0, src_path)
+
+import src.dataflow as dataflow
+import src.evm_cfg as evm_cfg
+import src.memtypes as memtypes
+import src.settings as settings
+import src.tac_cfg as tac_cfg
+
+CLASSES = [tac_cfg.TACOp, tac_cfg.TACAssignOp, tac_cfg.TACArg, tac_cfg.TACLocRef,
+           evm_cfg.EVMOp, memtypes.Variable, memtypes.MetaVariable]
+"""The classes whose instances are counted and measured."""
+
+parser = argparse.ArgumentParser(
+    description="Decompile each contract and report the memory taken by the "
+                "graph, per TAC operation, and the size of each instance of "
+                "the classes making up most of it.")
+
+parser.add_argument("contracts",
+                    nargs="+",
+                    metavar="FILE",
+                    help="the bytecode files to decompile.")
+
+
+def instance_size(obj: object) -> int:
+    """Return the size of an object, including its __dict__ if it has one."""
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def measure(filename: str) -> None:
+    """Decompile the given contract and print its memory measurements."""
+    settings.import_config()
+    gc.collect()
+    tracemalloc.start()
+    with open(filename) as f:
+        cfg = tac_cfg.TACGraph.from_bytecode(f)
+    dataflow.analyse_graph(cfg)
+    gc.collect()
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    num_ops = sum(len(b.tac_ops) for b in cfg.blocks)
+    print("{}: {} blocks, {} TAC ops, {} bytes in total, {:.0f} bytes per op"
+          .format(filename, len(cfg.blocks), num_ops, traced, traced / max(num_ops, 1)))
+
+    counts = collections.Counter()
+    sizes = collections.Counter()
+    for obj in gc.get_objects():
+        if type(obj) in CLASSES:
+            counts[type(obj)] += 1
+            sizes[type(obj)] += instance_size(obj)
+    for cls in CLASSES:
+        if counts[cls]:
+            print("  {:<14} {:>8} instances {:>6.0f} bytes each"
+                  .format(cls.__name__, counts[cls], sizes[cls] / counts[cls]))
+
+
+def main():
+    args = parser.parse_args()
+    for filename in args.contracts:
+        measure(filename)
+
+
+if __name__ == "__main__":
+    main()